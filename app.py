@@ -2,9 +2,10 @@ import streamlit as st
 import ollama
 import os
 import tempfile
-from datetime import datetime
+from datetime import datetime, timedelta
 import pandas as pd
 import json
+import math
 import base64
 from typing import List, Dict, Optional
 import time
@@ -15,6 +16,22 @@ from streamlit_autorefresh import st_autorefresh
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import sqlite3
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from storage import ConversationStore, TIMESTAMP_FORMAT, bucket_key
+from history import ChatHistory
+from telemetry import chat_with_metrics
+from profiler import RerunProfiler
+from benchmark import BenchmarkRunner, SUITE_VERSION
+import metrics
+import memory
+import tracing
+import rag
+import packing
+import mapreduce
+import preview
+from exporter import EXPORT_FORMATS, CHUNK_SIZE, export_history, iter_chunks, parquet_available
 
 # Import custom modules
 try:
@@ -139,24 +156,273 @@ typingIndicator.innerHTML = '<div class="typing"><span></span><span></span><span
 </script>
 """, unsafe_allow_html=True)
 
-# ==================== SESSION STATE ====================
-def cleanup_chat_history():
-    """Convert all datetime objects to strings in chat history"""
-    if st.session_state.chat_history:
-        cleaned = []
-        for item in st.session_state.chat_history:
-            if isinstance(item, dict) and 'timestamp' in item:
-                if isinstance(item['timestamp'], datetime):
-                    item_copy = item.copy()
-                    item_copy['timestamp'] = item['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                    cleaned.append(item_copy)
-                else:
-                    cleaned.append(item)
-            else:
-                cleaned.append(item)
-        st.session_state.chat_history = cleaned
+# ==================== PERSISTENCE ====================
+# Settings → General "Save interval" → number of messages buffered before a flush
+SAVE_INTERVALS = {
+    "Every message": 1,
+    "Every 5 messages": 5,
+    "Every 10 messages": 10,
+    "Manual only": None
+}
+MESSAGE_PAGE_SIZE = 50
+PREVIEW_BYTES = 64 * 1024  # head of JSON / CSV uploads read for the preview
+HISTORY_PAGE_SIZE = 200
+HISTORY_DISPLAY_ROWS = 100
+
+@st.cache_resource
+def get_store():
+    """Open the conversation store shared by all sessions (None if unavailable)"""
+    try:
+        return ConversationStore()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Conversation storage disabled: {e}")
+        return None
+
+# ==================== OLLAMA CLIENT ====================
+DEFAULT_OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_OLLAMA_TIMEOUT = 30
+DEFAULT_CONTEXT_LENGTH = 4096
+VISION_MODEL = os.environ.get("OLLAMA_VISION_MODEL", "llava:7b")
+
+@st.cache_resource
+def ollama_client(host: str, timeout: int):
+    """One client (connection pool) per host, shared by all sessions"""
+    return ollama.Client(host=host, timeout=timeout)
+
+def get_ollama_client():
+    """Client for the host configured in Settings → API (e.g. the fake server)"""
+    return ollama_client(
+        st.session_state.get("ollama_host") or DEFAULT_OLLAMA_HOST,
+        st.session_state.get("ollama_timeout", DEFAULT_OLLAMA_TIMEOUT)
+    )
+
+# ==================== DOCUMENT INDEX (RAG) ====================
+@st.cache_resource
+def get_document_index():
+    """Open the document index shared by all sessions (None if unavailable)"""
+    if not rag.rag_available():
+        return None
+    try:
+        return rag.DocumentIndex()
+    except Exception as e:
+        print(f"Document search disabled: {e}")
+        return None
+
+def chat_options() -> Dict:
+    """Generation options from the sidebar settings"""
+    return {
+        "temperature": st.session_state.temperature,
+        "num_ctx": st.session_state.get("context_length", DEFAULT_CONTEXT_LENGTH)
+    }
+
+def add_document_context(prompt: str, messages_for_ollama: List[Dict]) -> Dict:
+    """Prepend packed document context when RAG is on.
+
+    Returns the fields stored on the answer: cited `sources` and the
+    `retrieval_tokens` the context added to the prompt (empty when none).
+    """
+    index = get_document_index() if st.session_state.get("rag_enabled") else None
+    if index is None:
+        return {}
+    try:
+        result = index.retrieve(
+            st.session_state.current_workspace,
+            prompt,
+            k=st.session_state.get("rag_top_k", rag.TOP_K),
+            budget=st.session_state.get("rag_budget", rag.RETRIEVAL_BUDGET),
+            mode=st.session_state.get("rag_mode", "hybrid"),
+            rerank=st.session_state.get("rag_rerank", False)
+        )
+    except Exception as e:
+        st.warning(f"Document search failed: {e}")
+        return {}
+    if result["timed_out"]:
+        st.caption(f"📚 Over the {result['elapsed']:.1f}s search budget, skipped: {', '.join(result['skipped'])}")
+    
+    # Whatever num_ctx leaves after the conversation window and the answer
+    budget = packing.context_budget(chat_options()["num_ctx"], packing.message_tokens(messages_for_ollama))
+    with tracing.span("rag.pack", chunks=len(result["chunks"]), budget=budget) as span:
+        packed = packing.pack_context(result["chunks"], budget)
+        span.set(tokens=packed["tokens"], passages=len(packed["passages"]))
+    st.session_state.last_retrieval = {
+        "timings": result["timings"],
+        "skipped": result["skipped"],
+        "budget": budget,
+        **{key: packed[key] for key in ("tokens", "merged", "duplicates", "dropped", "truncated")}
+    }
+    if not packed["passages"]:
+        if result["chunks"]:
+            st.caption(f"📚 No room for document context ({budget} tokens left of the context length)")
+        return {}
+    metrics.RETRIEVAL_TOKENS.observe(packed["tokens"])
+    messages_for_ollama.insert(0, {"role": "system", "content": packed["content"]})
+    return {
+        "sources": sorted({passage["source"] for passage in packed["passages"]}),
+        "retrieval_tokens": packed["tokens"]
+    }
+
+def retrieval_caption(retrieval: Dict) -> str:
+    return f"📚 Sources: {', '.join(retrieval['sources'])} • {retrieval['retrieval_tokens']:,} context tokens"
+
+def persistence_enabled() -> bool:
+    """Whether chat data should be written to the store"""
+    return get_store() is not None and st.session_state.get("store_history", True)
+
+def current_save_interval() -> Optional[int]:
+    """Messages to buffer before flushing, None for manual saves only"""
+    if not st.session_state.get("auto_save", True):
+        return None
+    return SAVE_INTERVALS.get(st.session_state.get("save_interval", "Every message"), 1)
+
+def load_workspace(workspace: str):
+    """Load the most recent page of a workspace from the store"""
+    st.session_state.current_workspace = workspace
+    st.session_state.conversation_id = None
+    st.session_state.persisted_messages = 0
+    
+    store = get_store()
+    if store is None:
+        return
+    
+    store.create_workspace(workspace)
+    conversation_id = store.latest_conversation(workspace)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = store.recent_messages(conversation_id, MESSAGE_PAGE_SIZE) if conversation_id else []
+    st.session_state.persisted_messages = len(st.session_state.messages)
+    # Aggregates cover the whole workspace, rows only the most recent page
+    st.session_state.chat_history = ChatHistory(
+        store.recent_history(workspace, HISTORY_PAGE_SIZE),
+        stats=store.history_stats(workspace)
+    )
+    st.session_state.favorites = store.favorites(workspace)
+
+def sync_messages():
+    """Queue messages added since the last sync and flush per the save interval"""
+    if not persistence_enabled():
+        return
+    store = get_store()
+    
+    messages = st.session_state.messages
+    persisted = st.session_state.persisted_messages
+    if len(messages) < persisted:
+        # Chat was cleared, continue in a fresh conversation
+        st.session_state.conversation_id = None
+        persisted = 0
+    
+    new_messages = messages[persisted:]
+    if new_messages:
+        if st.session_state.conversation_id is None:
+            st.session_state.conversation_id = store.start_conversation(st.session_state.current_workspace)
+        for msg in new_messages:
+            store.add_message(
+                st.session_state.conversation_id,
+                msg["role"],
+                msg["content"],
+                msg.get("timestamp")
+            )
+    st.session_state.persisted_messages = len(messages)
+    
+    store.flush_if_due(current_save_interval())
+
+def record_chat(prompt: str, ai_response: str, call_metrics: Dict = None, plugin: str = "chat", model: str = None):
+    """Add a chat turn with its Ollama telemetry to the history and queue it for storage"""
+    record = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model or st.session_state.model,
+        "user": prompt,
+        "assistant": ai_response,
+        "response_length": len(ai_response)
+    }
+    record.update(call_metrics or {})
+    st.session_state.chat_history.append(record)
+    
+    if persistence_enabled():
+        store = get_store()
+        store.add_history(
+            st.session_state.current_workspace,
+            st.session_state.conversation_id,
+            record
+        )
+        store.add_usage(
+            st.session_state.current_workspace,
+            record["model"],
+            plugin,
+            call_metrics,
+            timestamp=record["timestamp"]
+        )
+
+def flush_store():
+    """Write all buffered chat data now"""
+    sync_messages()
+    store = get_store()
+    if store is not None:
+        store.flush()
+
+# Usage chart range → (rollup granularity, span)
+USAGE_RANGES = {
+    "Last hour": ("minute", timedelta(hours=1)),
+    "Last 24 hours": ("hour", timedelta(days=1)),
+    "Last 30 days": ("day", timedelta(days=30)),
+    "Last year": ("day", timedelta(days=365))
+}
+BUCKET_STEPS = {
+    "minute": pd.Timedelta(minutes=1),
+    "hour": pd.Timedelta(hours=1),
+    "day": pd.Timedelta(days=1)
+}
+
+# Cost analysis window → (rollup granularity, span)
+COST_WINDOWS = {
+    "Last 24 hours": ("hour", timedelta(days=1)),
+    "Last 7 days": ("day", timedelta(days=7)),
+    "Last 30 days": ("day", timedelta(days=30)),
+    "Last 90 days": ("day", timedelta(days=90))
+}
 
-# Panggil fungsi cleanup di init_session_state:
+@st.cache_resource(max_entries=32)
+def usage_figures(range_name: str, workspace: Optional[str], start_bucket: str, version: int):
+    """Usage line chart and plugin pie built from rollups.
+    
+    `start_bucket` and `version` are only cache keys: figures are rebuilt when the
+    window moves to a new bucket or the store writes new rollups.
+    """
+    granularity, _ = USAGE_RANGES[range_name]
+    store = get_store()
+    
+    by_model = pd.DataFrame(store.usage_rollups(granularity, start_bucket, workspace, group_by="model"))
+    by_plugin = pd.DataFrame(store.usage_rollups(granularity, start_bucket, workspace, group_by="plugin"))
+    if by_model.empty:
+        return None, None
+    
+    # Fill empty buckets with zero so gaps do not read as steady usage
+    buckets = pd.date_range(
+        pd.to_datetime(start_bucket),
+        pd.to_datetime(bucket_key(datetime.now().strftime(TIMESTAMP_FORMAT), granularity)),
+        freq=BUCKET_STEPS[granularity]
+    )
+    by_model["bucket"] = pd.to_datetime(by_model["bucket"])
+    series = (
+        by_model.pivot_table(index="bucket", columns="key", values="events", aggfunc="sum")
+        .reindex(buckets, fill_value=0)
+        .fillna(0)
+    )
+    usage_fig = px.line(
+        series,
+        title=f"Chats per {granularity}",
+        labels={"index": "Time", "value": "Chats", "key": "Model"}
+    )
+    
+    plugin_totals = by_plugin.groupby("key", as_index=False)["events"].sum()
+    plugin_fig = px.pie(
+        plugin_totals,
+        values="events",
+        names="key",
+        title="Plugin Usage Distribution",
+        hole=0.3
+    )
+    return usage_fig, plugin_fig
+
+# ==================== SESSION STATE ====================
 def init_session_state():
     """Initialize all session state variables"""
     defaults = {
@@ -174,22 +440,72 @@ def init_session_state():
         "tts_enabled": False,
         "streaming_speed": "medium",
         "selected_plugins": [],
-        "chat_history": [],
+        "chat_history": ChatHistory(),
         "favorites": [],
         "workspaces": {"default": []},
         "current_workspace": "default",
-        "notifications": []
+        "notifications": [],
+        "conversation_id": None,
+        "persisted_messages": 0,
+        "profiler": RerunProfiler(),
+        "ollama_host": DEFAULT_OLLAMA_HOST,
+        "ollama_timeout": DEFAULT_OLLAMA_TIMEOUT
     }
     
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
     
-    # Cleanup existing data
-    cleanup_chat_history()
+    # Restore the active workspace once per session
+    if "store_loaded" not in st.session_state:
+        st.session_state.store_loaded = True
+        store = get_store()
+        if store is not None:
+            for name in store.list_workspaces():
+                st.session_state.workspaces.setdefault(name, [])
+            load_workspace(st.session_state.current_workspace)
 
 init_session_state()
 
+# Process-wide /metrics listener (METRICS_PORT, 0 disables it)
+metrics.start_metrics_server()
+_ctx = get_script_run_ctx()
+browser_session_id = _ctx.session_id if _ctx is not None else "local"
+metrics.touch_session(browser_session_id)
+
+# Opt-in per-rerun timing (Settings → Advanced)
+profiler = st.session_state.profiler
+profiler.begin(
+    st.session_state.get("profiling_enabled", False),
+    st.session_state.get("profiling_cprofile", False)
+)
+profiler.mark("session state")
+
+# Trace of this rerun: rerun → action → external call spans
+if st.session_state.get("trace_root") is not None:
+    # Previous rerun was cut short by st.rerun() / st.stop()
+    tracing.finish_trace(st.session_state.trace_root, status="interrupted")
+st.session_state.trace_root = tracing.start_trace(
+    "rerun",
+    session=browser_session_id,
+    workspace=st.session_state.current_workspace
+)
+
+sync_messages()
+
+# Session memory caps (Settings → Advanced), evicted chats stay in the store when history storage is on
+def memory_caps() -> Dict[str, int]:
+    return {name: st.session_state.get(f"memory_cap_{name}", cap) for name, cap in memory.DEFAULT_CAPS.items()}
+
+memory.enforce_caps(st.session_state, memory_caps())
+memory.record_session(browser_session_id, st.session_state, st.session_state.current_workspace)
+
+def run_chat(messages: List[Dict], options: Dict = None, model: str = None):
+    """Chat with the selected (or given) model, returns (content, metrics)"""
+    with profiler.call("ollama.chat"):
+        return chat_with_metrics(model or st.session_state.model, messages, options=options,
+                                 client=get_ollama_client())
+
 def get_plugin_icon(plugin: str) -> str:
         """Get icon for plugin"""
         icons = {
@@ -212,14 +528,13 @@ def email_writer_ui():
     
     if st.button("Generate Email", key="email_generate"):
         prompt = f"Write a {tone.lower()} email to {recipient} about: {subject}. Key points: {key_points}"
-        try:
-            response = ollama.chat(
-                model=st.session_state.model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            st.text_area("Generated Email", response['message']['content'], height=200, key="email_output")
-        except Exception as e:
-            st.error(f"Failed to generate email: {str(e)}")
+        with tracing.span("action: plugin.email"):
+            try:
+                content, call_metrics = run_chat([{"role": "user", "content": prompt}])
+                record_chat(prompt, content, call_metrics, plugin="email")
+                st.text_area("Generated Email", content, height=200, key="email_output")
+            except Exception as e:
+                st.error(f"Failed to generate email: {str(e)}")
 
 def code_assistant_ui():
     """Code assistant plugin UI"""
@@ -230,14 +545,13 @@ def code_assistant_ui():
     
     if st.button("Get Help", key="code_help"):
         prompt = f"As a {language} expert, {task} this code:\n\n{code_input}"
-        try:
-            response = ollama.chat(
-                model=st.session_state.model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            st.code(response['message']['content'], language=language.lower())
-        except Exception as e:
-            st.error(f"Failed to analyze code: {str(e)}")
+        with tracing.span("action: plugin.code"):
+            try:
+                content, call_metrics = run_chat([{"role": "user", "content": prompt}])
+                record_chat(prompt, content, call_metrics, plugin="code")
+                st.code(content, language=language.lower())
+            except Exception as e:
+                st.error(f"Failed to analyze code: {str(e)}")
 
 def data_analyzer_ui():
     """Data analyzer plugin UI"""
@@ -247,14 +561,13 @@ def data_analyzer_ui():
     
     if st.button("Analyze", key="data_analyze"):
         prompt = f"Analyze this data ({analysis_type}): {data_input}"
-        try:
-            response = ollama.chat(
-                model=st.session_state.model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            st.write(response['message']['content'])
-        except Exception as e:
-            st.error(f"Failed to analyze data: {str(e)}")
+        with tracing.span("action: plugin.data"):
+            try:
+                content, call_metrics = run_chat([{"role": "user", "content": prompt}])
+                record_chat(prompt, content, call_metrics, plugin="data")
+                st.write(content)
+            except Exception as e:
+                st.error(f"Failed to analyze data: {str(e)}")
 
 def creative_writer_ui():
     """Creative writer plugin UI"""
@@ -265,14 +578,13 @@ def creative_writer_ui():
     
     if st.button("Create", key="creative_create"):
         prompt = f"Write a {genre.lower()} about '{theme}' with about {length} words"
-        try:
-            response = ollama.chat(
-                model=st.session_state.model,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            st.text_area("Result", response['message']['content'], height=200, key="creative_output")
-        except Exception as e:
-            st.error(f"Failed to generate content: {str(e)}")
+        with tracing.span("action: plugin.creative"):
+            try:
+                content, call_metrics = run_chat([{"role": "user", "content": prompt}])
+                record_chat(prompt, content, call_metrics, plugin="creative")
+                st.text_area("Result", content, height=200, key="creative_output")
+            except Exception as e:
+                st.error(f"Failed to generate content: {str(e)}")
 
 def send_message(prompt: str):
     """Send message to Ollama"""
@@ -282,73 +594,164 @@ def send_message(prompt: str):
     # Add user message
     st.session_state.messages.append({"role": "user", "content": prompt})
     
-    try:
-        # Prepare messages for Ollama
-        messages_for_ollama = []
-        for msg in st.session_state.messages[-10:]:
-            messages_for_ollama.append({"role": msg["role"], "content": msg["content"]})
+    with tracing.span("action: chat.send", chars=len(prompt)):
+        try:
+            # Prepare messages for Ollama
+            messages_for_ollama = []
+            for msg in st.session_state.messages[-10:]:
+                messages_for_ollama.append({"role": msg["role"], "content": msg["content"]})
+            retrieval = add_document_context(prompt, messages_for_ollama)
         
-        # Get response
-        start_time = time.time()
-        response = ollama.chat(
-            model=st.session_state.model,
-            messages=messages_for_ollama,
-            options={"temperature": st.session_state.temperature}
-        )
-        response_time = time.time() - start_time
+            # Get response
+            ai_response, call_metrics = run_chat(messages_for_ollama, options=chat_options())
         
-        ai_response = response['message']['content']
+            # Add assistant response
+            st.session_state.messages.append({"role": "assistant", "content": ai_response, **retrieval})
         
-        # Add assistant response
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": ai_response
-        })
-        
-        # Simpan ke chat_history dengan KOLOM YANG KONSISTEN
-        st.session_state.chat_history.append({
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "model": st.session_state.model,
-            "user": prompt,  # KOLOM: 'user' bukan 'user_prompt'
-            "assistant": ai_response,
-            "response_length": len(ai_response),
-            "response_time": round(response_time, 2)
-        })
+            # Simpan ke chat_history dengan KOLOM YANG KONSISTEN
+            record_chat(prompt, ai_response, call_metrics)
         
-        st.rerun()  # Refresh untuk menampilkan pesan baru
+            st.rerun()  # Refresh untuk menampilkan pesan baru
         
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": f"Sorry, I encountered an error: {str(e)}"
-        })
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+            st.session_state.messages.append({
+                "role": "assistant", 
+                "content": f"Sorry, I encountered an error: {str(e)}"
+            })
 
-def export_chat():
-    """Export chat history"""
-    if st.session_state.chat_history:
-        # Pastikan semua timestamp sudah string
-        cleaned_history = []
-        for item in st.session_state.chat_history:
-            if isinstance(item.get('timestamp'), datetime):
-                # Convert datetime to string
-                cleaned_item = item.copy()
-                cleaned_item['timestamp'] = item['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                cleaned_history.append(cleaned_item)
-            else:
-                cleaned_history.append(item)
-        
-        df = pd.DataFrame(cleaned_history)
-        csv = df.to_csv(index=False)
+def analyze_whole_file(uploaded_file, task: str, slots: int):
+    """Map-reduce the whole upload with concurrent requests and add the answer to the chat"""
+    options = chat_options()
+    model, client = st.session_state.model, get_ollama_client()
+
+    # Worker threads can't read session state, so the model and client are bound here
+    def chat(messages):
+        return chat_with_metrics(model, messages, options=options, client=client)
+
+    size = mapreduce.piece_chars(options["num_ctx"], task)
+    expected = max(1, math.ceil(uploaded_file.size / size))
+    progress_bar = st.progress(0.0, text=f"Reading {uploaded_file.name}...")
+
+    def show_progress(p):
+        if p["stage"] == "map":
+            total = max(p["total"], p["done"])
+            progress_bar.progress(min(p["done"] / total, 1.0), text=f"Map: {p['done']} of ~{total} parts")
+        elif p["stage"] == "reduce":
+            progress_bar.progress(p["done"] / p["total"], text=f"Reduce level {p['level']}: {p['done']} of {p['total']} groups")
+        else:
+            progress_bar.progress(1.0, text="Writing the final answer...")
+
+    uploaded_file.seek(0)
+    _, paragraphs = rag.open_document(uploaded_file.name, uploaded_file)
+    with tracing.span("action: file.analyze", slots=slots), profiler.call("ollama.mapreduce"):
+        result = mapreduce.MapReduce(chat, options["num_ctx"], slots, progress=show_progress).run(
+            mapreduce.split_document(paragraphs, size), task, uploaded_file.name, expected
+        )
+    progress_bar.empty()
+    st.session_state.last_analysis = dict(result, name=uploaded_file.name, slots=slots)
+
+    prompt = f"🔬 {task} ({uploaded_file.name}, whole file)"
+    st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.messages.append({"role": "assistant", "content": result["answer"]})
+    record_chat(prompt, result["answer"], {
+        "response_time": result["elapsed"],
+        "prompt_eval_count": result["prompt_tokens"],
+        "eval_count": result["completion_tokens"]
+    }, plugin="analyze")
+
+def show_analysis_controls(uploaded_file, default_task: str):
+    """Whole-file analysis form with the timings of the last run"""
+    with st.expander("🔬 Analyze whole file"):
+        st.caption("Splits the file into context-sized parts, analyzes them in parallel and merges the notes.")
+        task = st.text_input("Task", default_task, key="analyze_task")
+        slots = st.slider(
+            "Parallel requests", 1, 16, mapreduce.DEFAULT_SLOTS, key="analyze_slots",
+            help="Keep at or below the server's OLLAMA_NUM_PARALLEL"
+        )
+        if st.button("🔬 Analyze", disabled=not task.strip()):
+            try:
+                analyze_whole_file(uploaded_file, task.strip(), slots)
+                st.rerun()
+            except Exception as e:
+                st.error(f"Analysis failed: {e}")
+
+        last = st.session_state.get("last_analysis")
+        if last and last["name"] == uploaded_file.name:
+            st.caption(
+                f"{last['pieces']} parts • {last['levels']} reduce levels • {last['calls']} requests "
+                f"on {last['slots']} slots • {last['elapsed']:.1f}s"
+                + (f" • ⚠️ {last['errors']} failed" if last["errors"] else "")
+            )
+            st.dataframe(
+                pd.DataFrame([{"Stage": stage, "Seconds": round(seconds, 2)} for stage, seconds in last["timings"].items()]),
+                hide_index=True, use_container_width=True
+            )
+
+def history_chunks(workspace=None, start=None, end=None, model=None):
+    """Yield filtered chat history in chunks, from the store when available"""
+    store = get_store()
+    if store is not None and persistence_enabled():
+        flush_store()
+        yield from store.iter_history(workspace, start, end, model, chunk_size=CHUNK_SIZE)
+        return
+    
+    # Session-only history covers the current workspace
+    if workspace and workspace != st.session_state.current_workspace:
+        return
+    rows = (
+        dict(row, workspace=st.session_state.current_workspace)
+        for row in st.session_state.chat_history
+        if (not start or row["timestamp"] >= start)
+        and (not end or row["timestamp"] <= end)
+        and (not model or row["model"] == model)
+    )
+    yield from iter_chunks(rows, CHUNK_SIZE)
+
+def export_chat(key: str = "export"):
+    """Export chat history with filters, streamed in chunks to a temp file"""
+    store = get_store()
+    if store is None and not st.session_state.chat_history:
+        st.info("No chat history to export")
+        return
+    
+    formats = [f for f in EXPORT_FORMATS if f != "Parquet" or parquet_available()]
+    fmt = st.selectbox("Format", formats, key=f"{key}_format")
+    
+    workspaces = ["All"] + list(st.session_state.workspaces.keys())
+    workspace = st.selectbox("Workspace", workspaces, key=f"{key}_workspace")
+    
+    models = store.history_models() if store is not None else sorted(st.session_state.chat_history.stats.models)
+    model = st.selectbox("Model", ["All"] + models, key=f"{key}_model")
+    
+    date_range = st.date_input("Date range", value=(), key=f"{key}_dates")
+    start = end = None
+    if len(date_range) >= 1:
+        start = date_range[0].strftime("%Y-%m-%d 00:00:00")
+    if len(date_range) == 2:
+        end = date_range[1].strftime("%Y-%m-%d 23:59:59")
+    
+    if st.button("📦 Prepare Export", key=f"{key}_prepare"):
+        chunks = history_chunks(
+            workspace=None if workspace == "All" else workspace,
+            start=start,
+            end=end,
+            model=None if model == "All" else model
+        )
+        with st.spinner("Exporting..."):
+            export_file = export_history(chunks, fmt)
+            # download_button only takes bytes or plain file objects, not a SpooledTemporaryFile
+            with export_file:
+                data = export_file.read()
         
+        extension, mime = EXPORT_FORMATS[fmt]
         st.download_button(
             "📥 Download Chat History",
-            csv,
-            file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
+            data,
+            file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+            mime=mime,
+            key=f"{key}_download"
         )
-    else:
-        st.info("No chat history to export")
 
 def regenerate_message(message_index: int):
     """Simple message regeneration"""
@@ -362,19 +765,25 @@ def regenerate_message(message_index: int):
             user_message = st.session_state.messages[message_index-1]["content"]
             
             # Regenerate with same prompt
-            with st.spinner("Regenerating response..."):
-                response = ollama.chat(
-                    model=st.session_state.model,
-                    messages=[{"role": "user", "content": user_message}],
-                    options={"temperature": st.session_state.temperature}
-                )
+            with st.spinner("Regenerating response..."), tracing.span("action: chat.regenerate"):
+                content, call_metrics = run_chat([{"role": "user", "content": user_message}], options=chat_options())
+                record_chat(user_message, content, call_metrics)
                 
                 # Add new response
                 st.session_state.messages.insert(message_index, {
                     "role": "assistant",
-                    "content": response['message']['content']
+                    "content": content
                 })
                 
+                # The list length is unchanged, so sync_messages() would not see the new answer
+                if (persistence_enabled() and st.session_state.conversation_id is not None
+                        and message_index < st.session_state.persisted_messages):
+                    get_store().replace_message(
+                        st.session_state.conversation_id,
+                        st.session_state.persisted_messages - 1 - message_index,
+                        content
+                    )
+                
             st.rerun()
             
     except Exception as e:
@@ -441,17 +850,24 @@ def file_upload():
         st.success(f"✅ Uploaded: {uploaded_file.name}")
         
         # Tampilkan preview berdasarkan tipe file
-        if uploaded_file.type == "text/plain" or uploaded_file.name.endswith('.txt'):
-            content = uploaded_file.read().decode('utf-8')
-            st.text_area("File Content", content[:1000] + ("..." if len(content) > 1000 else ""), height=200)
+        extension = uploaded_file.name.rsplit(".", 1)[-1].lower()
+        if uploaded_file.type == "text/plain" or extension in ("txt", "pdf", "docx"):
+            # Extracted once per file; only the visible preview page is read
+            try:
+                excerpt = show_document_preview(uploaded_file)
+            except Exception as e:
+                st.warning(f"Could not read file content: {e}")
+                excerpt = None
             
             # Tambah ke chat
-            if st.button("📝 Send to Chat"):
+            if excerpt is not None and st.button("📝 Send to Chat"):
                 st.session_state.messages.append({
                     "role": "user",
-                    "content": f"📎 File: {uploaded_file.name}\n\nContent:\n{content[:500]}..."
+                    "content": f"📎 File: {uploaded_file.name}\n\nContent:\n{excerpt[:500]}..."
                 })
-                send_message(f"Analyze this file content: {content[:500]}")
+                send_message(f"Analyze this file content: {excerpt[:500]}")
+            if excerpt is not None:
+                show_analysis_controls(uploaded_file, "Summarize this document and list its key points")
         
         elif uploaded_file.type.startswith('image/'):
             from PIL import Image
@@ -468,8 +884,11 @@ def file_upload():
         
         elif uploaded_file.type in ["application/json", "text/csv"]:
             try:
-                content = uploaded_file.read().decode('utf-8')
-                st.text_area("File Content", content[:500] + ("..." if len(content) > 500 else ""), height=150)
+                # Only the head of the file is needed for the preview
+                head = uploaded_file.read(PREVIEW_BYTES)
+                content = head.decode('utf-8', errors='ignore')
+                more = uploaded_file.size > len(head) or len(content) > 500
+                st.text_area("File Content", content[:500] + ("..." if more else ""), height=150)
                 
                 if st.button("📊 Analyze Data"):
                     st.session_state.messages.append({
@@ -479,6 +898,7 @@ def file_upload():
                     send_message(f"Analyze this data from {uploaded_file.name}: {content[:300]}")
             except:
                 st.warning("Could not read file content")
+            show_analysis_controls(uploaded_file, "Describe this data: structure, notable values, trends and anomalies")
         
         else:
             st.info(f"File type: {uploaded_file.type}")
@@ -578,16 +998,26 @@ def show_templates():
 def restart_session():
     """Restart the session"""
     if st.button("Confirm Restart", type="primary"):
+        flush_store()
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         st.rerun()
 
+def wipe_stored_data():
+    """Delete everything kept on disk: conversations, metrics, documents and evicted items"""
+    if get_store() is not None:
+        get_store().clear_all()
+    if get_document_index() is not None:
+        get_document_index().clear_all()
+    memory.clear_spill()
+
 def clear_all_data():
     """Clear all user data"""
     st.warning("This will delete ALL your data!")
     confirm = st.checkbox("I understand this cannot be undone")
     
     if confirm and st.button("Delete All Data", type="primary"):
+        wipe_stored_data()
         keys_to_keep = ['_last_run', '_widget_state']
         for key in [k for k in st.session_state.keys() if k not in keys_to_keep]:
             del st.session_state[key]
@@ -740,7 +1170,7 @@ def test_api_connections():
     
     # Test Ollama connection
     try:
-        ollama.list()
+        get_ollama_client().list()
         results.append(("\u2705 Ollama", "Connected"))
     except:
         results.append(("\u274c Ollama", "Not connected"))
@@ -790,6 +1220,8 @@ def factory_reset():
     confirm2 = st.checkbox("I have backed up important data")
     
     if confirm and confirm2 and st.button("CONFIRM FACTORY RESET", type="primary"):
+        wipe_stored_data()
+        
         # Get list of keys to keep
         keys_to_keep = ['_last_run']
         
@@ -805,12 +1237,23 @@ def factory_reset():
 # Jika ada fungsi lain yang belum didefinisikan, tambahkan placeholder:
 
 def describe_image_with_ai(image):
-    """Use AI to describe image"""
+    """Describe an image with the vision model, recorded like a chat turn"""
+    # Convert image to base64
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    img_str = base64.b64encode(buffered.getvalue()).decode()
+    
+    prompt = "Describe this image in detail"
     try:
-        # Simulate AI description
-        return "This is an image. To get detailed description, install a vision model like LLaVA."
-    except:
-        return "Image description not available."
+        description, call_metrics = run_chat(
+            [{"role": "user", "content": prompt, "images": [img_str]}],
+            model=VISION_MODEL
+        )
+    except Exception as e:
+        print(f"Image description failed: {e}")
+        return f"Image description not available. Install a vision model: ollama pull {VISION_MODEL}"
+    record_chat(prompt, description, call_metrics, plugin="vision", model=VISION_MODEL)
+    return description
 
 def show_voting_interface():
     """Show voting interface for collaboration"""
@@ -821,29 +1264,36 @@ def private_message(user_id: str):
     st.info(f"Private messaging to {user_id} requires WebSocket setup")
 
 
-def show_document_preview(file_content, filename):
-    """Show document preview in modal"""
-    
-    with st.expander(f"📄 Preview: {filename}", expanded=True):
-        # Display based on content type
-        if len(file_content) > 10000:
-            st.warning(f"Document too large ({len(file_content)} chars). Showing first 10,000 characters.")
-            st.text_area("Content", file_content[:10000], height=300)
-        else:
-            st.text_area("Content", file_content, height=400)
+def show_document_preview(uploaded_file) -> str:
+    """Show a paged document preview in modal, returns the first page (the excerpt sent to chat)"""
+    
+    # Extracted once per file hash; each rerun reads only the page on screen
+    document = preview.open_preview(uploaded_file.name, uploaded_file)
+    stats = document.stats
+    
+    with st.expander(f"📄 Preview: {uploaded_file.name}", expanded=True):
+        page = 1
+        if document.page_count > 1:
+            page = st.number_input(
+                f"Page (of {document.page_count:,})", min_value=1, max_value=document.page_count, value=1,
+                key=f"preview_page_{document.key}"
+            )
+        st.text_area("Content", document.page(page - 1), height=400)
         
         # Statistics
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Characters", len(file_content))
+            st.metric("Characters", f"{stats['characters']:,}")
         with col2:
-            words = len(file_content.split())
-            st.metric("Words", words)
+            st.metric("Words", f"{stats['words']:,}")
         with col3:
-            lines = len(file_content.split('\n'))
-            st.metric("Lines", lines)
+            st.metric("Lines", f"{stats['lines']:,}")
+        with col4:
+            st.metric("Pages", stats["pages"] or "—")
+    return document.page(0)
 
 # ==================== SIDEBAR ====================
+profiler.mark("sidebar")
 with st.sidebar:
     st.markdown("<h1 style='text-align: center;'>🚀 Control Panel</h1>", unsafe_allow_html=True)
     
@@ -878,9 +1328,10 @@ with st.sidebar:
             context_length = st.select_slider(
                 "Context Length",
                 options=[2048, 4096, 8192, 16384],
-                value=4096,
-                help="Memory size"
+                value=DEFAULT_CONTEXT_LENGTH,
+                help="Memory size (num_ctx), shared by the conversation, documents and the answer"
             )
+            st.session_state.context_length = context_length
         
         streaming_speeds = {
             "🐢 Slow": "slow",
@@ -912,6 +1363,85 @@ with st.sidebar:
     with col6:
         dark_mode = st.toggle("🌙 Dark", True)
     
+    if st.session_state.rag_enabled:
+        with st.expander("📚 Knowledge Base"):
+            document_index = get_document_index()
+            if document_index is None:
+                st.warning("Install sentence-transformers (and chromadb or numpy) to enable document search")
+            else:
+                documents = st.file_uploader(
+                    "Add documents",
+                    type=rag.DOCUMENT_EXTENSIONS,
+                    accept_multiple_files=True,
+                    key="rag_uploads"
+                )
+                if documents and st.button("📥 Ingest", use_container_width=True):
+                    for document in documents:
+                        try:
+                            progress_bar = st.progress(0.0, text=f"Indexing {document.name}...")
+                            
+                            def show_progress(p, bar=progress_bar, name=document.name):
+                                where = f"page {p['page']}/{p['pages']}" if p["pages"] else f"{p['chunks']} chunks"
+                                bar.progress(
+                                    min(p["page"] / p["pages"], 1.0) if p["pages"] else 0.0,
+                                    text=f"{name}: {where} • {p['chunks_per_sec']:.0f} chunks/s"
+                                )
+                            
+                            # The upload is streamed page by page, never copied or decoded whole
+                            result = document_index.ingest(
+                                st.session_state.current_workspace, document.name, document,
+                                progress=show_progress
+                            )
+                            progress_bar.empty()
+                            if result["skipped"]:
+                                st.info(f"{document.name}: unchanged, {result['chunks']} chunks")
+                            else:
+                                cached = f", {result['cached']} from cache" if result["cached"] else ""
+                                st.success(
+                                    f"{document.name}: {result['added']} new{cached}, {result['unchanged']} unchanged, "
+                                    f"{result['removed']} removed chunks • {result['chunks_per_sec']:.0f} chunks/s "
+                                    f"({result['elapsed']:.1f}s)"
+                                )
+                        except Exception as e:
+                            st.error(f"{document.name}: {e}")
+                
+                indexed = document_index.documents(st.session_state.current_workspace)
+                if not indexed:
+                    st.caption("No documents in this workspace yet")
+                for source, chunks in sorted(indexed.items()):
+                    col_name, col_remove = st.columns([4, 1])
+                    col_name.caption(f"📄 {source} ({chunks} chunks)")
+                    if col_remove.button("🗑️", key=f"rag_remove_{source}"):
+                        document_index.remove(st.session_state.current_workspace, source)
+                        st.rerun()
+                
+                st.slider("Chunks per query", 1, 20, rag.TOP_K, key="rag_top_k",
+                          help="Candidates retrieved; as many as fit the context length are used")
+                st.slider("Search budget (s)", 0.2, 5.0, rag.RETRIEVAL_BUDGET, 0.1, key="rag_budget")
+                st.selectbox("Search mode", rag.SEARCH_MODES, format_func=str.title, key="rag_mode",
+                             help="Hybrid combines keyword (BM25) and vector search")
+                st.checkbox("Rerank with cross-encoder", key="rag_rerank",
+                            help="More accurate ordering, adds latency (model loads on first use)")
+                
+                last_retrieval = st.session_state.get("last_retrieval")
+                if last_retrieval:
+                    stages = [f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in last_retrieval["timings"].items()]
+                    stages += [f"{stage} skipped" for stage in last_retrieval["skipped"]]
+                    st.caption("Last search: " + " • ".join(stages))
+                    if "tokens" in last_retrieval:
+                        st.caption(
+                            f"Context: {last_retrieval['tokens']:,} of {last_retrieval['budget']:,} tokens • "
+                            f"{last_retrieval['merged']} merged, {last_retrieval['duplicates']} duplicates, "
+                            f"{last_retrieval['dropped']} over budget"
+                            + (", last one truncated" if last_retrieval["truncated"] else "")
+                        )
+                cache = document_index.cache_stats
+                if cache["lookups"]:
+                    st.caption(
+                        f"Search cache: {cache['hits']:,} of {cache['lookups']:,} hits "
+                        f"({cache['hits'] / cache['lookups']:.0%}), cleared when documents change"
+                    )
+    
     # Plugin Selection
     st.subheader("🧩 Plugins")
     plugins = {
@@ -936,8 +1466,9 @@ with st.sidebar:
     with workspace_col1:
         new_workspace = st.text_input("New workspace")
         if st.button("➕") and new_workspace:
+            flush_store()
             st.session_state.workspaces[new_workspace] = []
-            st.session_state.current_workspace = new_workspace
+            load_workspace(new_workspace)
             st.rerun()
     
     with workspace_col2:
@@ -947,7 +1478,10 @@ with st.sidebar:
             workspace_list,
             index=workspace_list.index(st.session_state.current_workspace)
         )
-        st.session_state.current_workspace = selected_workspace
+        if selected_workspace != st.session_state.current_workspace:
+            flush_store()
+            load_workspace(selected_workspace)
+            st.rerun()
     
     # Quick Actions
     st.subheader("⚡ Quick Actions")
@@ -961,7 +1495,7 @@ with st.sidebar:
             st.rerun()
         
         if st.button("💾 Export", use_container_width=True):
-            export_chat()
+            st.session_state.show_export = not st.session_state.get('show_export', False)
     
     with quick_col2:
         if st.button("📋 Templates", use_container_width=True):
@@ -970,13 +1504,18 @@ with st.sidebar:
         if st.button("🔄 Restart", use_container_width=True):
             restart_session()
     
+    if st.session_state.get('show_export', False):
+        with st.expander("💾 Export Chat History", expanded=True):
+            export_chat(key="sidebar_export")
+    
     # Status Panel
     st.subheader("📊 Status")
     
     status_col1, status_col2 = st.columns(2)
     with status_col1:
         try:
-            models = ollama.list()
+            with profiler.call("ollama.list"), tracing.span("ollama.list"):
+                models = get_ollama_client().list()
             st.metric("Models", len(models['models']))
         except:
             st.metric("Models", "❌")
@@ -986,7 +1525,8 @@ with st.sidebar:
     
     # Connection Status
     try:
-        ollama.list()
+        with profiler.call("ollama.list"), tracing.span("ollama.list"):
+            get_ollama_client().list()
         st.success("✅ Ollama Connected")
     except:
         st.error("❌ Ollama Not Connected")
@@ -997,9 +1537,16 @@ with st.sidebar:
 
 with st.sidebar:
     if st.button("\U0001f504 Reset All Data", type="secondary"):
-        st.session_state.chat_history = []
+        if get_store() is not None:
+            get_store().clear_workspace(st.session_state.current_workspace)
+        if get_document_index() is not None:
+            get_document_index().clear(st.session_state.current_workspace)
+        memory.clear_spill()
+        st.session_state.chat_history = ChatHistory()
         st.session_state.messages = []
         st.session_state.favorites = []
+        st.session_state.conversation_id = None
+        st.session_state.persisted_messages = 0
         st.success("All data reset!")
         time.sleep(1)
         st.rerun()
@@ -1016,6 +1563,7 @@ tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
 ])
 
 # ==================== TAB 1: CHAT INTERFACE ====================
+profiler.mark("tab: chat")
 with tab1:
     st.markdown("<h1 class='main-header'>💬 Gemma 3 4B Chat</h1>", unsafe_allow_html=True)
     
@@ -1030,6 +1578,33 @@ with tab1:
     with col4:
         st.metric("Plugins", len(selected_plugins))
     
+    # Search across all saved conversations
+    with st.expander("🔎 Search conversations", expanded=False):
+        store = get_store()
+        if store is None:
+            st.info("Search requires conversation storage")
+        else:
+            search_col1, search_col2 = st.columns([4, 1])
+            with search_col1:
+                search_query = st.text_input("Search", key="search_query", label_visibility="collapsed",
+                                             placeholder="Search messages and favorites...")
+            with search_col2:
+                search_all = st.toggle("All workspaces", True, key="search_all_workspaces")
+            
+            if search_query:
+                start_time = time.time()
+                results = store.search(
+                    search_query,
+                    workspace=None if search_all else st.session_state.current_workspace
+                )
+                elapsed_ms = (time.time() - start_time) * 1000
+                st.caption(f"{len(results)} result(s) in {elapsed_ms:.0f} ms")
+                
+                for result in results:
+                    icon = "⭐" if result["source"] == "favorite" else ("👤" if result["role"] == "user" else "🤖")
+                    st.markdown(f"{icon} {result['snippet']}")
+                    st.caption(f"🗂️ {result['workspace']} • {result['source']} • {result['role']}")
+    
     # Chat Container
     chat_container = st.container(height=500, border=True)
     
@@ -1059,6 +1634,8 @@ with tab1:
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
+                if message.get("sources"):
+                    st.caption(retrieval_caption(message))
                 
                 # Action buttons for each message
                 col1, col2, col3, col4 = st.columns(4)
@@ -1068,6 +1645,8 @@ with tab1:
                 with col2:
                     if st.button("⭐ Save", key=f"save_{i}"):
                         st.session_state.favorites.append(message)
+                        if persistence_enabled():
+                            get_store().add_favorite(st.session_state.current_workspace, message)
                         st.success("Saved to favorites!")
                 with col3:
                     if st.button("🔄 Regenerate", key=f"regenerate_{i}"):
@@ -1095,7 +1674,7 @@ with tab1:
                 
                 # Dapatkan response dari AI
                 with st.chat_message("assistant"):
-                    with st.spinner("Thinking..."):
+                    with st.spinner("Thinking..."), tracing.span("action: chat.send", chars=len(prompt)):
                         try:
                             # Siapkan messages untuk Ollama
                             messages_for_ollama = []
@@ -1104,33 +1683,23 @@ with tab1:
                                     "role": msg["role"], 
                                     "content": msg["content"]
                                 })
+                            retrieval = add_document_context(prompt, messages_for_ollama)
                             
                             # Dapatkan response
-                            response = ollama.chat(
-                                model=st.session_state.model,
-                                messages=messages_for_ollama,
-                                options={"temperature": st.session_state.temperature}
-                            )
+                            ai_response, call_metrics = run_chat(messages_for_ollama, options=chat_options())
                             
                             # Tampilkan response
-                            ai_response = response['message']['content']
                             st.write(ai_response)
+                            if call_metrics["ttft"] is not None and call_metrics["tokens_per_sec"]:
+                                st.caption(f"⏱️ TTFT {call_metrics['ttft']:.2f}s • {call_metrics['tokens_per_sec']:.1f} tok/s • {call_metrics['response_time']:.2f}s total")
+                            if retrieval:
+                                st.caption(retrieval_caption(retrieval))
                             
                             # Simpan ke messages
-                            st.session_state.messages.append({
-                                "role": "assistant", 
-                                "content": ai_response
-                            })
+                            st.session_state.messages.append({"role": "assistant", "content": ai_response, **retrieval})
                             
                             # Simpan ke chat_history dengan format yang benar
-                            st.session_state.chat_history.append({
-                                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                "model": st.session_state.model,
-                                "user": prompt,  # PERUBAHAN: dari 'user_prompt' ke 'user'
-                                "assistant": ai_response,
-                                "response_length": len(ai_response),
-                                "response_time": "N/A"  # Placeholder
-                            })
+                            record_chat(prompt, ai_response, call_metrics)
                             
                         except Exception as e:
                             error_msg = f"Error: {str(e)}"
@@ -1186,6 +1755,7 @@ with tab1:
                         creative_writer_ui()
 
 # ==================== TAB 2: VOICE INTERFACE ====================
+profiler.mark("tab: voice")
 with tab2:
     if not AUDIO_ENABLED:
         st.warning("Audio features require additional packages. Install with: `pip install streamlit-audio-recorder speechrecognition pydub`")
@@ -1232,8 +1802,9 @@ with tab2:
                 
                 # Transcribe
                 if st.button("Transcribe Uploaded Audio"):
-                    with st.spinner("Transcribing..."):
-                        text = st.session_state.audio_processor.transcribe_audio(tmp_path)
+                    with st.spinner("Transcribing..."), tracing.span("action: voice.transcribe"):
+                        with profiler.call("speech.transcribe"):
+                            text = st.session_state.audio_processor.transcribe_audio(tmp_path)
                         st.text_area("Transcription", text, height=100)
                         
                         # Auto-send to chat
@@ -1256,8 +1827,9 @@ with tab2:
                 tts_col1, tts_col2 = st.columns(2)
                 with tts_col1:
                     if st.button("🗣️ Speak", use_container_width=True) and tts_text:
-                        with st.spinner("Generating speech..."):
-                            audio_path = st.session_state.audio_processor.text_to_speech(tts_text)
+                        with st.spinner("Generating speech..."), tracing.span("action: voice.speak"):
+                            with profiler.call("gtts.synthesize"):
+                                audio_path = st.session_state.audio_processor.text_to_speech(tts_text)
                             if audio_path:
                                 st.audio(audio_path)
                 
@@ -1288,6 +1860,7 @@ with tab2:
                             st.audio(item['path'])
 
 # ==================== TAB 3: VISION INTERFACE ====================
+profiler.mark("tab: vision")
 with tab3:
     if not IMAGE_ENABLED:
         st.warning("""
@@ -1370,10 +1943,11 @@ with tab3:
                 if st.button("🔍 Analyze Image", type="primary", use_container_width=True):
                     results = {}
                     
-                    with st.spinner("Analyzing image..."):
+                    with st.spinner("Analyzing image..."), tracing.span("action: vision.analyze", analyses=len(analysis_options)):
                         # OCR if selected
                         if "🔤 Extract Text (OCR)" in analysis_options:
-                            text = st.session_state.image_analyzer.extract_text(image)
+                            with profiler.call("tesseract.ocr"):
+                                text = st.session_state.image_analyzer.extract_text(image)
                             results["OCR"] = text
                         
                         # Image description using LLM
@@ -1388,7 +1962,8 @@ with tab3:
                         
                         # Color analysis
                         if "🌈 Color Analysis" in analysis_options:
-                            colors = st.session_state.image_analyzer.analyze_colors(image)
+                            with profiler.call("colorthief.palette"):
+                                colors = st.session_state.image_analyzer.analyze_colors(image)
                             results["Colors"] = colors
                     
                     # Display results
@@ -1465,7 +2040,8 @@ with tab3:
                 for i, file in enumerate(batch_files):
                     img = Image.open(file)
                     # Process each image
-                    text = st.session_state.image_analyzer.extract_text(img)
+                    with profiler.call("tesseract.ocr"):
+                        text = st.session_state.image_analyzer.extract_text(img)
                     results.append({
                         "filename": file.name,
                         "text": text[:100] + "..." if len(text) > 100 else text
@@ -1486,6 +2062,7 @@ with tab3:
                 )
 
 # ==================== TAB 4: COLLABORATION INTERFACE ====================
+profiler.mark("tab: collaborate")
 with tab4:
     if not COLLAB_ENABLED:
         st.warning("Collaboration features require additional packages.")
@@ -1661,70 +2238,64 @@ with tab4:
                     )
 
 # ==================== TAB 5: ANALYTICS ====================
+profiler.mark("tab: analytics")
 with tab5:
     st.markdown("<h1 class='main-header'>\U0001f4ca Analytics & Insights</h1>", unsafe_allow_html=True)
     
     # Metrics Dashboard
     col1, col2, col3, col4 = st.columns(4)
     
+    # Running aggregates, updated on insert
+    history_stats = st.session_state.chat_history.stats
+    
     with col1:
-        st.metric("Total Chats", len(st.session_state.chat_history))
+        st.metric("Total Chats", history_stats.count)
     
     with col2:
-        if st.session_state.chat_history:
-            # Hitung avg response length
-            total_length = sum([msg.get('response_length', 0) for msg in st.session_state.chat_history])
-            avg_length = total_length / len(st.session_state.chat_history) if len(st.session_state.chat_history) > 0 else 0
-            st.metric("Avg Response Length", f"{avg_length:.0f} chars")
-        else:
-            st.metric("Avg Response Length", "0 chars")
+        st.metric("Avg Response Length", f"{history_stats.avg_length:.0f} chars")
     
     with col3:
-        if st.session_state.chat_history:
-            total_tokens = sum([msg.get('response_length', 0) for msg in st.session_state.chat_history])
-            st.metric("Total Chars", f"{total_tokens:,}")
-        else:
-            st.metric("Total Chars", "0")
+        st.metric("Total Chars", f"{history_stats.total_length:,}")
     
     with col4:
         favorite_count = len(st.session_state.favorites)
         st.metric("Favorites", favorite_count)
     
-    # Charts
+    # Charts, read from pre-aggregated usage rollups
+    usage_store = get_store()
+    range_col, scope_col = st.columns([2, 1])
+    with range_col:
+        usage_range = st.selectbox("Usage range", list(USAGE_RANGES), index=2, key="usage_range")
+    with scope_col:
+        usage_all = st.checkbox("All workspaces", key="usage_all_workspaces")
+    
+    usage_fig = plugin_fig = None
+    if usage_store is not None:
+        # Flushed rows only, so pending chats appear after the next save
+        granularity, span = USAGE_RANGES[usage_range]
+        start_bucket = bucket_key((datetime.now() - span).strftime(TIMESTAMP_FORMAT), granularity)
+        usage_fig, plugin_fig = usage_figures(
+            usage_range,
+            None if usage_all else st.session_state.current_workspace,
+            start_bucket,
+            usage_store.usage_version
+        )
+    
     chart_col1, chart_col2 = st.columns(2)
     
     with chart_col1:
         st.subheader("📈 Usage Over Time")
-        
-        # Create sample time series data
-        dates = pd.date_range(start='2024-01-01', periods=30, freq='D')
-        usage = np.random.randint(10, 100, size=30)
-        
-        fig = px.line(
-            x=dates, 
-            y=usage,
-            title="Daily Chat Usage",
-            labels={'x': 'Date', 'y': 'Messages'}
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        if usage_fig is not None:
+            st.plotly_chart(usage_fig, use_container_width=True)
+        else:
+            st.info("No usage recorded in this range yet")
     
     with chart_col2:
         st.subheader("🧩 Plugin Usage")
-        
-        plugin_data = {
-            'Plugin': ['Code', 'Email', 'Research', 'Creative', 'Translate'],
-            'Usage': [45, 32, 28, 19, 12]
-        }
-        df = pd.DataFrame(plugin_data)
-        
-        fig = px.pie(
-            df, 
-            values='Usage', 
-            names='Plugin',
-            title="Plugin Usage Distribution",
-            hole=0.3
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        if plugin_fig is not None:
+            st.plotly_chart(plugin_fig, use_container_width=True)
+        else:
+            st.info("No plugin usage recorded in this range yet")
     
     # Detailed Analytics
     st.subheader("🔍 Detailed Analysis")
@@ -1733,85 +2304,176 @@ with tab5:
     
     with analysis_tab1:
         if st.session_state.chat_history:
-            # Buat DataFrame
-            df_history = pd.DataFrame(st.session_state.chat_history)
-            
-            # Cek kolom yang tersedia
-            available_columns = df_history.columns.tolist()
+            # Only the most recent rows are rendered
+            df_history = pd.DataFrame(st.session_state.chat_history.tail(HISTORY_DISPLAY_ROWS))
+            st.dataframe(df_history, use_container_width=True)
+            st.caption(f"Showing last {len(df_history)} of {len(st.session_state.chat_history)} loaded chats")
             
-            # Pilih kolom yang ada
-            display_columns = []
-            for col in ['timestamp', 'model', 'user', 'assistant', 'response_length', 'response_time']:
-                if col in available_columns:
-                    display_columns.append(col)
-            
-            if display_columns:
-                st.dataframe(
-                    df_history[display_columns],
-                    use_container_width=True
-                )
-            else:
-                st.info("No chat history data available")
-            
-            # Export options
-            csv = df_history.to_csv(index=False)
-            st.download_button(
-                "\U0001f4e5 Export Full History",
-                csv,
-                file_name="full_chat_history.csv",
-                mime="text/csv"
-            )
+            # Export options, built only on request
+            with st.expander("\U0001f4e5 Export Full History"):
+                export_chat(key="analytics_export")
+        else:
+            st.info("No chat history data available")
     
     with analysis_tab2:
-        # Performance metrics
-        metrics = {
-            'Metric': ['Avg Response Length', 'Max Response Time', 'Min Response Time', 'Success Rate'],
-            'Value': ['245 chars', '8.2s', '1.1s', '98.5%']
-        }
-        st.table(pd.DataFrame(metrics))
+        # Performance metrics per model from running aggregates
+        model_rows = history_stats.model_rows()
+        if model_rows:
+            st.table(pd.DataFrame(model_rows))
+        else:
+            st.info("No chats recorded yet")
         
         # Model comparison
         st.subheader("🤖 Model Performance Comparison")
+        st.caption(f"Benchmark suite v{SUITE_VERSION}: short chat, long-context summary, code and vision (where supported)")
         
-        model_data = {
-            'Model': ['Gemma 3 4B', 'Llama 2 7B', 'DeepSeek R1', 'Mixtral'],
-            'Speed (tok/s)': [25, 15, 8, 5],
-            'Accuracy (%)': [85, 82, 88, 90],
-            'RAM Usage (GB)': [6, 12, 14, 32]
-        }
-        
-        df_models = pd.DataFrame(model_data)
-        st.dataframe(df_models, use_container_width=True)
+        store = get_store()
+        if store is None:
+            st.info("Benchmarks require conversation storage")
+        else:
+            if st.button("▶️ Run Benchmark Suite"):
+                progress_bar = st.progress(0.0)
+                try:
+                    BenchmarkRunner(
+                        get_ollama_client(), store, st.session_state.get("ollama_host") or DEFAULT_OLLAMA_HOST
+                    ).run(
+                        progress=lambda pct, label: progress_bar.progress(pct, text=label)
+                    )
+                    st.success("Benchmark complete!")
+                except Exception as e:
+                    st.error(f"Benchmark failed: {str(e)}")
+            
+            benchmark_rows = store.benchmark_results(SUITE_VERSION)
+            df_bench = pd.DataFrame(benchmark_rows)
+            if benchmark_rows:
+                df_bench = df_bench[df_bench["error"].isna()]
+            
+            if benchmark_rows and not df_bench.empty:
+                # Latest run per model
+                latest = df_bench[df_bench["started"] == df_bench.groupby("model")["started"].transform("max")]
+                df_models = latest.groupby("model").agg(**{
+                    "Load Time (s)": ("load_duration", "max"),
+                    "TTFT (s)": ("ttft", "median"),
+                    "Speed (tok/s)": ("tokens_per_sec", "mean"),
+                    "Peak Memory (MB)": ("peak_rss_mb", "max"),
+                    "Last Run": ("started", "max")
+                }).round(2).reset_index().rename(columns={"model": "Model"})
+                st.dataframe(df_models, use_container_width=True)
+                
+                with st.expander("Tokens/sec per case"):
+                    st.dataframe(
+                        latest.pivot_table(index="model", columns="case_name", values="tokens_per_sec").round(1),
+                        use_container_width=True
+                    )
+                
+                # Trend across runs
+                trend = df_bench.groupby(["started", "model"])["tokens_per_sec"].mean().reset_index()
+                if trend["started"].nunique() > 1:
+                    fig = px.line(
+                        trend,
+                        x="started",
+                        y="tokens_per_sec",
+                        color="model",
+                        markers=True,
+                        title="Tokens/sec Across Benchmark Runs",
+                        labels={"started": "Run", "tokens_per_sec": "Tokens/sec"}
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("No benchmark results yet. Run the suite to measure the installed models.")
     
     with analysis_tab3:
-        # Cost estimation
-        st.info("💡 Cost estimation based on equivalent cloud API pricing")
-        
-        col1, col2 = st.columns(2)
+        # Cost and capacity from recorded token counts (usage rollups)
+        st.info("💡 Cost of the recorded load at equivalent cloud API pricing, and a projection from the observed request rate")
         
-        with col1:
-            input_tokens = st.number_input("Input tokens per request", 100, 10000, 500)
-            output_tokens = st.number_input("Output tokens per request", 100, 10000, 500)
-            requests_per_day = st.number_input("Requests per day", 10, 10000, 100)
-        
-        with col2:
-            input_cost = st.number_input("Cost per input token ($)", 0.000001, 0.001, 0.000002, format="%.6f")
-            output_cost = st.number_input("Cost per output token ($)", 0.000001, 0.001, 0.000002, format="%.6f")
-        
-        # Calculate
-        daily_cost = (input_tokens * input_cost + output_tokens * output_cost) * requests_per_day
-        monthly_cost = daily_cost * 30
-        
-        st.metric("Estimated Daily Cost", f"${daily_cost:.4f}")
-        st.metric("Estimated Monthly Cost", f"${monthly_cost:.2f}")
-        
-        # Savings compared to cloud
-        cloud_monthly = 20  # Example cloud subscription
-        savings = cloud_monthly - monthly_cost
-        st.metric("Savings vs Cloud", f"${savings:.2f}", delta=f"{savings/cloud_monthly*100:.1f}%")
+        if usage_store is None:
+            st.warning("Storage is unavailable, no usage has been recorded")
+        else:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                cost_window = st.selectbox("Window", list(COST_WINDOWS), index=2, key="cost_window")
+                cost_all = st.checkbox("All workspaces", key="cost_all_workspaces")
+                parallel_slots = st.number_input("Parallel slots per Ollama box", 1, 64, 1, key="cost_parallel_slots")
+            
+            with col2:
+                input_price = st.number_input("Cloud price per 1M input tokens ($)", 0.0, 100.0, 0.15, key="cost_input_price")
+                output_price = st.number_input("Cloud price per 1M output tokens ($)", 0.0, 100.0, 0.60, key="cost_output_price")
+                box_cost = st.number_input("Ollama box cost per month ($)", 0.0, 10000.0, 20.0, key="cost_box_monthly")
+            
+            granularity, span = COST_WINDOWS[cost_window]
+            now = datetime.now()
+            rows = usage_store.usage_rollups(
+                granularity,
+                (now - span).strftime(TIMESTAMP_FORMAT),
+                None if cost_all else st.session_state.current_workspace,
+                group_by="model"
+            )
+            
+            if not rows:
+                st.info("No chats with token counts recorded in this window yet")
+            else:
+                usage_df = pd.DataFrame(rows)
+                per_model = usage_df.groupby("key", as_index=False)[
+                    ["events", "prompt_tokens", "completion_tokens", "response_time"]
+                ].sum()
+                per_model["cost"] = (
+                    per_model["prompt_tokens"] * input_price + per_model["completion_tokens"] * output_price
+                ) / 1_000_000
+                
+                # Observed rate over the part of the window that has data
+                first_bucket = pd.to_datetime(usage_df["bucket"].min()).to_pydatetime()
+                observed_days = max((now - max(first_bucket, now - span)).total_seconds(), 3600) / 86400
+                requests = int(per_model["events"].sum())
+                window_cost = float(per_model["cost"].sum())
+                busy_seconds = float(per_model["response_time"].sum())
+                
+                requests_per_day = requests / observed_days
+                monthly_cloud = window_cost / observed_days * 30
+                monthly_savings = monthly_cloud - box_cost
+                utilization = busy_seconds / (observed_days * 86400 * parallel_slots)
+                avg_response = busy_seconds / requests if requests else 0
+                capacity_per_day = 86400 * parallel_slots / avg_response if avg_response else None
+                
+                metric_cols = st.columns(4)
+                metric_cols[0].metric("Requests", f"{requests:,}", help=f"Over {observed_days:.1f} day(s) with data")
+                metric_cols[1].metric("Tokens", f"{int(per_model['prompt_tokens'].sum() + per_model['completion_tokens'].sum()):,}")
+                metric_cols[2].metric("Cloud-equivalent cost", f"${window_cost:.4f}")
+                metric_cols[3].metric("Requests / day", f"{requests_per_day:.1f}")
+                
+                st.dataframe(
+                    per_model.rename(columns={
+                        "key": "Model",
+                        "events": "Requests",
+                        "prompt_tokens": "Input Tokens",
+                        "completion_tokens": "Output Tokens",
+                        "response_time": "Busy Seconds",
+                        "cost": "Cloud Cost ($)"
+                    }),
+                    use_container_width=True,
+                    hide_index=True
+                )
+                
+                st.subheader("📐 Projection at the observed rate")
+                proj_cols = st.columns(4)
+                proj_cols[0].metric("Monthly cloud cost", f"${monthly_cloud:.2f}")
+                proj_cols[1].metric(
+                    "Savings vs cloud",
+                    f"${monthly_savings:.2f}",
+                    delta=f"{monthly_savings / monthly_cloud * 100:.1f}%" if monthly_cloud else None
+                )
+                proj_cols[2].metric("Box utilization", f"{utilization:.1%}")
+                proj_cols[3].metric(
+                    "Capacity / day",
+                    f"{capacity_per_day:,.0f}" if capacity_per_day else "N/A",
+                    help="Requests per day the box could serve at the measured average response time"
+                )
+                if capacity_per_day and requests_per_day > 0.8 * capacity_per_day:
+                    st.warning("Observed load is above 80% of capacity, consider more parallel slots or another Ollama box")
 
 
 # ==================== TAB 6: SETTINGS ====================
+profiler.mark("tab: settings")
 with tab6:
     st.markdown("<h1 class='main-header'>⚙️ Advanced Settings</h1>", unsafe_allow_html=True)
     
@@ -1826,19 +2488,29 @@ with tab6:
         
         with col1:
             # Auto-save settings
-            auto_save = st.toggle("Auto-save conversations", True)
+            auto_save = st.toggle("Auto-save conversations", True, key="auto_save")
             save_interval = st.select_slider(
                 "Save interval",
-                options=["Every message", "Every 5 messages", "Every 10 messages", "Manual only"]
+                options=list(SAVE_INTERVALS.keys()),
+                key="save_interval"
             )
             
+            store = get_store()
+            if store is None:
+                st.caption("⚠️ Storage unavailable, conversations live only in this session")
+            elif st.button("💾 Save now"):
+                flush_store()
+                st.success("Conversations saved!")
+            else:
+                st.caption(f"{store.pending_count} unsaved change(s)")
+            
             # Notifications
             notify_new = st.toggle("Notify on new messages", True)
             notify_sound = st.toggle("Play notification sound", True)
             
         with col2:
             # Privacy
-            store_history = st.toggle("Store chat history", True)
+            store_history = st.toggle("Store chat history", True, key="store_history")
             if not store_history:
                 st.warning("Chat history will not be saved after session ends")
             
@@ -1862,6 +2534,8 @@ with tab6:
                             st.info("Operation cancelled")
                     with col2:
                         if st.button("Delete Everything", type="primary"):
+                            wipe_stored_data()
+                            
                             # List of keys to keep
                             keep_keys = ['_last_run', '_widget_state']
                             
@@ -1881,15 +2555,15 @@ with tab6:
         
         ollama_host = st.text_input(
             "Ollama Host",
-            value="http://localhost:11434",
-            help="URL of your Ollama server"
+            key="ollama_host",
+            help="URL of your Ollama server, e.g. http://127.0.0.1:11435 for fake_ollama.py"
         )
         
         ollama_timeout = st.number_input(
             "Request Timeout (seconds)",
             min_value=5,
             max_value=300,
-            value=30
+            key="ollama_timeout"
         )
         
         # External APIs
@@ -1979,6 +2653,159 @@ with tab6:
             "Federated learning": st.toggle("Learn from usage patterns", False)
         }
         
+        # Rerun profiler
+        st.write("**🩺 Rerun Profiler**")
+        
+        profiler_col1, profiler_col2 = st.columns(2)
+        with profiler_col1:
+            st.toggle("Profile reruns", False, key="profiling_enabled",
+                      help="Time every section and external call of each rerun")
+        with profiler_col2:
+            st.toggle("Capture cProfile", False, key="profiling_cprofile",
+                      help="Keep a full call profile of each rerun (adds overhead)")
+        
+        if profiler.reruns:
+            slowest_reruns = profiler.slowest(5)
+            slow_ids = {r["id"] for r in slowest_reruns}
+            
+            df_sections = pd.DataFrame(profiler.section_rows())
+            df_sections["rerun"] = df_sections["rerun"].map(
+                lambda rerun_id: f"🐢 #{rerun_id}" if rerun_id in slow_ids else f"#{rerun_id}"
+            )
+            fig = px.bar(
+                df_sections,
+                x="rerun",
+                y="seconds",
+                color="section",
+                title="Rerun Time by Section (🐢 = slowest)"
+            )
+            fig.update_layout(barmode="stack", height=350)
+            st.plotly_chart(fig, use_container_width=True)
+            
+            st.write("Slowest reruns")
+            st.dataframe(pd.DataFrame([{
+                "Rerun": f"#{r['id']}",
+                "Started": r["started"],
+                "Total (s)": round(r["total"], 3),
+                "Slowest Section": max(r["sections"], key=r["sections"].get) if r["sections"] else "-",
+                "External Calls (s)": round(sum(c["duration"] for c in r["calls"]), 3),
+                "Interrupted": r["interrupted"]
+            } for r in slowest_reruns]), use_container_width=True)
+            
+            external_calls = [dict(call, rerun=r["id"]) for r in profiler.reruns for call in r["calls"]]
+            if external_calls:
+                with st.expander("External calls"):
+                    st.dataframe(pd.DataFrame(external_calls), use_container_width=True)
+            
+            profiled_reruns = [r for r in profiler.reruns if r["cprofile"]]
+            if profiled_reruns:
+                chosen = st.selectbox(
+                    "cProfile dump",
+                    profiled_reruns,
+                    format_func=lambda r: f"Rerun #{r['id']} ({r['total']:.2f}s)"
+                )
+                with st.expander(f"cProfile: rerun #{chosen['id']}"):
+                    st.code(chosen["cprofile"])
+                st.download_button(
+                    "📥 Download cProfile dump",
+                    chosen["cprofile"],
+                    file_name=f"rerun_{chosen['id']}_cprofile.txt",
+                    mime="text/plain"
+                )
+        elif st.session_state.get("profiling_enabled"):
+            st.caption("Collecting reruns... interact with the app to fill the buffer.")
+        
+        # Traces
+        st.write("**🧵 Traces**")
+        
+        session_traces = tracing.recent_traces(session=browser_session_id)
+        if session_traces:
+            st.dataframe(pd.DataFrame([{
+                "Started": datetime.fromtimestamp(t["start"]).strftime("%H:%M:%S"),
+                "Actions": ", ".join(s["name"].replace("action: ", "") for s in t["spans"] if s["depth"] == 1),
+                "Duration (s)": round(t["duration"], 3),
+                "Spans": len(t["spans"]),
+                "Status": t["status"]
+            } for t in session_traces]), use_container_width=True, hide_index=True)
+            
+            chosen_trace = st.selectbox(
+                "Trace",
+                session_traces,
+                format_func=lambda t: f"{datetime.fromtimestamp(t['start']).strftime('%H:%M:%S')} "
+                                      f"({t['duration']:.2f}s, {len(t['spans'])} spans)"
+            )
+            spans = chosen_trace["spans"]
+            fig = go.Figure(go.Bar(
+                y=[f"{'· ' * s['depth']}{s['name']}" for s in spans],
+                x=[s["duration"] for s in spans],
+                base=[s["offset"] for s in spans],
+                orientation="h",
+                marker_color=["#e74c3c" if s["status"] == "error" else "#3498db" for s in spans],
+                hovertext=[json.dumps(s["attributes"], default=str) + (f"<br>{s['error']}" if s["error"] else "")
+                           for s in spans]
+            ))
+            fig.update_layout(
+                title="Span Waterfall",
+                xaxis_title="Seconds since rerun start",
+                yaxis=dict(autorange="reversed"),
+                height=120 + 28 * len(spans)
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            
+            st.download_button(
+                "📥 Download traces (JSON lines)",
+                tracing.to_jsonl(session_traces),
+                file_name=f"traces_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                mime="application/x-ndjson"
+            )
+        else:
+            st.caption("Reruns with actions or external calls appear here. "
+                       "Set TRACE_FILE to also append every trace to a JSON lines file.")
+        
+        # Session memory
+        st.write("**🧠 Session Memory**")
+        
+        # Every tab runs on every rerun: reuse the throttled measurement, walk the state only on request
+        usage = None
+        if st.button("🔍 Measure now", key="memory_measure"):
+            usage = memory.session_usage(st.session_state)
+        session_entry = memory.record_session(browser_session_id, st.session_state,
+                                              st.session_state.current_workspace, usage=usage)
+        st.metric("This session", f"{session_entry['bytes'] / 1024 / 1024:.2f} MB",
+                  help=f"Measured at {datetime.fromtimestamp(session_entry['measured']).strftime('%H:%M:%S')}")
+        if usage:
+            df_usage = pd.DataFrame(usage[:15])
+            df_usage["KB"] = (df_usage.pop("bytes") / 1024).round(1)
+            st.dataframe(df_usage, use_container_width=True, hide_index=True)
+        
+        with st.expander("Caps (oldest items beyond a cap are evicted)"):
+            st.caption("Evicted chats stay in the conversation store; with history storage off they are discarded.")
+            cap_cols = st.columns(3)
+            for i, (name, default_cap) in enumerate(memory.DEFAULT_CAPS.items()):
+                with cap_cols[i % 3]:
+                    st.number_input(
+                        name.replace("_", " ").title(),
+                        min_value=10,
+                        max_value=100000,
+                        value=default_cap,
+                        step=10,
+                        key=f"memory_cap_{name}"
+                    )
+            if st.button("Apply caps now"):
+                evicted = memory.enforce_caps(st.session_state, memory_caps())
+                st.success(f"Evicted: {evicted}" if evicted else "Everything is within the caps")
+        
+        largest = memory.largest_sessions(10)
+        if largest:
+            st.write("Largest sessions in this process")
+            st.dataframe(pd.DataFrame([{
+                "Session": entry["session"][:8] + (" (you)" if entry["session"] == browser_session_id else ""),
+                "Workspace": entry["workspace"],
+                "MB": round(entry["bytes"] / 1024 / 1024, 2),
+                "Largest Key": entry["largest_key"],
+                "Measured": datetime.fromtimestamp(entry["measured"]).strftime("%H:%M:%S")
+            } for entry in largest]), use_container_width=True, hide_index=True)
+        
         # Danger zone
         with st.expander("⚠️ Danger Zone", expanded=False):
             st.warning("These settings can break the application")
@@ -2094,27 +2921,6 @@ def code_assistant_ui():
             )
             st.code(response['message']['content'], language=language.lower())
 
-def describe_image_with_ai(image):
-    """Use AI to describe image"""
-    # Convert image to base64
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    # Use vision model if available
-    try:
-        response = ollama.chat(
-            model="llava:7b",  # Vision model
-            messages=[{
-                "role": "user",
-                "content": "Describe this image in detail",
-                "images": [img_str]
-            }]
-        )
-        return response['message']['content']
-    except:
-        return "Image description not available. Install a vision model like LLaVA."
-
 def generate_collaborative_idea():
     """Generate idea for collaboration"""
     ideas = [
@@ -2142,35 +2948,6 @@ def save_collaboration():
     
     st.success("Collaboration saved!")
 
-def export_chat():
-    """Export chat history"""
-    if st.session_state.chat_history:
-        # Buat DataFrame
-        df = pd.DataFrame(st.session_state.chat_history)
-        
-        # Pilih format yang tersedia
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            csv = df.to_csv(index=False)
-            st.download_button(
-                "\U0001f4e5 CSV",
-                csv,
-                file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
-        
-        with col2:
-            json_str = df.to_json(indent=2, orient="records")
-            st.download_button(
-                "\U0001f4e5 JSON",
-                json_str,
-                file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json"
-            )
-    else:
-        st.info("No chat history to export")
-
 def play_notification():
     """Play notification sound"""
     # Simple beep sound using HTML5 audio
@@ -2182,10 +2959,12 @@ def play_notification():
     st.components.v1.html(audio_html, height=0)
 
 # ==================== MAIN EXECUTION ====================
+profiler.mark("main")
 if __name__ == "__main__":
     # Auto-start Ollama check
     try:
-        ollama.list()
+        with profiler.call("ollama.list"), tracing.span("ollama.list"):
+            get_ollama_client().list()
     except:
         st.sidebar.error("⚠️ Ollama not running. Start with: `ollama serve`")
     
@@ -2196,4 +2975,11 @@ if __name__ == "__main__":
             "role": "assistant",
             "content": welcome_msg,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
\ No newline at end of file
+        })
+    
+    # Persist anything added during this rerun
+    sync_messages()
+
+profiler.finish()
+tracing.finish_trace(st.session_state.trace_root)
+st.session_state.trace_root = None
\ No newline at end of file
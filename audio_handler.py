@@ -7,6 +7,9 @@ from datetime import datetime
 import io
 import time
 
+import metrics
+import tracing
+
 class AudioProcessor:
     def __init__(self):
         self.recognizer = sr.Recognizer()
@@ -48,7 +51,15 @@ class AudioProcessor:
             if isinstance(audio_file, str) and os.path.exists(audio_file):
                 with sr.AudioFile(audio_file) as source:
                     audio = self.recognizer.record(source)
-                    text = self.recognizer.recognize_google(audio, language='id-ID')
+                    start = time.perf_counter()
+                    try:
+                        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+                        with tracing.span("speech.recognize_google", language="id-ID",
+                                          audio_seconds=round(seconds, 2)) as span:
+                            text = self.recognizer.recognize_google(audio, language='id-ID')
+                            span.set(chars=len(text))
+                    finally:
+                        metrics.TRANSCRIPTION_DURATION.observe(time.perf_counter() - start)
                     
                     # Save to history
                     self.history.append({
@@ -64,8 +75,10 @@ class AudioProcessor:
         except sr.UnknownValueError:
             return "Could not understand audio"
         except sr.RequestError as e:
+            metrics.EXTERNAL_ERRORS.inc(operation="transcription")
             return f"API error: {str(e)}"
         except Exception as e:
+            metrics.EXTERNAL_ERRORS.inc(operation="transcription")
             return f"Transcription error: {str(e)}"
     
     def text_to_speech(self, text, lang='id'):
@@ -77,7 +90,8 @@ class AudioProcessor:
             tts = gTTS(text=text, lang=lang, slow=False)
             
             with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as tmp:
-                tts.save(tmp.name)
+                with tracing.span("gtts.synthesize", lang=lang, chars=len(text)):
+                    tts.save(tmp.name)
                 
                 # Read file and encode to base64 for HTML audio
                 with open(tmp.name, 'rb') as f:
@@ -92,6 +106,7 @@ class AudioProcessor:
         except ImportError:
             return "Install gTTS: pip install gtts"
         except Exception as e:
+            metrics.EXTERNAL_ERRORS.inc(operation="tts")
             return f"TTS error: {str(e)}"
     
     def play_last_recording(self):
@@ -0,0 +1,289 @@
+"""Model benchmark suite.
+
+Runs a fixed, versioned set of prompts against every installed Ollama model
+and stores load time, TTFT, tokens/sec and peak memory in the conversation
+store, so the Analytics tab can show measured numbers for this hardware.
+
+    python benchmark.py                  # all installed models
+    python benchmark.py --models gemma3:4b llama2:7b
+"""
+import argparse
+import base64
+import ipaddress
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import ollama
+
+from storage import ConversationStore, TIMESTAMP_FORMAT
+from telemetry import generate_with_metrics
+
+# Bump whenever prompts or options change, results of different versions are not comparable
+SUITE_VERSION = "1"
+
+LONG_CONTEXT_PARAGRAPH = (
+    "The city council met on Tuesday to review the annual budget. Members debated "
+    "funding for public transport, parks, road maintenance and the new library. "
+    "After several hours the council agreed to raise transport spending by eight "
+    "percent, postpone the library extension and review park fees next spring. "
+)
+
+
+def _benchmark_image() -> str:
+    """A small deterministic PNG (color gradient) as base64"""
+    width = height = 64
+    raw = b"".join(
+        b"\x00" + bytes(channel for x in range(width) for channel in (x * 4, y * 4, 128))
+        for y in range(height)
+    )
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    png = (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+    return base64.b64encode(png).decode()
+
+
+SUITE = [
+    {
+        "case": "short_chat",
+        "prompt": "In two sentences, what is the capital of Indonesia and why is it being moved?",
+        "options": {"temperature": 0, "seed": 42, "num_predict": 96}
+    },
+    {
+        "case": "long_context_summary",
+        "prompt": LONG_CONTEXT_PARAGRAPH * 60 + "\n\nSummarize the meeting above in three bullet points.",
+        "options": {"temperature": 0, "seed": 42, "num_predict": 160, "num_ctx": 8192}
+    },
+    {
+        "case": "code",
+        "prompt": "Write a Python function that returns the n-th Fibonacci number iteratively, with a docstring.",
+        "options": {"temperature": 0, "seed": 42, "num_predict": 200}
+    },
+    {
+        "case": "vision",
+        "prompt": "Describe the colors in this image in one sentence.",
+        "images": [_benchmark_image()],
+        "options": {"temperature": 0, "seed": 42, "num_predict": 64},
+        "requires": "vision"
+    }
+]
+
+
+def list_models(client) -> List[str]:
+    """Names of the models installed on the Ollama server"""
+    response = client.list()
+    return [m.get("model") or m.get("name") for m in response["models"]]
+
+
+def model_capabilities(client, model: str) -> set:
+    """Capabilities reported by /api/show, with a family-based guess for older servers"""
+    try:
+        info = client.show(model)
+    except Exception:
+        return set()
+    capabilities = set(info.get("capabilities") or [])
+    families = (info.get("details") or {}).get("families") or []
+    if {"clip", "mllama"} & set(families):
+        capabilities.add("vision")
+    return capabilities
+
+
+def client_host(client) -> str:
+    """Base URL an ollama client (or the ollama module) sends requests to"""
+    base_url = getattr(getattr(client, "_client", None), "base_url", None)
+    if base_url is not None:
+        return str(base_url)
+    return os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+
+def is_loopback(host: str) -> bool:
+    """Whether an Ollama host URL (or bare host:port) points at this machine"""
+    hostname = urlsplit(host if "://" in host else f"http://{host}").hostname or "127.0.0.1"
+    if hostname == "localhost":
+        return True
+    try:
+        address = ipaddress.ip_address(hostname)
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_unspecified
+
+
+class MemorySampler:
+    """Track peak memory of the Ollama server while a model runs.
+
+    Uses psutil on Ollama processes when the server is on this machine,
+    otherwise the loaded model size reported by /api/ps (local processes of
+    a remote host would measure the wrong server).
+    """
+
+    def __init__(self, client, local: bool, interval: float = 0.2):
+        self.client = client
+        self.local = local
+        self.interval = interval
+        self.peak_bytes = 0
+        self.source = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample_processes(self) -> Optional[int]:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        total = 0
+        for proc in psutil.process_iter(["name", "memory_info"]):
+            name = (proc.info.get("name") or "").lower()
+            if name.startswith("ollama") and proc.info.get("memory_info"):
+                total += proc.info["memory_info"].rss
+        return total or None
+
+    def _sample_ps(self) -> Optional[int]:
+        try:
+            response = self.client.ps()
+        except Exception:
+            return None
+        return sum(m.get("size") or 0 for m in response["models"]) or None
+
+    def _sample(self):
+        value = self._sample_processes() if self.local else None
+        if value is not None:
+            self.source = "rss"
+        else:
+            value = self._sample_ps()
+            if value is not None:
+                self.source = "ollama ps"
+        if value:
+            self.peak_bytes = max(self.peak_bytes, value)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class BenchmarkRunner:
+    """Run the benchmark suite and persist results"""
+
+    def __init__(self, client=None, store: ConversationStore = None, host: str = None):
+        self.client = client or ollama
+        self.store = store
+        self.local = is_loopback(host or client_host(self.client))
+
+    def run(self, models: List[str] = None, progress: Callable[[float, str], None] = None) -> Dict:
+        """Benchmark each model on every applicable case, return {run_id, results}"""
+        models = models or list_models(self.client)
+        run_id = uuid.uuid4().hex[:8]
+        started = datetime.now().strftime(TIMESTAMP_FORMAT)
+        results = []
+
+        plan = []
+        for model in models:
+            capabilities = model_capabilities(self.client, model)
+            plan.extend((model, case) for case in SUITE
+                        if not case.get("requires") or case["requires"] in capabilities)
+
+        for step, (model, case) in enumerate(plan):
+            if progress:
+                progress(step / len(plan), f"{model}: {case['case']}")
+
+            first_case = step == 0 or plan[step - 1][0] != model
+            if first_case:
+                self._unload(model)
+
+            result = {
+                "run_id": run_id,
+                "suite_version": SUITE_VERSION,
+                "started": started,
+                "model": model,
+                "case_name": case["case"],
+                "error": None
+            }
+            with MemorySampler(self.client, self.local) as sampler:
+                try:
+                    _, metrics = generate_with_metrics(
+                        model,
+                        case["prompt"],
+                        options=case["options"],
+                        images=case.get("images"),
+                        client=self.client
+                    )
+                    result.update({
+                        "load_duration": metrics["load_duration"] if first_case else None,
+                        "ttft": metrics["ttft"],
+                        "tokens_per_sec": metrics["tokens_per_sec"],
+                        "prompt_eval_count": metrics["prompt_eval_count"],
+                        "eval_count": metrics["eval_count"],
+                        "total_duration": metrics["total_duration"]
+                    })
+                except Exception as e:
+                    result["error"] = str(e)
+            result["peak_rss_mb"] = round(sampler.peak_bytes / 1024 / 1024, 1) if sampler.peak_bytes else None
+            result["memory_source"] = sampler.source
+            results.append(result)
+
+        if progress:
+            progress(1.0, "Done")
+        if self.store is not None:
+            self.store.save_benchmark_results(results)
+        return {"run_id": run_id, "results": results}
+
+    def _unload(self, model: str):
+        """Unload a model so the next request measures a cold load"""
+        try:
+            self.client.generate(model=model, prompt="", keep_alive=0)
+        except Exception:
+            pass
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark installed Ollama models")
+    parser.add_argument("--models", nargs="*", help="Models to benchmark (default: all installed)")
+    parser.add_argument("--host", help="Ollama host, e.g. http://localhost:11434")
+    parser.add_argument("--no-save", action="store_true", help="Do not store results")
+    args = parser.parse_args()
+
+    client = ollama.Client(host=args.host) if args.host else ollama
+    store = None if args.no_save else ConversationStore()
+    runner = BenchmarkRunner(client, store, args.host)
+
+    outcome = runner.run(args.models, progress=lambda pct, label: print(f"[{pct:4.0%}] {label}"))
+
+    print(f"\nRun {outcome['run_id']} (suite v{SUITE_VERSION})")
+    print(f"{'model':28} {'case':22} {'load s':>7} {'ttft s':>7} {'tok/s':>7} {'peak MB':>8}")
+    for r in outcome["results"]:
+        if r["error"]:
+            print(f"{r['model']:28} {r['case_name']:22} error: {r['error']}")
+            continue
+        print(f"{r['model']:28} {r['case_name']:22} "
+              f"{r['load_duration'] or 0:7.2f} {r['ttft'] or 0:7.2f} "
+              f"{r['tokens_per_sec'] or 0:7.1f} {r['peak_rss_mb'] or 0:8.0f}")
+    if store is not None:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
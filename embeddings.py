@@ -0,0 +1,152 @@
+"""Batched sentence embeddings with a persistent cache.
+
+Texts are embedded in batches on a thread pool (sentence-transformers
+releases the GIL inside torch) and every vector is stored in SQLite keyed by
+(model, text hash), so identical text is never embedded twice, across
+workspaces and restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.environ.get("RAG_EMBED_WORKERS", "0")) or os.cpu_count() or 1
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, hash)
+) WITHOUT ROWID;
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (model, text hash)"""
+
+    LOOKUP_BATCH = 500  # stays below SQLite's bound-parameter limit
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(CACHE_SCHEMA)
+        self.conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), self.LOOKUP_BATCH):
+                batch = hashes[start:start + self.LOOKUP_BATCH]
+                rows = self.conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                )
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, digest, array("f", vector).tobytes()) for digest, vector in vectors.items()]
+            )
+            self.conn.commit()
+
+    def clear(self):
+        """Delete every cached vector"""
+        with self._lock:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+
+    def count(self, model: str = None) -> int:
+        with self._lock:
+            if model is None:
+                return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+
+class Embedder:
+    """Embeds texts in batches on a worker pool, reusing cached vectors"""
+
+    def __init__(self, model_name: str, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS):
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed directly, without the cache (e.g. one-off queries)"""
+        return self.model().encode(texts, batch_size=len(texts), normalize_embeddings=True).tolist()
+
+    def embed(self, texts: List[str], progress: Callable[[Dict], None] = None) -> List[List[float]]:
+        """Vectors for `texts` in order; `progress` gets {done, total, cached, chunks_per_sec}"""
+        return self.embed_with_stats(texts, progress)["vectors"]
+
+    def embed_with_stats(self, texts: List[str], progress: Callable[[Dict], None] = None) -> Dict:
+        """Like `embed`, returns {vectors, embedded, cached, elapsed, chunks_per_sec}"""
+        start = time.perf_counter()
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, list(set(hashes))) if self.cache else {}
+        cached = sum(1 for digest in hashes if digest in vectors)
+
+        # Unique texts still missing, in first-seen order
+        missing: Dict[str, str] = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+        pending = list(missing.items())
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+
+        done = 0
+        total = len(pending)
+        if progress:
+            progress({"done": 0, "total": total, "cached": cached, "chunks_per_sec": 0.0})
+        futures = {self._pool.submit(self.encode, [text for _, text in batch]): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            embedded = dict(zip((digest for digest, _ in batch), future.result()))
+            if self.cache:
+                self.cache.put_many(self.model_name, embedded)
+            vectors.update(embedded)
+            done += len(batch)
+            if progress:
+                elapsed = time.perf_counter() - start
+                progress({"done": done, "total": total, "cached": cached,
+                          "chunks_per_sec": done / elapsed if elapsed else 0.0})
+
+        elapsed = time.perf_counter() - start
+        return {
+            "vectors": [vectors[digest] for digest in hashes],
+            "embedded": total,
+            "cached": cached,
+            "elapsed": elapsed,
+            "chunks_per_sec": total / elapsed if total and elapsed else 0.0
+        }
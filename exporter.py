@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import tempfile
+from typing import Dict, Iterable, Iterator, List
+
+from storage import HISTORY_FIELDS
+
+CHUNK_SIZE = 1000
+SPOOL_MAX_SIZE = 8 * 1024 * 1024  # keep small exports in memory, spill the rest to disk
+
+EXPORT_COLUMNS = ["workspace"] + list(HISTORY_FIELDS)
+
+# Format name → (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "NDJSON": ("ndjson", "application/x-ndjson"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet")
+}
+
+
+def iter_chunks(rows: Iterable[Dict], chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Group a row iterator into lists of at most `chunk_size` rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalize_row(row: Dict) -> Dict:
+    """Project a row onto the export columns with consistent types"""
+    normalized = {}
+    for col in EXPORT_COLUMNS:
+        value = row.get(col)
+        sql_type = HISTORY_FIELDS.get(col, "TEXT")
+        if sql_type in ("INTEGER", "REAL") and not isinstance(value, (int, float)):
+            value = None  # e.g. legacy "N/A" response times
+        normalized[col] = value
+    return normalized
+
+
+def write_csv(chunks: Iterable[List[Dict]], out):
+    """Write chunks as CSV bytes"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for chunk in chunks:
+        writer.writerows(normalize_row(row) for row in chunk)
+        out.write(buffer.getvalue().encode("utf-8"))
+        buffer.seek(0)
+        buffer.truncate()
+    out.write(buffer.getvalue().encode("utf-8"))
+
+
+def write_ndjson(chunks: Iterable[List[Dict]], out):
+    """Write chunks as newline-delimited JSON"""
+    for chunk in chunks:
+        lines = [json.dumps(normalize_row(row), ensure_ascii=False) for row in chunk]
+        out.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def write_parquet(chunks: Iterable[List[Dict]], out):
+    """Write each chunk as a Parquet row group (requires pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string()}
+    schema = pa.schema([
+        (col, arrow_types[HISTORY_FIELDS.get(col, "TEXT")]) for col in EXPORT_COLUMNS
+    ])
+
+    writer = pq.ParquetWriter(out, schema)
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pylist([normalize_row(row) for row in chunk], schema=schema)
+            writer.write_table(table)
+    finally:
+        writer.close()
+
+
+WRITERS = {
+    "CSV": write_csv,
+    "NDJSON": write_ndjson,
+    "Parquet": write_parquet
+}
+
+
+def export_history(chunks: Iterable[List[Dict]], fmt: str = "CSV"):
+    """Stream chunks into a spooled temp file and return it rewound"""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        WRITERS[fmt](chunks, out)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
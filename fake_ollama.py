@@ -0,0 +1,495 @@
+"""Offline stand-in for the Ollama HTTP API.
+
+Serves deterministic responses for /api/chat, /api/generate, /api/tags,
+/api/show, /api/ps and /api/embeddings (plus /api/embed) with configurable
+time-to-first-token, token rate, parallel slots and failure injection, so the
+app, benchmarks and load tests run without a real model.
+
+    python fake_ollama.py --port 11435 --ttft 0.3 --tokens-per-sec 40
+    OLLAMA_HOST=http://127.0.0.1:11435 streamlit run app.py
+    python benchmark.py --host http://127.0.0.1:11435 --no-save
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_PORT = 11435
+DEFAULT_MODELS = ["gemma3:4b", "llama3.2:3b", "nomic-embed-text:latest"]
+
+# Model name prefix → capabilities reported by /api/show
+CAPABILITIES = {
+    "gemma3": ["completion", "vision"],
+    "llava": ["completion", "vision"],
+    "nomic-embed": ["embedding"],
+    "all-minilm": ["embedding"]
+}
+
+WORDS = (
+    "the model answers questions about data code images and documents with short clear "
+    "sentences while keeping context from earlier messages in the conversation so results "
+    "stay consistent across repeated benchmark runs on the same hardware"
+).split()
+
+NANOSECONDS = 1_000_000_000
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _seed(*parts) -> int:
+    digest = hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count (whitespace words), good enough for a stand-in"""
+    return len(text.split())
+
+
+def fake_embedding(model: str, text: str, dim: int) -> List[float]:
+    """Deterministic unit vector for (model, text)"""
+    rng = random.Random(_seed(model, text))
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOllamaConfig:
+    """Behaviour knobs of the fake server"""
+
+    def __init__(self, models: List[str] = None, ttft: float = 0.2, tokens_per_sec: float = 50.0,
+                 num_predict: int = 64, parallel: int = 1, max_queue: int = 512,
+                 load_time: float = 0.0, failure_rate: float = 0.0, failure_mode: str = "error",
+                 embedding_dim: int = 384, seed: int = 0):
+        self.models = list(models or DEFAULT_MODELS)
+        self.ttft = ttft                      # seconds before the first token
+        self.tokens_per_sec = tokens_per_sec  # pacing of the following tokens
+        self.num_predict = num_predict        # default response length in tokens
+        self.parallel = parallel              # requests processed at once (OLLAMA_NUM_PARALLEL)
+        self.max_queue = max_queue            # waiting requests before 503 (OLLAMA_MAX_QUEUE)
+        self.load_time = load_time            # cold load delay per model
+        self.failure_rate = failure_rate      # share of generation requests that fail
+        self.failure_mode = failure_mode      # "error" (HTTP 500) or "disconnect" (mid-stream)
+        self.embedding_dim = embedding_dim
+        self.seed = seed
+
+
+class FakeOllama:
+    """Shared state: loaded models, slots and request counters"""
+
+    def __init__(self, config: FakeOllamaConfig):
+        self.config = config
+        self.slots = threading.BoundedSemaphore(config.parallel)
+        self.loaded: Dict[str, float] = {}
+        self.stats = {"requests": 0, "failures": 0, "rejected": 0, "waiting": 0, "active": 0}
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.seed)
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.config.failure_rate
+
+    def acquire_slot(self) -> bool:
+        """Wait for a free slot, False when the queue is full"""
+        with self._lock:
+            if self.stats["waiting"] >= self.config.max_queue:
+                self.stats["rejected"] += 1
+                return False
+            self.stats["waiting"] += 1
+        self.slots.acquire()
+        with self._lock:
+            self.stats["waiting"] -= 1
+            self.stats["active"] += 1
+        return True
+
+    def release_slot(self):
+        with self._lock:
+            self.stats["active"] -= 1
+        self.slots.release()
+
+    def load(self, model: str) -> float:
+        """Simulate loading a model, returns the load time spent"""
+        with self._lock:
+            loaded = model in self.loaded
+            self.loaded[model] = time.time()
+        if loaded or not self.config.load_time:
+            return 0.0
+        time.sleep(self.config.load_time)
+        return self.config.load_time
+
+    def unload(self, model: str):
+        with self._lock:
+            self.loaded.pop(model, None)
+
+    def response_tokens(self, model: str, prompt: str, options: Dict) -> List[str]:
+        """Deterministic response for (model, prompt, seed option)"""
+        count = int(options.get("num_predict") or self.config.num_predict)
+        if count < 0:
+            count = self.config.num_predict
+        rng = random.Random(_seed(model, prompt, options.get("seed", self.config.seed)))
+        words = [rng.choice(WORDS) for _ in range(count)]
+        return [(" " if i else "") + word for i, word in enumerate(words)]
+
+    def generate(self, model: str, prompt: str, options: Dict) -> Iterator[Dict]:
+        """Yield (token, final_stats) pairs with realistic pacing"""
+        start = time.perf_counter()
+        load_duration = self.load(model)
+
+        prompt_start = time.perf_counter()
+        time.sleep(self.config.ttft)
+        prompt_eval_duration = time.perf_counter() - prompt_start
+
+        tokens = self.response_tokens(model, prompt, options)
+        eval_start = time.perf_counter()
+        delay = 1.0 / self.config.tokens_per_sec if self.config.tokens_per_sec > 0 else 0.0
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(delay)
+            yield token, None
+
+        eval_duration = time.perf_counter() - eval_start
+        yield None, {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - start) * NANOSECONDS),
+            "load_duration": int(load_duration * NANOSECONDS),
+            "prompt_eval_count": max(count_tokens(prompt), 1),
+            "prompt_eval_duration": int(prompt_eval_duration * NANOSECONDS),
+            "eval_count": len(tokens),
+            "eval_duration": max(int(eval_duration * NANOSECONDS), 1)
+        }
+
+    def model_info(self, model: str) -> Dict:
+        capabilities = ["completion"]
+        for prefix, caps in CAPABILITIES.items():
+            if model.startswith(prefix):
+                capabilities = caps
+        families = ["gemma3", "clip"] if "vision" in capabilities else [model.split(":")[0]]
+        return {
+            "modelfile": f"FROM {model}",
+            "parameters": "",
+            "template": "{{ .Prompt }}",
+            "details": {
+                "format": "gguf",
+                "family": families[0],
+                "families": families,
+                "parameter_size": "4B",
+                "quantization_level": "Q4_K_M"
+            },
+            "model_info": {"general.architecture": families[0]},
+            "capabilities": capabilities,
+            "modified_at": _now_iso()
+        }
+
+    def model_entry(self, model: str) -> Dict:
+        digest = hashlib.sha256(model.encode("utf-8")).hexdigest()
+        return {
+            "name": model,
+            "model": model,
+            "modified_at": _now_iso(),
+            "size": 3_300_000_000,
+            "digest": digest,
+            "details": self.model_info(model)["details"]
+        }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOllama/1.0"
+
+    @property
+    def fake(self) -> FakeOllama:
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ---------- helpers ----------
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json({"error": message}, status)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, payload: Dict):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _check_model(self, model: Optional[str]) -> bool:
+        if model in self.fake.config.models:
+            return True
+        self._send_error(404, f"model '{model}' not found")
+        return False
+
+    # ---------- routes ----------
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif path == "/api/tags":
+            self._send_json({"models": [self.fake.model_entry(m) for m in self.fake.config.models]})
+        elif path == "/api/ps":
+            expires = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+            with self.fake._lock:
+                loaded = list(self.fake.loaded)
+            self._send_json({"models": [
+                dict(self.fake.model_entry(m), expires_at=expires, size_vram=0) for m in loaded
+            ]})
+        elif path == "/stats":
+            with self.fake._lock:
+                self._send_json(dict(self.fake.stats))
+        else:
+            self._send_error(404, "not found")
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_error(400, "invalid JSON body")
+            return
+
+        routes = {
+            "/api/chat": self._chat,
+            "/api/generate": self._generate,
+            "/api/show": self._show,
+            "/api/embeddings": self._embeddings,
+            "/api/embed": self._embed
+        }
+        route = routes.get(path)
+        if route is None:
+            self._send_error(404, "not found")
+            return
+        route(payload)
+
+    def _show(self, payload: Dict):
+        model = payload.get("model") or payload.get("name")
+        if self._check_model(model):
+            self._send_json(self.fake.model_info(model))
+
+    def _embeddings(self, payload: Dict):
+        model = payload.get("model")
+        if self._check_model(model):
+            self.fake._count("requests")
+            dim = self.fake.config.embedding_dim
+            self._send_json({"embedding": fake_embedding(model, payload.get("prompt", ""), dim)})
+
+    def _embed(self, payload: Dict):
+        model = payload.get("model")
+        if not self._check_model(model):
+            return
+        self.fake._count("requests")
+        inputs = payload.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = self.fake.config.embedding_dim
+        self._send_json({
+            "model": model,
+            "embeddings": [fake_embedding(model, text, dim) for text in inputs],
+            "prompt_eval_count": sum(count_tokens(text) for text in inputs)
+        })
+
+    def _chat(self, payload: Dict):
+        messages = payload.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        self._complete(payload, prompt, lambda text: {"message": {"role": "assistant", "content": text}})
+
+    def _generate(self, payload: Dict):
+        model = payload.get("model")
+        if not payload.get("prompt") and payload.get("keep_alive") in (0, "0", "0s"):
+            # Unload request, as sent by the benchmark suite
+            if self._check_model(model):
+                self.fake.unload(model)
+                self._send_json({"model": model, "created_at": _now_iso(), "response": "",
+                                 "done": True, "done_reason": "unload"})
+            return
+        self._complete(payload, payload.get("prompt", ""), lambda text: {"response": text})
+
+    def _complete(self, payload: Dict, prompt: str, wrap):
+        """Shared streaming / non-streaming generation for chat and generate"""
+        model = payload.get("model")
+        if not self._check_model(model):
+            return
+        fake = self.fake
+        fake._count("requests")
+
+        if not fake.acquire_slot():
+            self._send_error(503, "server busy, please try again. maximum pending requests exceeded")
+            return
+        try:
+            fail = fake.should_fail()
+            if fail and fake.config.failure_mode == "error":
+                fake._count("failures")
+                self._send_error(500, "injected failure")
+                return
+
+            stream = payload.get("stream", True)
+            options = payload.get("options") or {}
+            base = {"model": model}
+            parts = []
+            if stream:
+                self._start_stream()
+
+            for i, (token, final) in enumerate(fake.generate(model, prompt, options)):
+                if final is not None:
+                    done = dict(base, created_at=_now_iso(), **wrap(""), **final)
+                    break
+                if fail and i >= 1:
+                    # Drop the connection mid-stream
+                    fake._count("failures")
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if stream:
+                    self._write_chunk(dict(base, created_at=_now_iso(), **wrap(token), done=False))
+                else:
+                    parts.append(token)
+
+            if stream:
+                self._write_chunk(done)
+                self._end_stream()
+            else:
+                done.update(wrap("".join(parts)))
+                self._send_json(done)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            fake.release_slot()
+
+
+class FakeOllamaServer:
+    """Run the fake API on a background thread.
+
+        with FakeOllamaServer(FakeOllamaConfig(ttft=0.1)) as server:
+            client = ollama.Client(host=server.url)
+    """
+
+    def __init__(self, config: FakeOllamaConfig = None, host: str = "127.0.0.1", port: int = 0,
+                 verbose: bool = False):
+        self.config = config or FakeOllamaConfig()
+        self.httpd = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = FakeOllama(self.config)
+        self.httpd.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self) -> Dict:
+        return dict(self.httpd.fake.stats)
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--models", nargs="*", default=DEFAULT_MODELS, help="Models to advertise")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Token rate after the first token")
+    parser.add_argument("--num-predict", type=int, default=64, help="Default response length in tokens")
+    parser.add_argument("--parallel", type=int, default=1, help="Requests served at once")
+    parser.add_argument("--max-queue", type=int, default=512, help="Waiting requests before 503")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Cold load delay per model")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests that fail (0-1)")
+    parser.add_argument("--failure-mode", choices=["error", "disconnect"], default="error")
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        models=args.models,
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        num_predict=args.num_predict,
+        parallel=args.parallel,
+        max_queue=args.max_queue,
+        load_time=args.load_time,
+        failure_rate=args.failure_rate,
+        failure_mode=args.failure_mode,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed
+    )
+    server = FakeOllamaServer(config, args.host, args.port, verbose=args.verbose)
+    print(f"Fake Ollama listening on {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import bisect
+import math
+import sys
+from array import array
+from datetime import datetime
+from typing import List, Dict, Optional, Iterable
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+METRIC_COLUMNS = [
+    "ttft", "load_duration", "prompt_eval_duration", "eval_duration", "total_duration",
+    "prompt_eval_count", "eval_count", "tokens_per_sec"
+]
+COLUMNS = ["timestamp", "model", "user", "assistant", "response_length", "response_time"] + METRIC_COLUMNS
+TEXT_COLUMNS = ["user", "assistant"]
+NUMERIC_COLUMNS = ["response_length", "response_time"] + METRIC_COLUMNS
+INTEGER_COLUMNS = {"response_length", "prompt_eval_count", "eval_count"}
+
+MISSING = float("nan")
+
+# Upper bounds (seconds) of the latency and TTFT histogram buckets, 10 ms to ~10 min
+# with each 15% above the last, so percentiles read from them are within 15%
+HISTOGRAM_BOUNDS = tuple(round(0.01 * 1.15 ** i, 4) for i in range(80))
+
+
+def to_epoch(timestamp) -> float:
+    """Normalize a datetime, formatted string or None (now) to epoch seconds"""
+    if timestamp is None:
+        return datetime.now().timestamp()
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return datetime.fromisoformat(timestamp).timestamp()
+
+
+def format_epoch(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch).strftime(TIMESTAMP_FORMAT)
+
+
+def from_float(col: str, value: float):
+    """Convert a stored column value back to its Python type"""
+    if math.isnan(value):
+        return None
+    return int(value) if col in INTEGER_COLUMNS else value
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not math.isnan(value)
+
+
+class LatencyHistogram:
+    """Counts of values per HISTOGRAM_BOUNDS bucket, the last bucket holds larger values"""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def add(self, value: float, count: int = 1):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += count
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the nearest-rank percentile"""
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = max(1, math.ceil(pct / 100 * total))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return HISTOGRAM_BOUNDS[min(bucket, len(HISTOGRAM_BOUNDS) - 1)]
+
+
+class ModelStats:
+    """Running aggregates for a single model"""
+
+    # Additive totals, persisted per model by the store next to the histograms
+    TOTALS = ("count", "total_length", "eval_count", "eval_duration", "prompt_eval_count")
+
+    def __init__(self):
+        self.count = 0
+        self.total_length = 0
+        self.latencies = LatencyHistogram()
+        self.ttfts = LatencyHistogram()
+        self.eval_count = 0
+        self.eval_duration = 0.0
+        self.prompt_eval_count = 0
+
+    def add(self, record: Dict):
+        self.count += 1
+        self.total_length += record.get("response_length") or 0
+        if is_number(record.get("response_time")):
+            self.latencies.add(float(record["response_time"]))
+        if is_number(record.get("ttft")):
+            self.ttfts.add(float(record["ttft"]))
+        if is_number(record.get("eval_count")) and is_number(record.get("eval_duration")):
+            self.eval_count += int(record["eval_count"])
+            self.eval_duration += record["eval_duration"]
+        if is_number(record.get("prompt_eval_count")):
+            self.prompt_eval_count += int(record["prompt_eval_count"])
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.count if self.count else 0.0
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        return self.eval_count / self.eval_duration if self.eval_duration else None
+
+    def latency(self, pct: float) -> Optional[float]:
+        return self.latencies.percentile(pct)
+
+    def ttft(self, pct: float) -> Optional[float]:
+        return self.ttfts.percentile(pct)
+
+
+class RunningStats:
+    """Chat aggregates updated on insert so reading them is constant time"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_length = 0
+        self.models: Dict[str, ModelStats] = {}
+
+    def add(self, record: Dict):
+        """Add one history record (needs model and response_length, metrics optional)"""
+        self.count += 1
+        self.total_length += record.get("response_length") or 0
+        self.models.setdefault(record.get("model") or "unknown", ModelStats()).add(record)
+
+    def add_model(self, model: str, stats: ModelStats):
+        """Add the aggregates of a model restored from the store"""
+        self.count += stats.count
+        self.total_length += stats.total_length
+        self.models[model] = stats
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.count if self.count else 0.0
+
+    def model_rows(self) -> List[Dict]:
+        """One summary row per model for display"""
+        rows = []
+        for model, stats in sorted(self.models.items()):
+            tokens_per_sec = stats.tokens_per_sec
+            rows.append({
+                "Model": model,
+                "Chats": stats.count,
+                "Avg Length (chars)": round(stats.avg_length),
+                "p50 Latency (s)": stats.latency(50),
+                "p95 Latency (s)": stats.latency(95),
+                "p99 Latency (s)": stats.latency(99),
+                "p50 TTFT (s)": stats.ttft(50),
+                "p95 TTFT (s)": stats.ttft(95),
+                "Tokens/sec": round(tokens_per_sec, 1) if tokens_per_sec else None
+            })
+        return rows
+
+
+class ChatHistory:
+    """Column-oriented chat history backed by typed arrays.
+
+    Timestamps are parsed once on insert and kept as epoch seconds, numeric
+    fields live in `array('d')` columns (NaN = missing), model names are
+    stored as small integer codes, and `stats` is updated incrementally, so
+    neither reruns nor the Analytics tab have to walk the whole history.
+    """
+
+    def __init__(self, records: Iterable[Dict] = (), stats: RunningStats = None):
+        self.timestamps = array("d")
+        self.model_codes = array("H")
+        self.model_names: List[str] = []
+        self._model_index: Dict[str, int] = {}
+        self.text = {col: [] for col in TEXT_COLUMNS}
+        self.numeric = {col: array("d") for col in NUMERIC_COLUMNS}
+
+        self.stats = stats
+        track_stats = stats is None
+        if track_stats:
+            self.stats = RunningStats()
+        for record in records:
+            self._append(record, track_stats)
+
+    def append(self, record: Dict):
+        """Add a record and update running aggregates"""
+        self._append(record, True)
+
+    def _append(self, record: Dict, track_stats: bool):
+        self.timestamps.append(to_epoch(record.get("timestamp")))
+
+        model = record.get("model") or "unknown"
+        if model not in self._model_index:
+            self._model_index[model] = len(self.model_names)
+            self.model_names.append(model)
+        self.model_codes.append(self._model_index[model])
+
+        for col in TEXT_COLUMNS:
+            self.text[col].append(record.get(col) or "")
+
+        if record.get("response_length") is None:
+            record = dict(record, response_length=len(record.get("assistant") or ""))
+        for col in NUMERIC_COLUMNS:
+            value = record.get(col)
+            self.numeric[col].append(float(value) if isinstance(value, (int, float)) else MISSING)
+
+        if track_stats:
+            self.stats.add(dict(record, model=model))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index: int) -> Dict:
+        row = {
+            "timestamp": format_epoch(self.timestamps[index]),
+            "model": self.model_names[self.model_codes[index]]
+        }
+        for col in TEXT_COLUMNS:
+            row[col] = self.text[col][index]
+        for col in NUMERIC_COLUMNS:
+            row[col] = from_float(col, self.numeric[col][index])
+        return {col: row[col] for col in COLUMNS}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tail(self, n: int) -> Dict[str, List]:
+        """Last `n` rows as a dict of columns (ready for pd.DataFrame)"""
+        start = max(0, len(self) - n) if n > 0 else len(self)
+        columns = {
+            "timestamp": [format_epoch(ts) for ts in self.timestamps[start:]],
+            "model": [self.model_names[code] for code in self.model_codes[start:]]
+        }
+        for col in TEXT_COLUMNS:
+            columns[col] = self.text[col][start:]
+        for col in NUMERIC_COLUMNS:
+            columns[col] = [from_float(col, value) for value in self.numeric[col][start:]]
+        return {col: columns[col] for col in COLUMNS}
+
+    def drop_oldest(self, n: int) -> List[Dict]:
+        """Remove the oldest `n` rows (aggregates keep them) and return them"""
+        n = min(n, len(self))
+        if n <= 0:
+            return []
+        dropped = [self[i] for i in range(n)]
+        del self.timestamps[:n]
+        del self.model_codes[:n]
+        for col in TEXT_COLUMNS:
+            del self.text[col][:n]
+        for col in NUMERIC_COLUMNS:
+            del self.numeric[col][:n]
+        return dropped
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the history, in bytes"""
+        size = sys.getsizeof(self.timestamps) + sys.getsizeof(self.model_codes)
+        size += sum(sys.getsizeof(values) for values in self.numeric.values())
+        size += sum(sys.getsizeof(name) for name in self.model_names)
+        for values in self.text.values():
+            size += sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+        return size
@@ -5,6 +5,10 @@ import numpy as np
 from colorthief import ColorThief
 import io
 import tempfile
+import time
+
+import metrics
+import tracing
 
 class ImageAnalyzer:
     def __init__(self):
@@ -19,9 +23,14 @@ class ImageAnalyzer:
             img_bytes.seek(0)
             
             # Use pytesseract
-            text = pytesseract.image_to_string(Image.open(img_bytes))
+            start = time.perf_counter()
+            with tracing.span("tesseract.ocr", width=image.width, height=image.height) as span:
+                text = pytesseract.image_to_string(Image.open(img_bytes))
+                span.set(chars=len(text))
+            metrics.OCR_DURATION.observe(time.perf_counter() - start)
             return text if text.strip() else "No text detected"
         except Exception as e:
+            metrics.EXTERNAL_ERRORS.inc(operation="ocr")
             return f"OCR Error: {str(e)}"
     
     def get_image_info(self, image):
@@ -41,8 +50,9 @@ class ImageAnalyzer:
                 image.save(tmp.name)
                 
                 # Use ColorThief
-                color_thief = ColorThief(tmp.name)
-                palette = color_thief.get_palette(color_count=5)
+                with tracing.span("colorthief.palette", width=image.width, height=image.height):
+                    color_thief = ColorThief(tmp.name)
+                    palette = color_thief.get_palette(color_count=5)
                 
                 # Convert RGB to hex
                 colors = []
@@ -0,0 +1,141 @@
+"""Peak memory of document parsing and chunking.
+
+Parses a large document (a synthetic PDF by default) once per mode, each in
+its own process so peak RSS is measured independently:
+
+    stream  open_document + iter_chunks, the pipeline used by rag.py
+    full    whole text materialized first (pages list, joined string, chunk list)
+    ingest  DocumentIndex.ingest into a temporary index (needs chromadb)
+
+    python ingest_bench.py --pages 5000
+    python ingest_bench.py manual.pdf --modes stream full ingest
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODES = ("stream", "full", "ingest")
+
+WORDS = ("error code function module request response timeout retry cache index "
+         "token model server client stream buffer page chunk vector query").split()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _pdf_string(text: str) -> str:
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def write_sample_pdf(path: str, pages: int, lines_per_page: int = 50):
+    """Write a text-only PDF page by page (no PDF library needed)"""
+    offsets = []
+    with open(path, "wb") as f:
+        def obj(number: int, body: bytes):
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for i in range(pages):
+            lines = []
+            for j in range(lines_per_page):
+                words = [WORDS[(i * 7 + j * 3 + k * k) % len(WORDS)] for k in range(12)]
+                lines.append(f"{_pdf_string(f'{i + 1}.{j + 1} ' + ' '.join(words))} Tj T*")
+            stream = ("BT /F1 9 Tf 12 TL 40 800 Td\n" + "\n".join(lines) + "\nET").encode()
+            obj(4 + 2 * i, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>").encode())
+            obj(5 + 2 * i, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for _, offset in sorted(offsets):
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def run_mode(mode: str, path: str) -> Dict:
+    """Parse `path` in this process and report peak RSS"""
+    import rag
+
+    # The upload is held in memory by Streamlit either way
+    with open(path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    name = os.path.basename(path)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == "stream":
+        chunks = characters = 0
+        for chunk in rag.iter_chunks(rag.open_document(name, upload)[1]):
+            chunks += 1
+            characters += len(chunk["text"])
+    elif mode == "full":
+        data = upload.getvalue()
+        text = rag.parse_document(name, data)
+        chunk_list = rag.chunk_text(text)
+        chunks, characters = len(chunk_list), sum(len(c) for c in chunk_list)
+    elif mode == "ingest":
+        index = rag.DocumentIndex(path=tempfile.mkdtemp(prefix="ingest-bench-"))
+        result = index.ingest("bench", name, upload)
+        chunks, characters = result["chunks"], None
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    return {
+        "mode": mode,
+        "seconds": time.perf_counter() - start,
+        "chunks": chunks,
+        "characters": characters,
+        "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS of document parsing")
+    parser.add_argument("document", nargs="?", help="Document to parse (default: a generated PDF)")
+    parser.add_argument("--pages", type=int, default=2000, help="Pages of the generated PDF")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["stream", "full"])
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.document)))
+        return
+
+    path = args.document
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="ingest-bench-"), f"sample-{args.pages}p.pdf")
+        write_sample_pdf(path, args.pages)
+    print(f"{os.path.basename(path)}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    print(f"{'mode':8} {'chunks':>8} {'seconds':>8} {'baseline MB':>12} {'peak MB':>9} {'parse MB':>9}")
+    for mode in args.modes:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), path, "--child", mode],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{mode:8} failed: {result.stderr.strip().splitlines()[-1] if result.stderr else result.returncode}")
+            continue
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{mode:8} {report['chunks']:>8} {report['seconds']:>8.2f} {report['baseline_mb']:>12.1f} "
+              f"{report['peak_mb']:>9.1f} {report['peak_mb'] - report['baseline_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""BM25 keyword search over document chunks (SQLite FTS5).
+
+Complements vector search for exact identifiers, error codes and function
+names: `_` is a token character so `get_user_id` stays one term. Each
+workspace has its own database, so BM25 term statistics only count that
+workspace's documents.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List
+
+KEYWORD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS keyword_chunks (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    chunk INTEGER,
+    page INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS keyword_fts USING fts5(
+    text,
+    tokenize = "unicode61 tokenchars '_'"
+);
+"""
+
+MAX_QUERY_TERMS = 32
+
+
+def fts_query(query: str) -> str:
+    """OR of the quoted query terms, safe to pass to MATCH"""
+    terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))[:MAX_QUERY_TERMS]
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+def workspace_filename(workspace: str) -> str:
+    """Readable, collision-free database name for a workspace"""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", workspace).strip("-._")[:40] or "default"
+    return f"{slug}-{hashlib.sha1(workspace.encode('utf-8')).hexdigest()[:8]}.db"
+
+
+class KeywordIndex:
+    """Inverted index of chunk text with BM25 ranking, one database per workspace"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._conns: Dict[str, sqlite3.Connection] = {}
+        # Raises sqlite3.OperationalError when SQLite is built without FTS5
+        probe = sqlite3.connect(":memory:")
+        try:
+            probe.executescript(KEYWORD_SCHEMA)
+        finally:
+            probe.close()
+
+    def _conn(self, workspace: str) -> sqlite3.Connection:
+        """Connection of a workspace (caller holds the lock)"""
+        conn = self._conns.get(workspace)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, workspace_filename(workspace)), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(KEYWORD_SCHEMA)
+            conn.commit()
+            self._conns[workspace] = conn
+        return conn
+
+    def add(self, workspace: str, chunks: List[Dict]):
+        """Index chunks given as {id, text, source, chunk, page}"""
+        with self._lock:
+            conn = self._conn(workspace)
+            for c in chunks:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO keyword_chunks (chunk_id, source, chunk, page) VALUES (?, ?, ?, ?)",
+                    (c["id"], c["source"], c["chunk"], c["page"])
+                )
+                if cursor.rowcount:
+                    conn.execute("INSERT INTO keyword_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, c["text"]))
+            conn.commit()
+
+    def update_positions(self, workspace: str, positions: Dict[str, Dict]):
+        """Chunk id → {chunk, page} for chunks that moved within their document"""
+        with self._lock:
+            conn = self._conn(workspace)
+            conn.executemany(
+                "UPDATE keyword_chunks SET chunk = ?, page = ? WHERE chunk_id = ?",
+                [(p["chunk"], p["page"], chunk_id) for chunk_id, p in positions.items()]
+            )
+            conn.commit()
+
+    def delete(self, workspace: str, ids: List[str]):
+        with self._lock:
+            conn = self._conn(workspace)
+            for chunk_id in ids:
+                conn.execute("DELETE FROM keyword_fts WHERE rowid IN (SELECT id FROM keyword_chunks WHERE chunk_id = ?)",
+                             (chunk_id,))
+                conn.execute("DELETE FROM keyword_chunks WHERE chunk_id = ?", (chunk_id,))
+            conn.commit()
+
+    def clear(self, workspace: str):
+        """Delete the workspace's database"""
+        with self._lock:
+            conn = self._conns.pop(workspace, None)
+            if conn is not None:
+                conn.close()
+            path = os.path.join(self.directory, workspace_filename(workspace))
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+    def clear_all(self):
+        """Delete the databases of every workspace"""
+        with self._lock:
+            for conn in self._conns.values():
+                conn.close()
+            self._conns.clear()
+            for name in os.listdir(self.directory):
+                if name.endswith((".db", ".db-wal", ".db-shm")):
+                    os.remove(os.path.join(self.directory, name))
+
+    def count(self, workspace: str) -> int:
+        with self._lock:
+            return self._conn(workspace).execute("SELECT COUNT(*) FROM keyword_chunks").fetchone()[0]
+
+    def search(self, workspace: str, query: str, k: int) -> List[Dict]:
+        """Top-k chunks by BM25 (higher score is better)"""
+        match = fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn(workspace).execute(
+                "SELECT c.chunk_id, f.text, c.source, c.chunk, c.page, bm25(keyword_fts) AS rank "
+                "FROM keyword_fts f JOIN keyword_chunks c ON c.id = f.rowid "
+                "WHERE keyword_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, k)
+            ).fetchall()
+        return [
+            {"id": chunk_id, "text": text, "source": source, "chunk": chunk, "page": page, "score": -rank}
+            for chunk_id, text, source, chunk, page, rank in rows
+        ]
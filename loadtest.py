@@ -0,0 +1,341 @@
+"""Headless multi-session load test for app.py.
+
+Drives N simulated Streamlit sessions (streamlit.testing AppTest, all in this
+process like real sessions of one server) through chat turns, plugin calls,
+collaboration messages and OCR against fake_ollama.py, then reports
+throughput, rerun latency percentiles and CPU / RSS per session.
+
+    python loadtest.py --sessions 8 --turns 10
+    python loadtest.py --sessions 8 --save-baseline laptop
+    python loadtest.py --sessions 8 --compare laptop
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from history import percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(ROOT, "app.py")
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+
+# Flow → share of session actions
+FLOW_WEIGHTS = {
+    "chat": 0.6,
+    "plugin": 0.2,
+    "collab": 0.1,
+    "ocr": 0.1
+}
+
+PROMPTS = [
+    "Summarize the benefits of running models locally.",
+    "Write a haiku about latency.",
+    "Explain what a context window is in two sentences.",
+    "List three ways to speed up a Python web app."
+]
+
+# Reported metric → True when higher is better (used for baseline comparison)
+COMPARED_METRICS = {
+    "reruns_per_sec": True,
+    "chat_turns_per_sec": True,
+    "rerun_p50": False,
+    "rerun_p95": False,
+    "chat_p95": False,
+    "cpu_sec_per_session": False,
+    "rss_mb_per_session": False
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> Optional[float]:
+    """Current RSS of this process (psutil), else peak RSS"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def start_fake_ollama(args) -> subprocess.Popen:
+    """Run the fake server in its own process so its CPU is not counted"""
+    command = [
+        sys.executable, os.path.join(ROOT, "fake_ollama.py"),
+        "--port", str(args.fake_port),
+        "--ttft", str(args.ttft),
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--num-predict", str(args.num_predict),
+        "--parallel", str(args.parallel),
+        "--failure-rate", str(args.failure_rate)
+    ]
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.fake_port}/"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("fake_ollama.py did not start")
+
+
+class SessionDriver:
+    """One simulated browser session"""
+
+    def __init__(self, index: int, seed: int, timeout: float):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.rng = random.Random(seed + index)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.reruns: List[float] = []
+        self.flows: Dict[str, List[float]] = {name: [] for name in FLOW_WEIGHTS}
+        self.errors = 0
+        self.collab_started = False
+        self._image = None
+
+    def _run(self, action=None) -> float:
+        start = time.perf_counter()
+        (action or self.app).run()
+        elapsed = time.perf_counter() - start
+        self.reruns.append(elapsed)
+        if self.app.exception:
+            self.errors += 1
+        return elapsed
+
+    def _button(self, label: str):
+        return next(b for b in self.app.button if b.label == label)
+
+    def open(self):
+        self._run()
+
+    def chat(self) -> float:
+        prompt = self.rng.choice(PROMPTS)
+        return self._run(self.app.chat_input(key="chat_input").set_value(prompt))
+
+    def plugin(self) -> float:
+        self.app.text_area(key="code_input").set_value("def add(a, b): return a + b")
+        return self._run(self.app.button(key="code_help").click())
+
+    def collab(self) -> float:
+        elapsed = 0.0
+        if not self.collab_started:
+            elapsed += self._run(self._button("🆕 Create Session").click())
+            self.collab_started = True
+        self.app.text_input(key="collab_input").set_value(f"note {self.rng.randint(1, 999)}")
+        return elapsed + self._run(self.app.button(key="collab_send").click())
+
+    def ocr(self) -> Optional[float]:
+        """AppTest cannot upload files, so time the analyzer the Vision tab calls"""
+        try:
+            from PIL import Image, ImageDraw
+            from image_processor import ImageAnalyzer
+        except ImportError:
+            return None
+        if self._image is None:
+            self._image = Image.new("RGB", (400, 120), "white")
+            ImageDraw.Draw(self._image).text((10, 50), "Load test invoice 42", fill="black")
+            self.analyzer = ImageAnalyzer()
+        start = time.perf_counter()
+        self.analyzer.extract_text(self._image)
+        return time.perf_counter() - start
+
+    def run_flows(self, turns: int, think_time: float):
+        names = list(FLOW_WEIGHTS)
+        weights = list(FLOW_WEIGHTS.values())
+        for _ in range(turns):
+            flow = self.rng.choices(names, weights)[0]
+            try:
+                elapsed = getattr(self, flow)()
+            except Exception:
+                self.errors += 1
+                continue
+            if elapsed is not None:
+                self.flows[flow].append(elapsed)
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+
+
+def summarize(values: List[float]) -> Dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99)
+    }
+
+
+def run_load(args) -> Dict:
+    """Run all sessions concurrently and collect the report"""
+    # Warm up once so module imports and shared caches are not charged to the sessions
+    SessionDriver(-1, args.seed, args.timeout).open()
+
+    drivers = [SessionDriver(i, args.seed, args.timeout) for i in range(args.sessions)]
+    rss_before = rss_mb()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+
+    def session(driver: SessionDriver):
+        try:
+            driver.open()
+            driver.run_flows(args.turns, args.think_time)
+        except Exception:
+            driver.errors += 1
+
+    threads = [threading.Thread(target=session, args=(d,)) for d in drivers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    rss_after = rss_mb()
+
+    reruns = [t for d in drivers for t in d.reruns]
+    flows = {name: [t for d in drivers for t in d.flows[name]] for name in FLOW_WEIGHTS}
+    rerun_stats = summarize(reruns)
+    chat_stats = summarize(flows["chat"])
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "think_time": args.think_time,
+            "ttft": args.ttft,
+            "tokens_per_sec": args.tokens_per_sec,
+            "num_predict": args.num_predict,
+            "parallel": args.parallel,
+            "failure_rate": args.failure_rate,
+            "seed": args.seed
+        },
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count()
+        },
+        "elapsed_sec": elapsed,
+        "reruns_per_sec": len(reruns) / elapsed if elapsed else 0,
+        "chat_turns_per_sec": len(flows["chat"]) / elapsed if elapsed else 0,
+        "rerun_p50": rerun_stats["p50"],
+        "rerun_p95": rerun_stats["p95"],
+        "rerun_p99": rerun_stats["p99"],
+        "chat_p95": chat_stats["p95"],
+        "flows": {name: summarize(values) for name, values in flows.items()},
+        "errors": sum(d.errors for d in drivers),
+        "cpu_sec_per_session": cpu / args.sessions,
+        "rss_mb_per_session": (rss_after - rss_before) / args.sessions if rss_before is not None else None,
+        "rss_mb": rss_after
+    }
+
+
+def print_report(report: Dict):
+    def fmt(value):
+        return f"{value * 1000:8.0f} ms" if value is not None else "       n/a"
+
+    config = report["config"]
+    print(f"\n{config['sessions']} sessions x {config['turns']} actions in {report['elapsed_sec']:.1f}s "
+          f"({report['errors']} errors)")
+    print(f"throughput: {report['reruns_per_sec']:.2f} reruns/s, {report['chat_turns_per_sec']:.2f} chat turns/s")
+    print(f"rerun latency: p50 {fmt(report['rerun_p50'])}  p95 {fmt(report['rerun_p95'])}  p99 {fmt(report['rerun_p99'])}")
+    for name, stats in report["flows"].items():
+        print(f"  {name:7} n={stats['count']:<4} p50 {fmt(stats['p50'])}  p95 {fmt(stats['p95'])}")
+    rss = report["rss_mb_per_session"]
+    rss_text = f"{rss:.1f} MB RSS" if rss is not None else "n/a MB RSS"
+    print(f"per session: {report['cpu_sec_per_session']:.2f} CPU s, {rss_text}")
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(report: Dict, name: str):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved baseline {baseline_path(name)}")
+
+
+def compare(report: Dict, name: str, tolerance: float) -> bool:
+    """Print deltas against a saved baseline, False when a metric regressed"""
+    with open(baseline_path(name)) as f:
+        baseline = json.load(f)
+    if baseline["config"] != report["config"]:
+        print("⚠️ Baseline was recorded with a different configuration")
+
+    ok = True
+    print(f"\nvs baseline '{name}' ({baseline['created']}):")
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), report.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        ok = ok and not regressed
+        print(f"  {metric:22} {old:10.3f} → {new:10.3f}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py with simulated sessions")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=10, help="Actions per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between actions (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-rerun timeout (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--num-predict", type=int, default=32)
+    parser.add_argument("--parallel", type=int, default=4, help="Fake Ollama parallel slots")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--fake-port", type=int, default=0, help="Fake Ollama port (default: any free port)")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+    args.fake_port = args.fake_port or free_port()
+
+    fake = start_fake_ollama(args)
+    data_dir = tempfile.TemporaryDirectory(prefix="loadtest-")
+    # Read by app.py / storage.py / metrics.py when the sessions import them
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{args.fake_port}"
+    os.environ["DATA_DIR"] = data_dir.name
+    os.environ["METRICS_PORT"] = "0"
+
+    try:
+        report = run_load(args)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    print_report(report)
+    if args.save_baseline:
+        save_baseline(report, args.save_baseline)
+    if args.compare and not compare(report, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
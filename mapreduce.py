@@ -0,0 +1,207 @@
+"""Map-reduce analysis of whole documents.
+
+The document is cut into pieces that fit the model's context, every piece is
+summarized for the task concurrently (at most `slots` requests in flight,
+matching Ollama's OLLAMA_NUM_PARALLEL), and the notes are merged level by
+level until they fit one final prompt.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import packing
+import tracing
+
+DEFAULT_SLOTS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "") or 4)  # concurrent requests the server serves
+MIN_PIECE_CHARS = 500
+
+MAP_PROMPT = (
+    "You are reading part {part} of the file \"{name}\".\n"
+    "Task: {task}\n\n"
+    "Write concise notes with everything in this part that matters for the task "
+    "(facts, numbers, names, errors, open questions). Reply \"nothing relevant\" if there is nothing.\n\n"
+    "--- part {part} ---\n{text}"
+)
+REDUCE_PROMPT = (
+    "Task: {task}\n\n"
+    "Below are notes taken from consecutive parts of the file \"{name}\". "
+    "Merge them into one set of notes, keeping every detail relevant to the task and removing repetition.\n\n"
+    "{text}"
+)
+FINAL_PROMPT = (
+    "Task: {task}\n\n"
+    "Below are notes covering the whole file \"{name}\". Using only these notes, complete the task.\n\n"
+    "{text}"
+)
+
+ChatFn = Callable[[List[Dict]], Tuple[str, Dict]]
+
+
+def piece_chars(num_ctx: int, task: str = "") -> int:
+    """Characters of document text that fit one map prompt"""
+    template_tokens = packing.estimate_tokens(MAP_PROMPT + task) + 64
+    return max(MIN_PIECE_CHARS, int(packing.context_budget(num_ctx, template_tokens) * packing.CHARS_PER_TOKEN))
+
+
+def split_document(paragraphs: Iterable[Tuple[int, str]], size: int) -> Iterator[str]:
+    """Pieces of at most `size` characters from a (page, paragraph) stream"""
+    current: List[str] = []
+    length = 0
+    for _, paragraph in paragraphs:
+        while len(paragraph) > size:
+            # Prefer line breaks so CSV rows and code lines stay whole
+            cut = paragraph.rfind("\n", 0, size)
+            if cut <= size // 2:
+                cut = paragraph.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            if current:
+                yield "\n\n".join(current)
+                current, length = [], 0
+            yield paragraph[:cut]
+            paragraph = paragraph[cut:].lstrip()
+        if current and length + len(paragraph) > size:
+            yield "\n\n".join(current)
+            current, length = [], 0
+        if paragraph:
+            current.append(paragraph)
+            length += len(paragraph) + 2
+    if current:
+        yield "\n\n".join(current)
+
+
+class MapReduce:
+    """Runs one whole-document analysis; `progress` gets {stage, done, total, level}"""
+
+    def __init__(self, chat: ChatFn, num_ctx: int, slots: int = DEFAULT_SLOTS,
+                 progress: Callable[[Dict], None] = None):
+        self.chat = chat
+        self.num_ctx = num_ctx
+        self.slots = max(1, slots)
+        self.progress = progress
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _ask(self, prompt: str) -> str:
+        content, result = self.chat([{"role": "user", "content": prompt}])
+        with self._lock:
+            self.prompt_tokens += result.get("prompt_eval_count") or 0
+            self.completion_tokens += result.get("eval_count") or 0
+        return content
+
+    def _report(self, **progress):
+        if self.progress:
+            self.progress(progress)
+
+    def _run_all(self, prompts: Iterable[str], stage: str, total: Optional[int], level: int = 0) -> List[str]:
+        """Answers to `prompts` in order, at most `slots` requests in flight.
+
+        Prompts are pulled lazily, so a streamed document is never held whole.
+        A failed request leaves a note instead of aborting the analysis.
+        """
+        results: Dict[int, str] = {}
+        prompts = iter(prompts)
+        with ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="mapreduce") as pool:
+            pending = {}
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < self.slots:
+                    prompt = next(prompts, None)
+                    if prompt is None:
+                        exhausted = True
+                        break
+                    index = len(results) + len(pending)
+                    # Copy the context so the Ollama spans nest under this stage
+                    future = pool.submit(contextvars.copy_context().run, self._ask, prompt)
+                    pending[future] = index
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    self.calls += 1
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        self.errors += 1
+                        results[index] = f"[part {index + 1} could not be analyzed: {e}]"
+                    self._report(stage=stage, done=len(results), total=total, level=level)
+        return [results[i] for i in range(len(results))]
+
+    def _groups(self, notes: List[str], budget: int) -> List[List[str]]:
+        """Consecutive notes packed into groups that fit one reduce prompt"""
+        groups: List[List[str]] = []
+        current: List[str] = []
+        used = 0
+        for note in notes:
+            tokens = packing.estimate_tokens(note) + 8
+            if current and (used + tokens > budget):
+                groups.append(current)
+                current, used = [], 0
+            current.append(note)
+            used += tokens
+        if current:
+            groups.append(current)
+        if len(groups) == len(notes) and len(notes) > 1:
+            # Every note alone fills the budget: still merge pairwise so the levels converge
+            groups = [notes[i:i + 2] for i in range(0, len(notes), 2)]
+        return groups
+
+    @staticmethod
+    def _numbered(notes: List[str]) -> str:
+        return "\n\n".join(f"--- notes {i} ---\n{note}" for i, note in enumerate(notes, 1))
+
+    def run(self, pieces: Iterable[str], task: str, name: str, parts: Optional[int] = None) -> Dict:
+        """Analyze all pieces (`parts` is only the expected count for progress).
+
+        Returns {answer, pieces, levels, calls, errors, timings, elapsed,
+        prompt_tokens, completion_tokens}.
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        with tracing.span("mapreduce", document=name, slots=self.slots) as span:
+            stage_start = time.perf_counter()
+            with tracing.span("mapreduce.map"):
+                prompts = (
+                    MAP_PROMPT.format(part=i, name=name, task=task, text=text)
+                    for i, text in enumerate(pieces, 1)
+                )
+                notes = self._run_all(prompts, "map", parts)
+            timings["map"] = time.perf_counter() - stage_start
+            piece_count = len(notes)
+
+            budget = packing.context_budget(self.num_ctx, packing.estimate_tokens(REDUCE_PROMPT + task) + 64)
+            level = 0
+            while len(notes) > 1 and sum(packing.estimate_tokens(n) + 8 for n in notes) > budget:
+                level += 1
+                stage_start = time.perf_counter()
+                groups = self._groups(notes, budget)
+                with tracing.span("mapreduce.reduce", level=level, groups=len(groups)):
+                    prompts = [REDUCE_PROMPT.format(task=task, name=name, text=self._numbered(group)) for group in groups]
+                    notes = self._run_all(prompts, "reduce", len(prompts), level)
+                timings[f"reduce {level}"] = time.perf_counter() - stage_start
+
+            stage_start = time.perf_counter()
+            self._report(stage="final", done=0, total=1, level=level + 1)
+            with tracing.span("mapreduce.final"):
+                answer = self._ask(FINAL_PROMPT.format(task=task, name=name, text=self._numbered(notes)))
+            self.calls += 1
+            timings["final"] = time.perf_counter() - stage_start
+            span.set(pieces=piece_count, levels=level, calls=self.calls, errors=self.errors)
+
+        return {
+            "answer": answer,
+            "pieces": piece_count,
+            "levels": level,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timings": timings,
+            "elapsed": time.perf_counter() - start,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
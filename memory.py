@@ -0,0 +1,215 @@
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from storage import DATA_DIR
+
+SPILL_DIR = os.path.join(DATA_DIR, "spill")  # evicted items were written here by earlier versions
+
+# Cap name → default maximum number of items kept in session state
+DEFAULT_CAPS = {
+    "messages": 500,
+    "chat_history": 2000,
+    "favorites": 200,
+    "audio_history": 50,
+    "collab_sessions": 10,
+    "collab_messages": 500
+}
+
+MEASURE_INTERVAL = 10  # seconds between automatic measurements of a session
+SESSION_REPORT_WINDOW = 600  # drop sessions not measured for this long
+
+_SKIP_TYPES = (type, type(sys), type(len), type(lambda: None))
+
+
+def _special_size(obj) -> Optional[int]:
+    """Size of objects whose payload is not reachable through attributes"""
+    if isinstance(obj, (bytes, bytearray, str)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, memoryview):
+        return sys.getsizeof(obj) + obj.nbytes
+    if isinstance(obj, io.BytesIO):
+        # Includes the buffer; also covers Streamlit's UploadedFile
+        return sys.getsizeof(obj)
+    nbytes = getattr(obj, "nbytes", None)
+    if callable(nbytes):
+        nbytes = nbytes()  # e.g. ChatHistory
+    if isinstance(nbytes, int):
+        return sys.getsizeof(obj) + nbytes  # numpy arrays
+    if type(obj).__module__.startswith("PIL.") and hasattr(obj, "size") and hasattr(obj, "getbands"):
+        width, height = obj.size
+        return sys.getsizeof(obj) + width * height * len(obj.getbands())
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and type(obj).__module__.startswith("pandas."):
+        usage = memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    return None
+
+
+def deep_sizeof(obj, seen: set = None) -> int:
+    """Approximate bytes reachable from `obj`, counting shared objects once"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SKIP_TYPES):
+            continue
+        seen.add(id(item))
+
+        special = _special_size(item)
+        if special is not None:
+            total += special
+            continue
+
+        try:
+            total += sys.getsizeof(item)
+        except TypeError:
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        else:
+            attributes = getattr(item, "__dict__", None)
+            if isinstance(attributes, dict):
+                stack.append(attributes)
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    stack.append(getattr(item, slot))
+    return total
+
+
+def session_usage(state) -> List[Dict]:
+    """Per-key size of a session state, largest first"""
+    rows = []
+    seen = set()
+    for key in list(state.keys()):
+        try:
+            value = state[key]
+        except KeyError:
+            continue
+        rows.append({
+            "key": str(key),
+            "type": type(value).__name__,
+            "items": len(value) if hasattr(value, "__len__") and not isinstance(value, (str, bytes)) else None,
+            "bytes": deep_sizeof(value, seen)
+        })
+    return sorted(rows, key=lambda row: row["bytes"], reverse=True)
+
+
+# ---------- caps ----------
+
+def clear_spill():
+    """Delete evicted items left on disk by earlier versions"""
+    shutil.rmtree(SPILL_DIR, ignore_errors=True)
+
+
+def _trim_list(values: list, cap: int) -> List:
+    """Remove and return the oldest items beyond `cap`"""
+    excess = len(values) - cap if cap else 0
+    if excess <= 0:
+        return []
+    evicted = values[:excess]
+    del values[:excess]
+    return evicted
+
+
+def enforce_caps(state, caps: Dict[str, int]) -> Dict[str, int]:
+    """Evict the oldest items beyond each cap, returns evicted counts per cap.
+
+    Evicted chats remain in the conversation store when history storage is
+    on; when it is off they are gone, as the user asked for nothing to be kept.
+    """
+    evicted = {}
+
+    def drop(name: str, items: List):
+        if items:
+            evicted[name] = len(items)
+
+    messages = state.get("messages")
+    if isinstance(messages, list) and caps.get("messages"):
+        dropped = _trim_list(messages, caps["messages"])
+        if dropped:
+            # Keep the store's "already persisted" cursor in step with the list
+            state["persisted_messages"] = max(0, state.get("persisted_messages", 0) - len(dropped))
+        drop("messages", dropped)
+
+    history = state.get("chat_history")
+    cap = caps.get("chat_history")
+    if history is not None and cap and len(history) > cap and hasattr(history, "drop_oldest"):
+        drop("chat_history", history.drop_oldest(len(history) - cap))
+
+    favorites = state.get("favorites")
+    if isinstance(favorites, list) and caps.get("favorites"):
+        drop("favorites", _trim_list(favorites, caps["favorites"]))
+
+    audio = state.get("audio_processor")
+    if audio is not None and isinstance(getattr(audio, "history", None), list) and caps.get("audio_history"):
+        # Recordings are temp files on disk already, only the entries are dropped
+        drop("audio_history", _trim_list(audio.history, caps["audio_history"]))
+
+    collab = state.get("collab_session")
+    sessions = getattr(collab, "sessions", None)
+    if isinstance(sessions, dict):
+        cap = caps.get("collab_sessions")
+        if cap and len(sessions) > cap:
+            candidates = [sid for sid in sessions if sid != collab.active_session]
+            removed = [sessions.pop(sid) for sid in candidates[:len(sessions) - cap]]
+            drop("collab_sessions", removed)
+        cap = caps.get("collab_messages")
+        if cap:
+            dropped = []
+            for session in sessions.values():
+                dropped.extend(_trim_list(session.get("messages", []), cap))
+            drop("collab_messages", dropped)
+
+    return evicted
+
+
+# ---------- process-wide report ----------
+
+_lock = threading.Lock()
+_sessions: Dict[str, Dict] = {}
+
+
+def record_session(session_id: str, state, workspace: str = None, force: bool = False,
+                   usage: List[Dict] = None) -> Optional[Dict]:
+    """Measure a session (at most every MEASURE_INTERVAL seconds) for the process report.
+
+    Pass `usage` from session_usage() to record a measurement already taken.
+    """
+    now = time.time()
+    with _lock:
+        previous = _sessions.get(session_id)
+    if previous and not force and usage is None and now - previous["measured"] < MEASURE_INTERVAL:
+        return previous
+
+    if usage is None:
+        usage = session_usage(state)
+    entry = {
+        "session": session_id,
+        "workspace": workspace,
+        "bytes": sum(row["bytes"] for row in usage),
+        "largest_key": usage[0]["key"] if usage else None,
+        "measured": now
+    }
+    with _lock:
+        _sessions[session_id] = entry
+    return entry
+
+
+def largest_sessions(n: int = 10) -> List[Dict]:
+    """Most memory-hungry sessions measured recently in this process"""
+    cutoff = time.time() - SESSION_REPORT_WINDOW
+    with _lock:
+        for session_id in [s for s, entry in _sessions.items() if entry["measured"] < cutoff]:
+            del _sessions[session_id]
+        entries = list(_sessions.values())
+    return sorted(entries, key=lambda entry: entry["bytes"], reverse=True)[:n]
@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464") or 0)
+# Unauthenticated, so loopback only unless a deployment opts in (e.g. METRICS_HOST=0.0.0.0 in a container)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+ACTIVE_SESSION_WINDOW = 600  # seconds since last rerun for a session to count as active
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_lock = threading.Lock()
+_registry: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for a labelled metric family"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[Tuple[str, str], ...]:
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic counter, exposed as <name>_total"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        return [f"{self.name}_total{_format_labels(key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self, openmetrics: bool) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return lines
+
+
+# ---------- application metrics ----------
+
+REQUESTS = Counter("ollama_requests", "Ollama requests by model and endpoint", ("model", "endpoint"))
+ERRORS = Counter("ollama_request_errors", "Failed Ollama requests by model", ("model", "endpoint"))
+TTFT = Histogram("ollama_ttft_seconds", "Time to first token", ("model",))
+GENERATION = Histogram("ollama_generation_seconds", "Wall time of a full generation", ("model",))
+TOKENS = Counter("ollama_generated_tokens", "Tokens generated by model", ("model",))
+IN_FLIGHT = Gauge("ollama_requests_in_flight", "Ollama requests sent by this process and not yet finished")
+OCR_DURATION = Histogram("ocr_duration_seconds", "Tesseract OCR duration")
+TRANSCRIPTION_DURATION = Histogram("transcription_duration_seconds", "Speech recognition duration")
+EXTERNAL_ERRORS = Counter("external_call_errors", "Failed OCR / speech / TTS calls", ("operation",))
+RETRIEVAL_STAGE = Histogram("rag_retrieval_stage_seconds", "Document retrieval time per stage", ("stage",))
+RETRIEVAL_TOKENS = Histogram("rag_context_tokens", "Estimated prompt tokens added by document context",
+                             buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192))
+RETRIEVAL_CACHE = Counter("rag_retrieval_cache_lookups", "Retrieval cache lookups by cache (results, embedding) and result",
+                          ("cache", "result"))
+ACTIVE_SESSIONS = Gauge("streamlit_active_sessions", f"Sessions with a rerun in the last {ACTIVE_SESSION_WINDOW}s")
+
+_session_last_seen: Dict[str, float] = {}
+
+
+def touch_session(session_id: str):
+    """Record activity for a Streamlit session"""
+    with _lock:
+        _session_last_seen[session_id] = time.time()
+
+
+def _update_active_sessions():
+    cutoff = time.time() - ACTIVE_SESSION_WINDOW
+    with _lock:
+        for session_id in [s for s, seen in _session_last_seen.items() if seen < cutoff]:
+            del _session_last_seen[session_id]
+        count = len(_session_last_seen)
+    ACTIVE_SESSIONS.set(count)
+
+
+def render(openmetrics: bool = False) -> str:
+    """All metrics in Prometheus text format (or OpenMetrics)"""
+    _update_active_sessions()
+    lines = []
+    with _lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        family = metric.name
+        if metric.kind == "counter" and not openmetrics:
+            family += "_total"
+        lines.append(f"# HELP {family} {metric.documentation}")
+        lines.append(f"# TYPE {family} {metric.kind}")
+        with _lock:
+            lines.extend(metric.samples(openmetrics))
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- HTTP listener ----------
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Start the /metrics listener once per process; port 0 disables it"""
+    global _server, _server_started
+    with _server_lock:
+        if _server_started or not port:
+            return _server
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint disabled: {e}")
+            return None
+        thread = threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True)
+        thread.start()
+        return _server
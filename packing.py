@@ -0,0 +1,171 @@
+"""Token-budget packing of retrieved chunks into the prompt.
+
+Adjacent chunks of a document are merged into one passage (dropping the
+overlap they share), near-duplicate passages are removed with maximal
+marginal relevance, and the rest are added by relevance until the token
+budget left in `num_ctx` is used up, truncating the last passage to fit.
+"""
+import math
+import re
+from typing import Dict, List
+
+CHARS_PER_TOKEN = 3.5    # conservative estimate (no tokenizer API in Ollama)
+MMR_LAMBDA = 0.7         # relevance vs novelty when picking passages
+DUPLICATE_SIMILARITY = 0.8  # word-set Jaccard above which a passage is a near-duplicate
+MIN_PASSAGE_TOKENS = 48  # don't bother adding a truncated passage smaller than this
+RESPONSE_RESERVE = 0.25  # share of num_ctx kept free for the answer (at most MAX_RESPONSE_RESERVE)
+MAX_RESPONSE_RESERVE = 1024
+MIN_OVERLAP = 8          # shortest repeated text accepted as chunk overlap
+MAX_OVERLAP = 400
+
+CONTEXT_HEADER = (
+    "Answer using the document excerpts below when they are relevant and cite them as [n]. "
+    "If they do not contain the answer, say so and answer from general knowledge.\n\n"
+)
+
+
+def estimate_tokens(text: str, chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def message_tokens(messages: List[Dict], chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    """Estimated prompt tokens of chat messages, with a few tokens of template per message"""
+    return sum(estimate_tokens(m["content"], chars_per_token) + 4 for m in messages)
+
+
+def context_budget(num_ctx: int, conversation_tokens: int) -> int:
+    """Tokens left for retrieved context after the conversation and the answer reserve"""
+    reserve = min(MAX_RESPONSE_RESERVE, int(num_ctx * RESPONSE_RESERVE))
+    return max(0, num_ctx - reserve - conversation_tokens)
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """Concatenate neighbouring chunks, dropping the text `second` repeats from `first`"""
+    for size in range(min(len(first), len(second), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
+
+
+def merge_adjacent(chunks: List[Dict]) -> List[Dict]:
+    """Merge chunks that are neighbours in the same document into passages.
+
+    A passage keeps the best score of its chunks and lists them in `chunks`.
+    """
+    by_source: Dict[str, List[Dict]] = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk["source"], []).append(chunk)
+    passages = []
+    for source, items in by_source.items():
+        items = sorted(items, key=lambda c: c["chunk"])
+        current = None
+        for chunk in items:
+            if current and chunk["chunk"] == current["chunks"][-1] + 1:
+                current["text"] = _join_overlapping(current["text"], chunk["text"])
+                current["chunks"].append(chunk["chunk"])
+                current["score"] = max(current["score"], chunk["score"])
+                continue
+            current = dict(chunk, chunks=[chunk["chunk"]])
+            passages.append(current)
+    return sorted(passages, key=lambda p: p["score"], reverse=True)
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def _similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def select_mmr(passages: List[Dict], mmr_lambda: float = MMR_LAMBDA,
+               duplicate: float = DUPLICATE_SIMILARITY) -> List[Dict]:
+    """Order passages by maximal marginal relevance, dropping near-duplicates"""
+    if not passages:
+        return []
+    top = max(p["score"] for p in passages) or 1.0
+    candidates = [(p, p["score"] / top, _words(p["text"])) for p in passages]
+    selected = []
+    while candidates:
+        best = None
+        for i, (passage, relevance, words) in enumerate(candidates):
+            redundancy = max((_similarity(words, chosen) for _, chosen in selected), default=0.0)
+            if redundancy >= duplicate:
+                continue
+            value = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+            if best is None or value > best[0]:
+                best = (value, i)
+        if best is None:
+            break  # everything left duplicates a selected passage
+        passage, _, words = candidates.pop(best[1])
+        selected.append((passage, words))
+    return [passage for passage, _ in selected]
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut at the last sentence (or word) boundary before `max_chars`"""
+    if len(text) <= max_chars:
+        return text
+    cut = max(text.rfind(". ", 0, max_chars), text.rfind("\n", 0, max_chars))
+    if cut < max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    return text[:cut + 1 if cut > 0 else max_chars].rstrip() + " …"
+
+
+def _section(n: int, passage: Dict) -> str:
+    chunks = passage.get("chunks") or [passage["chunk"]]
+    if passage.get("page"):
+        location = f"page {passage['page']}"
+    elif len(chunks) > 1:
+        location = f"chunks {chunks[0]}-{chunks[-1]}"
+    else:
+        location = f"chunk {chunks[0]}"
+    return f"[{n}] {passage['source']} ({location})\n{passage['text']}"
+
+
+def build_context(passages: List[Dict]) -> str:
+    """System prompt with the passages and their sources"""
+    return CONTEXT_HEADER + "\n\n".join(_section(n, p) for n, p in enumerate(passages, 1))
+
+
+def pack_context(chunks: List[Dict], budget_tokens: int, chars_per_token: float = CHARS_PER_TOKEN) -> Dict:
+    """Fit retrieved chunks into `budget_tokens`.
+
+    Returns {passages, content, tokens, merged, duplicates, dropped, truncated}
+    where `content` is the system prompt ("" when nothing fits) and `tokens`
+    its estimated size.
+    """
+    passages = merge_adjacent(chunks)
+    merged = len(chunks) - len(passages)
+    ranked = select_mmr(passages)
+    duplicates = len(passages) - len(ranked)
+
+    packed: List[Dict] = []
+    used = estimate_tokens(CONTEXT_HEADER, chars_per_token)
+    truncated = False
+    for passage in ranked:
+        section_tokens = estimate_tokens(_section(len(packed) + 1, passage), chars_per_token) + 1
+        if used + section_tokens <= budget_tokens:
+            packed.append(passage)
+            used += section_tokens
+            continue
+        # Fill the rest of the budget with the head of this passage
+        header_tokens = section_tokens - estimate_tokens(passage["text"], chars_per_token)
+        room = budget_tokens - used - header_tokens
+        if room >= MIN_PASSAGE_TOKENS:
+            text = _truncate(passage["text"], int(room * chars_per_token) - 2)
+            packed.append(dict(passage, text=text))
+            used += estimate_tokens(_section(len(packed), packed[-1]), chars_per_token) + 1
+            truncated = True
+        break
+
+    content = build_context(packed) if packed else ""
+    return {
+        "passages": packed,
+        "content": content,
+        "tokens": estimate_tokens(content, chars_per_token),
+        "merged": merged,
+        "duplicates": duplicates,
+        "dropped": len(ranked) - len(packed),
+        "truncated": truncated
+    }
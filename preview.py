@@ -0,0 +1,177 @@
+"""Paginated previews of uploaded documents.
+
+The extracted text is written once to a temporary file while character,
+word and line counts are taken in the same pass; pages are then read from a
+memory map of that file, so only the visible window is decoded. Previews are
+cached per file hash and the oldest are evicted; an evicted preview keeps its
+file until no session holds it any more.
+"""
+import atexit
+import io
+import itertools
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import BinaryIO, Dict, Iterator, Union
+
+import rag
+
+PAGE_CHARS = 5000        # characters per preview page (pages break at line ends when possible)
+PREVIEW_CACHE_SIZE = 8   # files kept extracted on disk
+
+WORD = re.compile(r"\S+")
+
+_cache: "OrderedDict[str, DocumentPreview]" = OrderedDict()
+_cache_lock = threading.Lock()
+_loading: Dict[str, Future] = {}  # key → extraction in progress
+_file_numbers = itertools.count()
+_directory = None
+
+
+def _temp_directory() -> str:
+    global _directory
+    if _directory is None:
+        _directory = tempfile.mkdtemp(prefix="preview-")
+        atexit.register(shutil.rmtree, _directory, True)
+    return _directory
+
+
+def _extension(name: str) -> str:
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def _segments(name: str, source: Union[bytes, BinaryIO]) -> Iterator[tuple]:
+    """(page, text) pieces of an upload, at most PAGE_CHARS each, in file order"""
+    if _extension(name) in ("pdf", "docx"):
+        _, paragraphs = rag.open_document(name, source)
+        pieces = ((page, paragraph + "\n\n") for page, paragraph in paragraphs)
+    else:
+        # Plain text keeps its own line breaks
+        stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        stream.seek(0)
+
+        def text_lines():
+            lines = io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline=None)
+            try:
+                yield from ((0, line) for line in lines)
+            finally:
+                lines.detach()  # leave the upload open
+
+        pieces = text_lines()
+    for page, text in pieces:
+        for start in range(0, len(text), PAGE_CHARS):
+            yield page, text[start:start + PAGE_CHARS]
+
+
+def _release(mapped, path: str):
+    if mapped is not None:
+        mapped.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class DocumentPreview:
+    """Extracted text of one upload on disk, with page offsets and statistics"""
+
+    def __init__(self, name: str, source: Union[bytes, BinaryIO], path: str, key: str = None):
+        self.name = name
+        self.path = path
+        self.key = key or os.path.basename(path)
+        self.offsets = [0]
+        characters = words = lines = pages = 0
+        page_chars = 0
+        last = "\n"
+        try:
+            with open(self.path, "wb") as f:
+                # Single pass: the text is counted while it is written out
+                for page, text in _segments(name, source):
+                    if page_chars and page_chars + len(text) > PAGE_CHARS:
+                        self.offsets.append(f.tell())
+                        page_chars = 0
+                    f.write(text.encode("utf-8"))
+                    page_chars += len(text)
+                    characters += len(text)
+                    words += sum(1 for _ in WORD.finditer(text))
+                    lines += text.count("\n")
+                    pages = max(pages, page)
+                    last = text[-1:] or last
+                size = f.tell()
+        except BaseException:
+            os.remove(self.path)
+            raise
+        if size:
+            self.offsets.append(size)
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = None
+        # Runs on close() or once the last reference is gone
+        self._release = weakref.finalize(self, _release, self._map, self.path)
+        self.stats = {
+            "characters": characters,
+            "words": words,
+            "lines": lines + (last != "\n"),  # a last line without a newline still counts
+            "pages": pages,
+            "bytes": size
+        }
+
+    @property
+    def page_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def page(self, number: int) -> str:
+        """Text of preview page `number` (0-based); only that window is read"""
+        if self._map is None or not 0 <= number < self.page_count:
+            return ""
+        return self._map[self.offsets[number]:self.offsets[number + 1]].decode("utf-8", errors="replace")
+
+    def close(self):
+        self._map = None
+        self._release()
+
+
+def open_preview(name: str, source: Union[bytes, BinaryIO]) -> DocumentPreview:
+    """Cached preview of an upload, extracted on first use"""
+    # The extension is part of the key: the same bytes parse differently as .txt and .pdf
+    key = f"{rag.file_hash(source)}.{_extension(name) or 'txt'}"
+    with _cache_lock:
+        preview = _cache.get(key)
+        if preview is not None:
+            _cache.move_to_end(key)
+            return preview
+        loading = _loading.get(key)
+        if loading is None:
+            loading = _loading[key] = Future()
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        # Another session is extracting the same file
+        return loading.result()
+
+    # Extract outside the lock so other previews stay available meanwhile; every
+    # extraction gets its own file, an evicted one may still be open elsewhere
+    try:
+        path = os.path.join(_temp_directory(), f"{key}-{next(_file_numbers)}.txt")
+        preview = DocumentPreview(name, source, path, key)
+    except BaseException as e:
+        with _cache_lock:
+            del _loading[key]
+        loading.set_exception(e)
+        raise
+    with _cache_lock:
+        del _loading[key]
+        _cache[key] = preview
+        while len(_cache) > PREVIEW_CACHE_SIZE:
+            # Not closed: sessions still showing it keep reading, the file goes with the last reference
+            _cache.popitem(last=False)
+    loading.set_result(preview)
+    return preview
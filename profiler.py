@@ -0,0 +1,128 @@
+import cProfile
+import io
+import pstats
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class RerunProfiler:
+    """Per-session timing of every top-level section of a Streamlit rerun.
+
+    `begin()` starts a rerun, `mark(name)` closes the running section and opens
+    the next one, `call(name)` times an external call inside the current
+    section and `finish()` stores the rerun in a ring buffer. A rerun cut short
+    by `st.rerun()` / `st.stop()` is closed by the next `begin()`.
+    """
+
+    def __init__(self, capacity: int = 50):
+        self.enabled = False
+        self.capture_cprofile = False
+        self.reruns = deque(maxlen=capacity)
+        self.current: Optional[Dict] = None
+        self._counter = 0
+        self._section = None
+        self._section_start = 0.0
+        self._last_event = 0.0
+        self._cprofile = None
+
+    def begin(self, enabled: bool, capture_cprofile: bool = False):
+        """Start timing a new rerun"""
+        if self.current is not None:
+            self._close(interrupted=True)
+        self.enabled = enabled
+        if not enabled:
+            return
+
+        self._counter += 1
+        now = time.perf_counter()
+        self.current = {
+            "id": self._counter,
+            "started": datetime.now().strftime("%H:%M:%S"),
+            "sections": {},
+            "calls": [],
+            "total": None,
+            "interrupted": False,
+            "cprofile": None
+        }
+        self._start = now
+        self._last_event = now
+        self._section = None
+
+        self._cprofile = None
+        if capture_cprofile:
+            try:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+            except ValueError:
+                # Another profiler is already active in this process
+                self._cprofile = None
+
+    def mark(self, name: str):
+        """End the running section and start `name`"""
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self._end_section(now)
+        self._section = name
+        self._section_start = now
+        self._last_event = now
+
+    @contextmanager
+    def call(self, name: str):
+        """Time an external call made inside the current section"""
+        if self.current is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.current["calls"].append({
+                "name": name,
+                "section": self._section,
+                "duration": end - start
+            })
+            self._last_event = end
+
+    def finish(self):
+        """Close the rerun and keep it in the ring buffer"""
+        if self.current is not None:
+            self._close(interrupted=False)
+
+    def _end_section(self, now: float):
+        if self._section is not None:
+            sections = self.current["sections"]
+            sections[self._section] = sections.get(self._section, 0.0) + now - self._section_start
+            self._section = None
+
+    def _close(self, interrupted: bool):
+        end = self._last_event if interrupted else time.perf_counter()
+        self._end_section(end)
+        self.current["total"] = end - self._start
+        self.current["interrupted"] = interrupted
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats("cumulative").print_stats(40)
+            self.current["cprofile"] = out.getvalue()
+            self._cprofile = None
+
+        self.reruns.append(self.current)
+        self.current = None
+
+    def section_rows(self) -> List[Dict]:
+        """Flat (rerun, section, seconds) rows for a stacked chart"""
+        rows = []
+        for rerun in self.reruns:
+            for section, seconds in rerun["sections"].items():
+                rows.append({"rerun": rerun["id"], "section": section, "seconds": seconds})
+        return rows
+
+    def slowest(self, n: int = 5) -> List[Dict]:
+        """The `n` slowest reruns in the buffer"""
+        return sorted(self.reruns, key=lambda r: r["total"] or 0, reverse=True)[:n]
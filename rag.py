@@ -0,0 +1,727 @@
+"""Retrieval-augmented generation over uploaded documents.
+
+Documents are parsed (PDF, DOCX or text), split into overlapping chunks,
+embedded with sentence-transformers and stored in a persistent Chroma
+collection per workspace under CHROMA_DIR. `retrieve()` returns the top-k
+chunks for a query, giving up when the latency budget is exhausted so a slow
+index never blocks a chat turn.
+
+Retrieval is hybrid: BM25 keyword search (SQLite FTS5) and vector search
+run concurrently, their rankings are merged with reciprocal rank fusion and
+the top candidates can be reranked with a cross-encoder. Every stage is
+timed and skipped when the latency budget runs out.
+
+Ingestion is incremental: a JSON manifest per workspace records each
+document's file hash and chunk ids (content hashes), so re-uploading a file
+only embeds the chunks that changed and deletes the ones that disappeared.
+
+Repeated questions are answered from memory: query embeddings and complete
+results are cached by normalized query, and results are keyed by a
+per-workspace index version that every ingest or removal bumps.
+"""
+import contextvars
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import metrics
+import tracing
+from embeddings import Embedder, EmbeddingCache
+from keyword_index import KeywordIndex
+
+CHROMA_DIR = os.environ.get("CHROMA_DIR", "chroma_db")
+EMBEDDING_MODEL = os.environ.get("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# auto: Chroma when installed, else the memory-mapped flat index in vector_index.py
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "auto")
+RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Models whose tokenizer lowercases its input; queries differing only in case share cache entries
+UNCASED_MODELS = {
+    "all-MiniLM-L6-v2", "sentence-transformers/all-MiniLM-L6-v2",
+    "all-MiniLM-L12-v2", "sentence-transformers/all-MiniLM-L12-v2",
+    "cross-encoder/ms-marco-MiniLM-L-6-v2", "cross-encoder/ms-marco-MiniLM-L-12-v2",
+}
+
+CHUNK_SIZE = 800       # characters per chunk
+CHUNK_OVERLAP = 100    # characters repeated between neighbouring chunks
+BOUNDARY_MODULUS = 4   # about one paragraph in four may end a chunk early
+INGEST_BATCH = 256     # chunks parsed ahead of embedding and storing them
+TOP_K = 8               # chunks retrieved; packing decides how many fit the prompt
+RETRIEVAL_BUDGET = 1.5  # seconds for all retrieval stages together
+CANDIDATES = 20         # results taken from each retriever before fusion
+RERANK_CANDIDATES = 12  # fused results scored by the cross-encoder
+RRF_K = 60              # reciprocal rank fusion damping constant
+SEARCH_MODES = ("hybrid", "vector", "keyword")
+RESULT_CACHE_SIZE = int(os.environ.get("RAG_RESULT_CACHE_SIZE", "256"))  # retrievals kept in memory, 0 disables
+QUERY_CACHE_SIZE = 1024  # query embeddings kept in memory
+
+TEXT_EXTENSIONS = {"txt", "md", "py", "js", "html", "css", "json", "csv"}
+DOCUMENT_EXTENSIONS = sorted(TEXT_EXTENSIONS | {"pdf", "docx"})
+
+
+def chroma_available() -> bool:
+    try:
+        import chromadb  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def rag_available() -> bool:
+    """Embeddings plus a vector store: Chroma, or the built-in flat index (NumPy)"""
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return False
+    if VECTOR_BACKEND != "flat" and chroma_available():
+        return True
+    try:
+        import numpy  # noqa: F401
+        return VECTOR_BACKEND != "chroma"
+    except ImportError:
+        return False
+
+
+# ---------- parsing & chunking ----------
+
+def _extension(name: str) -> str:
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def _as_stream(source: Union[bytes, BinaryIO]) -> BinaryIO:
+    """File-like view of an upload without copying it (UploadedFile is already one)"""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _split_paragraphs(text: str) -> Iterator[str]:
+    for paragraph in re.split(r"\n\s*\n", text):
+        if paragraph.strip():
+            yield paragraph.strip()
+
+
+def _text_paragraphs(stream: BinaryIO) -> Iterator[str]:
+    """Paragraphs of a UTF-8 text stream, read line by line"""
+    lines: List[str] = []
+    for line in io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline=None):
+        # Form feeds (page breaks in text exports) separate paragraphs too
+        for i, part in enumerate(line.split("\f")):
+            if i or not part.strip():
+                if lines:
+                    yield "".join(lines).strip()
+                    lines = []
+            if part.strip():
+                lines.append(part)
+    if lines:
+        yield "".join(lines).strip()
+
+
+class _Unclosable(io.RawIOBase):
+    """Read-only proxy that ignores close(), for wrapping uploads in TextIOWrapper"""
+
+    def __init__(self, stream: BinaryIO):
+        super().__init__()
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def open_document(name: str, source: Union[bytes, BinaryIO]) -> Tuple[Optional[int], Iterator[Tuple[int, str]]]:
+    """Page count (None if unknown) and a lazy stream of (page, paragraph).
+
+    PDF pages are extracted one at a time and numbered from 1; DOCX and text
+    documents have no pages (page 0). Only the current page's text is held
+    besides the upload itself.
+    """
+    extension = _extension(name)
+    stream = _as_stream(source)
+    if extension == "pdf":
+        from pypdf import PdfReader
+        reader = PdfReader(stream)
+
+        def pdf_paragraphs():
+            for number, page in enumerate(reader.pages, 1):
+                for paragraph in _split_paragraphs(page.extract_text() or ""):
+                    yield number, paragraph
+
+        return len(reader.pages), pdf_paragraphs()
+    if extension == "docx":
+        import docx
+        document = docx.Document(stream)
+        return None, ((0, p.text.strip()) for p in document.paragraphs if p.text.strip())
+    if extension in TEXT_EXTENSIONS or not extension:
+        # Closing the text wrapper must not close the upload
+        return None, ((0, paragraph) for paragraph in _text_paragraphs(io.BufferedReader(_Unclosable(stream))))
+    raise ValueError(f"Unsupported document type: .{extension}")
+
+
+def parse_document(name: str, source: Union[bytes, BinaryIO]) -> str:
+    """Extract plain text from an uploaded document"""
+    return "\n\n".join(paragraph for _, paragraph in open_document(name, source)[1])
+
+
+def _cut_long(paragraph: str, size: int) -> Iterator[str]:
+    """Cut paragraphs longer than a chunk at word boundaries"""
+    while len(paragraph) > size:
+        cut = paragraph.rfind(" ", 0, size)
+        cut = cut if cut > size // 2 else size
+        yield paragraph[:cut].strip()
+        paragraph = paragraph[cut:].strip()
+    if paragraph:
+        yield paragraph
+
+
+def _is_boundary(paragraph: str) -> bool:
+    """Content-defined cut point: depends only on the paragraph itself"""
+    return zlib.crc32(paragraph.encode("utf-8")) % BOUNDARY_MODULUS == 0
+
+
+def iter_chunks(paragraphs: Iterable[Tuple[int, str]], size: int = CHUNK_SIZE,
+                overlap: int = CHUNK_OVERLAP) -> Iterator[Dict]:
+    """Pack a stream of (page, paragraph) into {text, page} chunks of about `size` characters.
+
+    Every page is chunked on its own so an edited page never shifts the
+    others. Besides the size limit, chunks end after paragraphs picked by
+    their hash, so an edit only moves the chunk edges near it and later
+    chunks (and their hashes) stay the same. Neighbouring chunks on a page
+    share `overlap` characters.
+    """
+    current: List[str] = []
+    length = 0
+    page = None
+    previous = ""
+
+    def emit():
+        nonlocal current, length, previous
+        text = "\n\n".join(current)
+        chunk = {"text": previous[-overlap:].lstrip() + "\n\n" + text if previous and overlap else text, "page": page}
+        previous, current, length = text, [], 0
+        return chunk
+
+    for number, paragraph in paragraphs:
+        if number != page:
+            if current:
+                yield emit()
+            page, previous = number, ""
+        for piece in _cut_long(paragraph, size):
+            if current and length + len(piece) > size:
+                yield emit()
+            current.append(piece)
+            length += len(piece) + 2
+            if length >= size // 2 and _is_boundary(piece):
+                yield emit()
+    if current:
+        yield emit()
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Chunks of a single text (see `iter_chunks`)"""
+    return [chunk["text"] for chunk in iter_chunks(((0, p) for p in _split_paragraphs(text)), size, overlap)]
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Stable id of a chunk: a hash of its document and content"""
+    return hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def file_hash(source: Union[bytes, BinaryIO]) -> str:
+    """sha256 of an upload, read in blocks"""
+    digest = hashlib.sha256()
+    stream = _as_stream(source)
+    for block in iter(lambda: stream.read(1 << 20), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def source_size(source: Union[bytes, BinaryIO]) -> int:
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    stream = _as_stream(source)
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(0)
+    return size
+
+
+def collection_name(workspace: str) -> str:
+    """Chroma collection name (3-63 chars of [a-zA-Z0-9._-]) for a workspace"""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", workspace).strip("-._") or "default"
+    return f"ws-{slug}"[:63]
+
+
+# ---------- index ----------
+
+class DocumentIndex:
+    """Persistent vector index of document chunks, one collection per workspace"""
+
+    def __init__(self, path: str = CHROMA_DIR, model_name: str = EMBEDDING_MODEL, backend: str = VECTOR_BACKEND):
+        self.path = path
+        self.model_name = model_name
+        if backend == "chroma" or (backend == "auto" and chroma_available()):
+            import chromadb
+            self.backend = "chroma"
+            self.client = chromadb.PersistentClient(path=path)
+            self.data_dir = path
+        else:
+            self.backend = "flat"
+            self.client = None
+            # Manifests and keyword index describe one backend's contents, keep them apart
+            self.data_dir = os.path.join(path, "flat")
+            self._flat = {}
+            self._flat_lock = threading.Lock()
+        self.embedder = Embedder(model_name, EmbeddingCache(os.path.join(path, "embeddings.db")))
+        # The old shared keywords.db mixed BM25 statistics across workspaces; _backfill_keywords()
+        # rebuilds each workspace from its vector collection
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(os.path.join(self.data_dir, "keywords.db" + suffix))
+            except FileNotFoundError:
+                pass
+        try:
+            self.keywords = KeywordIndex(os.path.join(self.data_dir, "keywords"))
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5, vector search only
+            print(f"Keyword search disabled: {e}")
+            self.keywords = None
+        self._keywords_checked = set()
+        self._reranker = None
+        self._reranker_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._results: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+        self._query_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"lookups": 0, "hits": 0}
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag")
+        # Load the embedding model in the background so the first query fits the budget
+        self._executor.submit(self.embedder.model)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed(texts)
+
+    def _collection(self, workspace: str):
+        if self.backend == "flat":
+            from vector_index import FlatIndex
+            name = collection_name(workspace)
+            with self._flat_lock:
+                if name not in self._flat:
+                    self._flat[name] = FlatIndex(os.path.join(self.data_dir, name))
+                return self._flat[name]
+        return self.client.get_or_create_collection(
+            collection_name(workspace),
+            metadata={"hnsw:space": "cosine", "workspace": workspace}
+        )
+
+    # ---------- manifest ----------
+
+    def _manifest_path(self, workspace: str) -> str:
+        return os.path.join(self.data_dir, "manifests", f"{collection_name(workspace)}.json")
+
+    def manifest(self, workspace: str) -> Dict[str, Dict]:
+        """Source name → {sha256, bytes, ids, pages, updated} for a workspace"""
+        try:
+            with open(self._manifest_path(workspace), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return self._rebuild_manifest(workspace)
+
+    def _rebuild_manifest(self, workspace: str) -> Dict[str, Dict]:
+        """Manifest of a collection indexed before manifests existed (no file hashes)"""
+        result = self._collection(workspace).get(include=["metadatas"])
+        manifest: Dict[str, Dict] = {}
+        for chunk_id_, metadata in zip(result["ids"], result["metadatas"] or []):
+            entry = manifest.setdefault(
+                metadata["source"], {"sha256": None, "bytes": None, "ids": [], "pages": None, "updated": None}
+            )
+            entry["ids"].append(chunk_id_)
+        return manifest
+
+    def _save_manifest(self, workspace: str, manifest: Dict[str, Dict]):
+        path = self._manifest_path(workspace)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    # ---------- documents ----------
+
+    def ingest(self, workspace: str, name: str, source: Union[bytes, BinaryIO],
+               progress: Callable[[Dict], None] = None) -> Dict:
+        """Index a document, embedding only chunks that are not indexed yet.
+
+        The document is parsed, chunked and embedded as a stream, INGEST_BATCH
+        chunks at a time, so memory stays bounded for large files. Returns
+        {chunks, added, removed, unchanged, skipped, embedded, cached,
+        chunks_per_sec, elapsed}; `skipped` is True when the file is
+        byte-identical to the indexed version. `progress` receives
+        {page, pages, chunks, embedded, chunks_per_sec} after every batch.
+        """
+        start = time.perf_counter()
+        digest = file_hash(source)
+        size = source_size(source)
+        with tracing.span("rag.ingest", document=name, bytes=size) as span, self._manifest_lock:
+            manifest = self.manifest(workspace)
+            previous = manifest.get(name)
+            if previous and previous["sha256"] == digest:
+                span.set(skipped=True)
+                return {"chunks": len(previous["ids"]), "added": 0, "removed": 0,
+                        "unchanged": len(previous["ids"]), "skipped": True, "embedded": 0, "cached": 0,
+                        "chunks_per_sec": 0.0, "elapsed": time.perf_counter() - start}
+
+            old_ids = set(previous["ids"]) if previous else set()
+            collection = self._collection(workspace)
+            pages, paragraphs = open_document(name, source)
+            ids: Dict[str, None] = {}  # ordered set of chunk ids seen so far
+            added: List[str] = []
+            totals = {"unchanged": 0, "embedded": 0, "cached": 0}
+            page = 0
+
+            def store(batch: Dict[str, Dict]):
+                new_ids = [i for i in batch if i not in old_ids]
+                kept_ids = [i for i in batch if i in old_ids]
+                if new_ids:
+                    with tracing.span("rag.embed", chunks=len(new_ids)) as embed_span:
+                        embedding = self.embedder.embed_with_stats([batch[i]["text"] for i in new_ids])
+                        embed_span.set(embedded=embedding["embedded"], cached=embedding["cached"])
+                    collection.add(
+                        ids=new_ids,
+                        documents=[batch[i]["text"] for i in new_ids],
+                        embeddings=embedding["vectors"],
+                        metadatas=[self._metadata(name, batch[i]) for i in new_ids]
+                    )
+                    added.extend(new_ids)
+                    if self.keywords is not None:
+                        self.keywords.add(workspace, [
+                            dict(self._metadata(name, batch[i]), id=i, text=batch[i]["text"]) for i in new_ids
+                        ])
+                    totals["embedded"] += embedding["embedded"]
+                    totals["cached"] += embedding["cached"]
+                if kept_ids:
+                    # Positions shift when chunks are inserted before them; no re-embedding needed
+                    collection.update(ids=kept_ids, metadatas=[self._metadata(name, batch[i]) for i in kept_ids])
+                    if self.keywords is not None:
+                        self.keywords.update_positions(workspace, {i: self._metadata(name, batch[i]) for i in kept_ids})
+                    totals["unchanged"] += len(kept_ids)
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress({"page": page, "pages": pages, "chunks": len(ids), "embedded": totals["embedded"],
+                              "chunks_per_sec": totals["embedded"] / elapsed if elapsed else 0.0})
+
+            try:
+                batch: Dict[str, Dict] = {}
+                for position, chunk in enumerate(iter_chunks(paragraphs)):
+                    page = chunk["page"]
+                    identifier = chunk_id(name, chunk["text"])
+                    if identifier in ids:
+                        continue  # identical chunks within a document are stored once
+                    ids[identifier] = None
+                    batch[identifier] = dict(chunk, chunk=position)
+                    if len(batch) >= INGEST_BATCH:
+                        store(batch)
+                        batch = {}
+                if batch:
+                    store(batch)
+            except BaseException:
+                # Leave the index as the manifest describes it
+                if added:
+                    collection.delete(ids=added)
+                    if self.keywords is not None:
+                        self.keywords.delete(workspace, added)
+                # Searches during the ingest may have cached the partial index
+                self._invalidate(workspace)
+                raise
+
+            removed_ids = sorted(old_ids - ids.keys())
+            if removed_ids:
+                collection.delete(ids=removed_ids)
+                if self.keywords is not None:
+                    self.keywords.delete(workspace, removed_ids)
+
+            manifest[name] = {
+                "sha256": digest,
+                "bytes": size,
+                "ids": list(ids),
+                "pages": pages,
+                "updated": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._save_manifest(workspace, manifest)
+            self._invalidate(workspace)
+            elapsed = time.perf_counter() - start
+            stats = {"chunks": len(ids), "added": len(added), "removed": len(removed_ids),
+                     "unchanged": totals["unchanged"], "skipped": False, "embedded": totals["embedded"],
+                     "cached": totals["cached"],
+                     "chunks_per_sec": round(totals["embedded"] / elapsed, 1) if totals["embedded"] else 0.0}
+            span.set(**stats)
+        return dict(stats, elapsed=time.perf_counter() - start)
+
+    @staticmethod
+    def _metadata(source: str, chunk: Dict) -> Dict:
+        return {"source": source, "chunk": chunk["chunk"], "page": chunk["page"]}
+
+    def remove(self, workspace: str, name: str):
+        with self._manifest_lock:
+            manifest = self.manifest(workspace)
+            entry = manifest.pop(name, None)
+            if entry and entry["ids"]:
+                self._collection(workspace).delete(ids=entry["ids"])
+                if self.keywords is not None:
+                    self.keywords.delete(workspace, entry["ids"])
+            self._save_manifest(workspace, manifest)
+            self._invalidate(workspace)
+
+    def documents(self, workspace: str) -> Dict[str, int]:
+        """Source name → chunk count"""
+        return {source: len(entry["ids"]) for source, entry in self.manifest(workspace).items()}
+
+    def clear(self, workspace: str):
+        with self._manifest_lock:
+            if self.backend == "flat":
+                self._collection(workspace).drop()
+                with self._flat_lock:
+                    self._flat.pop(collection_name(workspace), None)
+            else:
+                try:
+                    self.client.delete_collection(collection_name(workspace))
+                except ValueError:
+                    pass
+            try:
+                os.remove(self._manifest_path(workspace))
+            except FileNotFoundError:
+                pass
+            if self.keywords is not None:
+                self.keywords.clear(workspace)
+            self._invalidate(workspace)
+
+    def clear_all(self):
+        """Delete the documents of every workspace, the keyword index and the embedding cache"""
+        with self._manifest_lock:
+            if self.backend == "flat":
+                with self._flat_lock:
+                    for index in self._flat.values():
+                        index.drop()
+                    self._flat.clear()
+                # Collections not opened by this process, and the manifests
+                entries = os.listdir(self.data_dir) if os.path.isdir(self.data_dir) else []
+                for name in entries:
+                    entry = os.path.join(self.data_dir, name)
+                    if name != "keywords" and os.path.isdir(entry):
+                        shutil.rmtree(entry, ignore_errors=True)
+            else:
+                for collection in self.client.list_collections():
+                    # Collection objects before chromadb 0.6, names after
+                    self.client.delete_collection(getattr(collection, "name", collection))
+                shutil.rmtree(os.path.join(self.data_dir, "manifests"), ignore_errors=True)
+            if self.keywords is not None:
+                self.keywords.clear_all()
+            self._keywords_checked.clear()
+            self.embedder.cache.clear()
+            with self._cache_lock:
+                for workspace in set(self._versions) | {key[0] for key in self._results}:
+                    self._versions[workspace] = self._versions.get(workspace, 0) + 1
+                self._results.clear()
+                self._query_vectors.clear()
+
+    # ---------- result cache ----------
+
+    def version(self, workspace: str) -> int:
+        """Index version of a workspace, bumped whenever its documents change"""
+        with self._cache_lock:
+            return self._versions.get(workspace, 0)
+
+    def _invalidate(self, workspace: str):
+        with self._cache_lock:
+            self._versions[workspace] = self._versions.get(workspace, 0) + 1
+            # Entries of older versions can never be hit again, free them now
+            for key in [key for key in self._results if key[0] == workspace]:
+                del self._results[key]
+
+    def _cache_get(self, cache: OrderedDict, key, name: str):
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            if name == "results":
+                self.cache_stats["lookups"] += 1
+                self.cache_stats["hits"] += value is not None
+        metrics.RETRIEVAL_CACHE.inc(cache=name, result="hit" if value is not None else "miss")
+        return value
+
+    def _cache_put(self, cache: OrderedDict, key, value, size: int):
+        with self._cache_lock:
+            if cache is self._results and key[1] != self._versions.get(key[0], 0):
+                return  # the workspace changed while this search ran
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > size:
+                cache.popitem(last=False)
+
+    def _query_embedding(self, query: str) -> List[float]:
+        key = normalize_query(query, self.model_name in UNCASED_MODELS)
+        embedding = self._cache_get(self._query_vectors, key, "embedding")
+        if embedding is None:
+            embedding = self.embedder.encode([query])[0]
+            self._cache_put(self._query_vectors, key, embedding, QUERY_CACHE_SIZE)
+        return embedding
+
+    # ---------- retrieval ----------
+
+    def _submit(self, fn, *args):
+        # Run in the pool with the caller's context so stage spans nest under rag.retrieve
+        return self._executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def _stage(self, stage: str, fn, *args):
+        """Run one retrieval stage, returns (results, seconds)"""
+        start = time.perf_counter()
+        with tracing.span(f"rag.{stage}") as span:
+            results = fn(*args)
+            span.set(results=len(results))
+        elapsed = time.perf_counter() - start
+        metrics.RETRIEVAL_STAGE.observe(elapsed, stage=stage)
+        return results, elapsed
+
+    def _vector_search(self, workspace: str, query: str, k: int) -> List[Dict]:
+        collection = self._collection(workspace)
+        count = collection.count()
+        if not count:
+            return []
+        embedding = self._query_embedding(query)
+        result = collection.query(
+            query_embeddings=[embedding],
+            n_results=min(k, count),
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            {"id": chunk_id, "text": text, "source": meta["source"], "chunk": meta["chunk"],
+             "page": meta.get("page"), "score": 1 - distance}
+            for chunk_id, text, meta, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def _keyword_search(self, workspace: str, query: str, k: int) -> List[Dict]:
+        if workspace not in self._keywords_checked:
+            self._backfill_keywords(workspace)
+        return self.keywords.search(workspace, query, k)
+
+    def _backfill_keywords(self, workspace: str):
+        """Index chunks stored before keyword search existed"""
+        with self._manifest_lock:
+            if workspace in self._keywords_checked:
+                return
+            collection = self._collection(workspace)
+            if collection.count() and not self.keywords.count(workspace):
+                result = collection.get(include=["documents", "metadatas"])
+                self.keywords.add(workspace, [
+                    {"id": chunk_id, "text": text, "source": meta["source"], "chunk": meta.get("chunk", 0),
+                     "page": meta.get("page", 0)}
+                    for chunk_id, text, meta in zip(result["ids"], result["documents"], result["metadatas"])
+                ])
+            self._keywords_checked.add(workspace)
+
+    def _get_reranker(self):
+        with self._reranker_lock:
+            if self._reranker is None:
+                from sentence_transformers import CrossEncoder
+                self._reranker = CrossEncoder(RERANK_MODEL)
+            return self._reranker
+
+    def _rerank(self, query: str, chunks: List[Dict]) -> List[Dict]:
+        scores = self._get_reranker().predict([(query, chunk["text"]) for chunk in chunks])
+        for chunk, score in zip(chunks, scores):
+            chunk["rerank_score"] = float(score)
+        return sorted(chunks, key=lambda chunk: chunk["rerank_score"], reverse=True)
+
+    def retrieve(self, workspace: str, query: str, k: int = TOP_K, budget: float = RETRIEVAL_BUDGET,
+                 mode: str = "hybrid", rerank: bool = False) -> Dict:
+        """Top-k chunks within `budget` seconds.
+
+        Returns {chunks, elapsed, timings, skipped, timed_out, cached}:
+        `timings` maps each finished stage (keyword, vector, fuse, rerank) to
+        seconds and `skipped` lists stages that ran out of budget. Late stages
+        keep running in the background, the chat turn goes on without them.
+        Complete results are cached until the workspace's documents change.
+        """
+        start = time.perf_counter()
+        deadline = start + budget
+        timings: Dict[str, float] = {}
+        skipped: List[str] = []
+        # FTS5 ignores case; vector search and reranking only when their models are uncased
+        uncased = (mode == "keyword" or self.model_name in UNCASED_MODELS) and (not rerank or RERANK_MODEL in UNCASED_MODELS)
+        key = (workspace, self.version(workspace), normalize_query(query, uncased), k, mode, rerank)
+        with tracing.span("rag.retrieve", k=k, budget=budget, mode=mode, rerank=rerank) as span:
+            cached = self._cache_get(self._results, key, "results") if RESULT_CACHE_SIZE else None
+            if cached is not None:
+                span.set(chunks=len(cached), cached=True)
+                elapsed = time.perf_counter() - start
+                return {"chunks": [dict(chunk) for chunk in cached], "elapsed": elapsed, "timings": {"cache": elapsed},
+                        "skipped": [], "timed_out": False, "cached": True}
+
+            futures = {}
+            if mode in ("hybrid", "vector"):
+                futures["vector"] = self._submit(self._stage, "vector", self._vector_search, workspace, query, CANDIDATES)
+            if mode in ("hybrid", "keyword") and self.keywords is not None:
+                futures["keyword"] = self._submit(self._stage, "keyword", self._keyword_search, workspace, query, CANDIDATES)
+
+            rankings = []
+            for stage, future in futures.items():
+                try:
+                    results, timings[stage] = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                    rankings.append(results)
+                except FutureTimeout:
+                    skipped.append(stage)
+
+            fuse_start = time.perf_counter()
+            candidates = reciprocal_rank_fusion(rankings)
+            timings["fuse"] = time.perf_counter() - fuse_start
+
+            if rerank and len(candidates) > 1:
+                future = self._submit(self._stage, "rerank", self._rerank, query, candidates[:RERANK_CANDIDATES])
+                try:
+                    reranked, timings["rerank"] = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+                    candidates = reranked + candidates[RERANK_CANDIDATES:]
+                except FutureTimeout:
+                    skipped.append("rerank")
+
+            chunks = candidates[:k]
+            if not skipped and RESULT_CACHE_SIZE:
+                # Results missing a stage are not cached, the next search may finish in time
+                self._cache_put(self._results, key, [dict(chunk) for chunk in chunks], RESULT_CACHE_SIZE)
+            span.set(chunks=len(chunks), skipped=",".join(skipped))
+        return {"chunks": chunks, "elapsed": time.perf_counter() - start, "timings": timings,
+                "skipped": skipped, "timed_out": bool(skipped), "cached": False}
+
+
+def normalize_query(query: str, lowercase: bool = False) -> str:
+    """Cache key of a query: whitespace collapsed, case folded only for uncased models"""
+    query = " ".join(query.split())
+    return query.lower() if lowercase else query
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], k: int = RRF_K) -> List[Dict]:
+    """Merge ranked result lists by id; `score` becomes the summed 1 / (k + rank)"""
+    fused: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            entry = fused.setdefault(chunk["id"], dict(chunk, score=0.0))
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda chunk: chunk["score"], reverse=True)
@@ -0,0 +1,801 @@
+import os
+import sqlite3
+import threading
+import atexit
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+
+from history import ModelStats, RunningStats
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "conversations.db")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workspaces (
+    name TEXT PRIMARY KEY,
+    created TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL REFERENCES workspaces(name) ON DELETE CASCADE,
+    title TEXT,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_workspace
+    ON conversations(workspace, updated);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages(conversation_id, id);
+
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL REFERENCES workspaces(name) ON DELETE CASCADE,
+    conversation_id INTEGER,
+    timestamp TEXT NOT NULL,
+    model TEXT,
+    user TEXT,
+    assistant TEXT,
+    response_length INTEGER,
+    response_time REAL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_history_workspace
+    ON chat_history(workspace, id);
+CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp
+    ON chat_history(timestamp);
+
+CREATE TABLE IF NOT EXISTS favorites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workspace TEXT NOT NULL REFERENCES workspaces(name) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_favorites_workspace
+    ON favorites(workspace, id);
+
+CREATE TABLE IF NOT EXISTS benchmark_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    suite_version TEXT NOT NULL,
+    started TEXT NOT NULL,
+    model TEXT NOT NULL,
+    case_name TEXT NOT NULL,
+    load_duration REAL,
+    ttft REAL,
+    tokens_per_sec REAL,
+    prompt_eval_count INTEGER,
+    eval_count INTEGER,
+    total_duration REAL,
+    peak_rss_mb REAL,
+    memory_source TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_benchmark_results_model
+    ON benchmark_results(suite_version, model, started);
+
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    workspace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    plugin TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    response_time REAL NOT NULL DEFAULT 0
+);
+
+-- Pre-aggregated usage per minute / hour / day bucket, updated on insert
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    workspace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    plugin TEXT NOT NULL,
+    events INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    response_time REAL NOT NULL,
+    PRIMARY KEY (granularity, bucket, workspace, model, plugin)
+) WITHOUT ROWID;
+
+-- Per-model chat history totals and latency / TTFT histogram buckets, updated on insert
+CREATE TABLE IF NOT EXISTS history_rollups (
+    workspace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total_length INTEGER NOT NULL,
+    eval_count INTEGER NOT NULL,
+    eval_duration REAL NOT NULL,
+    prompt_eval_count INTEGER NOT NULL,
+    PRIMARY KEY (workspace, model)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS history_histograms (
+    workspace TEXT NOT NULL,
+    model TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (workspace, model, metric, bucket)
+) WITHOUT ROWID;
+"""
+
+BENCHMARK_COLUMNS = [
+    "run_id", "suite_version", "started", "model", "case_name", "load_duration", "ttft",
+    "tokens_per_sec", "prompt_eval_count", "eval_count", "total_duration", "peak_rss_mb",
+    "memory_source", "error"
+]
+
+# Full-text index over message and favorite content, kept in sync by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    role UNINDEXED,
+    workspace UNINDEXED,
+    conversation_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, role, workspace, conversation_id)
+    VALUES (
+        new.id, new.content, new.role,
+        (SELECT workspace FROM conversations WHERE id = new.conversation_id),
+        new.conversation_id
+    );
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    DELETE FROM messages_fts WHERE rowid = old.id;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_vocab USING fts5vocab(messages_fts, row);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS favorites_fts USING fts5(
+    content,
+    role UNINDEXED,
+    workspace UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS favorites_fts_insert AFTER INSERT ON favorites BEGIN
+    INSERT INTO favorites_fts (rowid, content, role, workspace)
+    VALUES (new.id, new.content, new.role, new.workspace);
+END;
+CREATE TRIGGER IF NOT EXISTS favorites_fts_delete AFTER DELETE ON favorites BEGIN
+    DELETE FROM favorites_fts WHERE rowid = old.id;
+END;
+"""
+
+SEARCH_BACKFILL = """
+INSERT INTO messages_fts (rowid, content, role, workspace, conversation_id)
+    SELECT m.id, m.content, m.role, c.workspace, m.conversation_id
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id;
+INSERT INTO favorites_fts (rowid, content, role, workspace)
+    SELECT id, content, role, workspace FROM favorites;
+"""
+
+# Terms found in more than this share of messages are treated like stopwords
+COMMON_TERM_RATIO = 0.3
+COMMON_TERM_MIN_DOCS = 1000
+
+# Rollup granularity → (timestamp prefix length, suffix) forming the bucket key
+ROLLUP_GRANULARITIES = {
+    "minute": (16, ""),     # 2024-01-31 13:45
+    "hour": (13, ":00"),    # 2024-01-31 13:00
+    "day": (10, "")         # 2024-01-31
+}
+MINUTE_ROLLUP_RETENTION = timedelta(days=7)
+
+USAGE_COLUMNS = ["timestamp", "workspace", "model", "plugin", "prompt_tokens", "completion_tokens", "response_time"]
+
+# Column name → SQLite type for chat history records
+HISTORY_FIELDS = {
+    "timestamp": "TEXT",
+    "model": "TEXT",
+    "user": "TEXT",
+    "assistant": "TEXT",
+    "response_length": "INTEGER",
+    "response_time": "REAL",
+    "ttft": "REAL",
+    "load_duration": "REAL",
+    "prompt_eval_duration": "REAL",
+    "eval_duration": "REAL",
+    "total_duration": "REAL",
+    "prompt_eval_count": "INTEGER",
+    "eval_count": "INTEGER",
+    "tokens_per_sec": "REAL"
+}
+HISTORY_COLUMNS = list(HISTORY_FIELDS)
+
+
+def now_str() -> str:
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def bucket_key(timestamp: str, granularity: str) -> str:
+    """Bucket a TIMESTAMP_FORMAT string, e.g. hour → '2024-01-31 13:00'"""
+    length, suffix = ROLLUP_GRANULARITIES[granularity]
+    return timestamp[:length] + suffix
+
+
+def rollup_rows(events: List[tuple]) -> List[tuple]:
+    """Aggregate usage event rows into (granularity, bucket, ...) rollup rows"""
+    totals = defaultdict(lambda: [0, 0, 0, 0.0])
+    for timestamp, workspace, model, plugin, prompt_tokens, completion_tokens, response_time in events:
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = totals[(granularity, bucket_key(timestamp, granularity), workspace, model, plugin)]
+            bucket[0] += 1
+            bucket[1] += prompt_tokens
+            bucket[2] += completion_tokens
+            bucket[3] += response_time
+    return [key + tuple(values) for key, values in totals.items()]
+
+
+def history_rollup_rows(history: List[tuple]) -> tuple:
+    """Aggregate queued history rows into (rollup rows, histogram bucket rows)"""
+    stats: Dict[str, RunningStats] = defaultdict(RunningStats)
+    for row in history:
+        record = dict(zip(HISTORY_COLUMNS, row[2:]))
+        if record.get("response_length") is None:
+            record["response_length"] = len(record.get("assistant") or "")
+        stats[row[0]].add(record)
+
+    rollups, buckets = [], []
+    for workspace, workspace_stats in stats.items():
+        for model, model_stats in workspace_stats.models.items():
+            rollups.append((workspace, model) + tuple(getattr(model_stats, name) for name in ModelStats.TOTALS))
+            for metric, histogram in (("latency", model_stats.latencies), ("ttft", model_stats.ttfts)):
+                buckets.extend(
+                    (workspace, model, metric, bucket, count)
+                    for bucket, count in enumerate(histogram.counts) if count
+                )
+    return rollups, buckets
+
+
+def build_match_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query matching all terms"""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in text.split())
+
+
+class ConversationStore:
+    """SQLite-backed store for workspaces, conversations, history and favorites.
+
+    One store is shared by every Streamlit session in the process. Writes are
+    queued and flushed in batches (write-behind); reads always see flushed data.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._pending = []
+        self._pending_messages = 0
+        # Bumped whenever usage rollups change, lets callers cache derived charts
+        self.usage_version = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        usage_exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usage_events'"
+        ).fetchone()
+        rollups_exist = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_rollups'"
+        ).fetchone()
+        self.conn.executescript(SCHEMA)
+        self._migrate_history()
+        if not usage_exists:
+            self._backfill_usage()
+        if not rollups_exist:
+            self._backfill_history_rollups()
+        self.conn.commit()
+        self.search_enabled = self._init_search()
+
+        atexit.register(self.flush)
+
+    def _migrate_history(self):
+        """Add history columns introduced after the database was created"""
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(chat_history)")}
+        for column, sql_type in HISTORY_FIELDS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE chat_history ADD COLUMN {column} {sql_type}")
+
+    def _backfill_usage(self):
+        """Seed usage events and rollups from chat history recorded before they existed"""
+        rows = self.conn.execute(
+            "SELECT timestamp, workspace, COALESCE(model, ''), 'chat', "
+            "COALESCE(prompt_eval_count, 0), COALESCE(eval_count, 0), "
+            "CASE WHEN typeof(response_time) IN ('integer', 'real') THEN response_time ELSE 0 END "
+            "FROM chat_history ORDER BY id"
+        ).fetchall()
+        self._insert_usage([tuple(row) for row in rows])
+
+    def _backfill_history_rollups(self, chunk_size: int = 1000):
+        """Seed history rollups from chat history recorded before they existed"""
+        sql = ("SELECT id, workspace, conversation_id, " + ", ".join(HISTORY_COLUMNS)
+               + " FROM chat_history WHERE id > ? ORDER BY id LIMIT ?")
+        after = 0
+        while True:
+            rows = self.conn.execute(sql, (after, chunk_size)).fetchall()
+            if not rows:
+                return
+            after = rows[-1]["id"]
+            self._insert_history_rollups([tuple(row)[1:] for row in rows])
+
+    def _init_search(self) -> bool:
+        """Create the FTS5 index, backfilling it for databases created before it existed"""
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        try:
+            self.conn.executescript(SEARCH_SCHEMA)
+            if not exists:
+                self.conn.executescript(SEARCH_BACKFILL)
+            self.conn.commit()
+            return True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, fall back to LIKE scans
+            self.conn.rollback()
+            return False
+
+    # ---------- workspaces & conversations ----------
+
+    def list_workspaces(self) -> List[str]:
+        """List workspace names, oldest first"""
+        with self._lock:
+            rows = self.conn.execute("SELECT name FROM workspaces ORDER BY created, name").fetchall()
+        return [row["name"] for row in rows]
+
+    def create_workspace(self, name: str):
+        """Create workspace if it does not exist yet"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO workspaces (name, created) VALUES (?, ?)",
+                (name, now_str())
+            )
+            self.conn.commit()
+
+    def start_conversation(self, workspace: str, title: Optional[str] = None) -> int:
+        """Create a new conversation and return its id"""
+        self.create_workspace(workspace)
+        timestamp = now_str()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO conversations (workspace, title, created, updated) VALUES (?, ?, ?, ?)",
+                (workspace, title, timestamp, timestamp)
+            )
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def latest_conversation(self, workspace: str) -> Optional[int]:
+        """Return the most recently updated conversation in a workspace"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id FROM conversations WHERE workspace = ? ORDER BY updated DESC, id DESC LIMIT 1",
+                (workspace,)
+            ).fetchone()
+        return row["id"] if row else None
+
+    # ---------- buffered writes ----------
+
+    def add_message(self, conversation_id: int, role: str, content: str, timestamp: str = None):
+        """Queue a chat message"""
+        self._queue("message", (conversation_id, role, content, timestamp or now_str()))
+
+    def replace_message(self, conversation_id: int, from_end: int, content: str, timestamp: str = None):
+        """Queue a new content for the message `from_end` places before the conversation's last one"""
+        self._queue("message_update", (conversation_id, from_end, content, timestamp or now_str()))
+
+    def add_history(self, workspace: str, conversation_id: Optional[int], record: Dict):
+        """Queue a chat history record"""
+        row = (workspace, conversation_id) + tuple(record.get(col) for col in HISTORY_COLUMNS)
+        self._queue("history", row)
+
+    def add_favorite(self, workspace: str, message: Dict):
+        """Queue a favorite message"""
+        self._queue("favorite", (
+            workspace,
+            message.get("role", "assistant"),
+            message.get("content", ""),
+            message.get("timestamp") or now_str()
+        ))
+
+    def add_usage(self, workspace: str, model: str, plugin: str, metrics: Dict = None,
+                  timestamp: str = None):
+        """Queue a usage event, rolled up into minute/hour/day buckets on flush"""
+        metrics = metrics or {}
+        response_time = metrics.get("response_time")
+        self._queue("usage", (
+            timestamp or now_str(),
+            workspace,
+            model or "",
+            plugin,
+            metrics.get("prompt_eval_count") or 0,
+            metrics.get("eval_count") or 0,
+            response_time if isinstance(response_time, (int, float)) else 0.0
+        ))
+
+    def _queue(self, kind: str, row: tuple):
+        with self._lock:
+            self._pending.append((kind, row))
+            if kind in ("message", "message_update"):
+                self._pending_messages += 1
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush_if_due(self, every: Optional[int]) -> bool:
+        """Flush when at least `every` messages are pending. `None` means manual only."""
+        if every is None or self._pending_messages < every:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        """Write all pending rows in a single transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self._pending_messages = 0
+
+            messages = [row for kind, row in pending if kind == "message"]
+            history = [row for kind, row in pending if kind == "history"]
+            favorites = [row for kind, row in pending if kind == "favorite"]
+            usage = [row for kind, row in pending if kind == "usage"]
+            # Offsets from the end were taken when queued; messages queued later shift them
+            updates = []
+            later: Dict[int, int] = {}
+            for kind, row in reversed(pending):
+                if kind == "message":
+                    later[row[0]] = later.get(row[0], 0) + 1
+                elif kind == "message_update":
+                    cid, from_end, content, ts = row
+                    updates.append((content, ts, cid, from_end + later.get(cid, 0)))
+            updates.reverse()
+
+            try:
+                with self.conn:
+                    if messages:
+                        self.conn.executemany(
+                            "INSERT INTO messages (conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                            messages
+                        )
+                        touched = {row[0]: row[3] for row in messages}
+                        self.conn.executemany(
+                            "UPDATE conversations SET updated = ? WHERE id = ?",
+                            [(ts, cid) for cid, ts in touched.items()]
+                        )
+                    if updates:
+                        self.conn.executemany(
+                            "UPDATE messages SET content = ?, timestamp = ? WHERE id = ("
+                            "SELECT id FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                            updates
+                        )
+                    if history:
+                        self.conn.executemany(
+                            "INSERT INTO chat_history (workspace, conversation_id, "
+                            + ", ".join(HISTORY_COLUMNS) + ") VALUES ("
+                            + ", ".join("?" * (len(HISTORY_COLUMNS) + 2)) + ")",
+                            history
+                        )
+                        self._insert_history_rollups(history)
+                    if favorites:
+                        self.conn.executemany(
+                            "INSERT INTO favorites (workspace, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                            favorites
+                        )
+                    if usage:
+                        self._insert_usage(usage)
+            except sqlite3.Error:
+                # Keep the rows so the next flush can retry them
+                self._pending = pending + self._pending
+                self._pending_messages = sum(1 for kind, _ in self._pending if kind in ("message", "message_update"))
+                raise
+
+    def _insert_usage(self, events: List[tuple]):
+        """Insert usage events and upsert their rollups (caller commits)"""
+        if not events:
+            return
+        self.conn.executemany(
+            "INSERT INTO usage_events (" + ", ".join(USAGE_COLUMNS) + ") VALUES ("
+            + ", ".join("?" * len(USAGE_COLUMNS)) + ")",
+            events
+        )
+        self.conn.executemany(
+            "INSERT INTO usage_rollups (granularity, bucket, workspace, model, plugin, "
+            "events, prompt_tokens, completion_tokens, response_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (granularity, bucket, workspace, model, plugin) DO UPDATE SET "
+            "events = events + excluded.events, "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+            "completion_tokens = completion_tokens + excluded.completion_tokens, "
+            "response_time = response_time + excluded.response_time",
+            rollup_rows(events)
+        )
+        cutoff = (datetime.now() - MINUTE_ROLLUP_RETENTION).strftime(TIMESTAMP_FORMAT)
+        self.conn.execute(
+            "DELETE FROM usage_rollups WHERE granularity = 'minute' AND bucket < ?",
+            (bucket_key(cutoff, "minute"),)
+        )
+        self.usage_version += 1
+
+    def _insert_history_rollups(self, history: List[tuple]):
+        """Add history rows to the per-model totals and histograms (caller commits)"""
+        rollups, buckets = history_rollup_rows(history)
+        self.conn.executemany(
+            "INSERT INTO history_rollups (workspace, model, " + ", ".join(ModelStats.TOTALS) + ") "
+            "VALUES (" + ", ".join("?" * (len(ModelStats.TOTALS) + 2)) + ") "
+            "ON CONFLICT (workspace, model) DO UPDATE SET "
+            + ", ".join(f"{name} = {name} + excluded.{name}" for name in ModelStats.TOTALS),
+            rollups
+        )
+        self.conn.executemany(
+            "INSERT INTO history_histograms (workspace, model, metric, bucket, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (workspace, model, metric, bucket) DO UPDATE SET count = count + excluded.count",
+            buckets
+        )
+
+    # ---------- reads ----------
+
+    def recent_messages(self, conversation_id: int, limit: int = 50) -> List[Dict]:
+        """Load the last `limit` messages of a conversation, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT role, content, timestamp FROM messages WHERE conversation_id = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def recent_history(self, workspace: str, limit: int = 200) -> List[Dict]:
+        """Load the last `limit` history records of a workspace, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT " + ", ".join(HISTORY_COLUMNS) + " FROM chat_history WHERE workspace = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (workspace, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def history_stats(self, workspace: str) -> RunningStats:
+        """Aggregates over the whole history of a workspace, read from its per-model rollups"""
+        with self._lock:
+            totals = self.conn.execute(
+                "SELECT model, " + ", ".join(ModelStats.TOTALS) + " FROM history_rollups WHERE workspace = ?",
+                (workspace,)
+            ).fetchall()
+            buckets = self.conn.execute(
+                "SELECT model, metric, bucket, count FROM history_histograms WHERE workspace = ?",
+                (workspace,)
+            ).fetchall()
+
+        models: Dict[str, ModelStats] = {}
+        for row in totals:
+            model_stats = models[row["model"]] = ModelStats()
+            for name in ModelStats.TOTALS:
+                setattr(model_stats, name, row[name])
+        for row in buckets:
+            model_stats = models.get(row["model"])
+            if model_stats is not None:
+                histogram = model_stats.latencies if row["metric"] == "latency" else model_stats.ttfts
+                histogram.counts[row["bucket"]] += row["count"]
+
+        stats = RunningStats()
+        for model, model_stats in models.items():
+            stats.add_model(model, model_stats)
+        return stats
+
+    def iter_history(self, workspace: Optional[str] = None, start: Optional[str] = None,
+                     end: Optional[str] = None, model: Optional[str] = None, chunk_size: int = 1000):
+        """Yield filtered history rows in lists of at most `chunk_size`, oldest first"""
+        clauses = ["id > :after"]
+        if workspace:
+            clauses.append("workspace = :workspace")
+        if start:
+            clauses.append("timestamp >= :start")
+        if end:
+            clauses.append("timestamp <= :end")
+        if model:
+            clauses.append("model = :model")
+        sql = (
+            "SELECT id, workspace, " + ", ".join(HISTORY_COLUMNS) + " FROM chat_history WHERE "
+            + " AND ".join(clauses) + " ORDER BY id LIMIT :limit"
+        )
+        params = {"workspace": workspace, "start": start, "end": end, "model": model,
+                  "limit": chunk_size, "after": 0}
+
+        # Keyset pagination, so only one chunk is ever materialized
+        while True:
+            with self._lock:
+                rows = self.conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            params["after"] = rows[-1]["id"]
+            yield [{key: row[key] for key in row.keys() if key != "id"} for row in rows]
+            if len(rows) < chunk_size:
+                return
+
+    def history_models(self) -> List[str]:
+        """Distinct models that appear in the history"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT model FROM chat_history WHERE model IS NOT NULL ORDER BY model"
+            ).fetchall()
+        return [row["model"] for row in rows]
+
+    def favorites(self, workspace: str, limit: int = 100) -> List[Dict]:
+        """Load the last `limit` favorites of a workspace, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT role, content, timestamp FROM favorites WHERE workspace = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (workspace, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def search(self, text: str, workspace: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Ranked full-text search over messages and favorites of every workspace"""
+        if not text.strip():
+            return []
+        if not self.search_enabled:
+            return self._search_like(text, workspace, limit)
+
+        where = "WHERE {table} MATCH :query"
+        if workspace:
+            where += " AND workspace = :workspace"
+
+        # Ranking every message that contains only stopword-like terms is slow
+        # and meaningless, so those queries return the newest matches instead
+        if self._all_terms_common(text.split()):
+            score, order = "0", "id DESC"
+        else:
+            score, order = "bm25({table})", "score"
+
+        sql = f"""
+            SELECT * FROM (
+                SELECT 'message' AS source, rowid AS id, role, workspace, conversation_id,
+                       snippet(messages_fts, 0, '**', '**', '…', 16) AS snippet,
+                       {score.format(table='messages_fts')} AS score
+                FROM messages_fts {where.format(table='messages_fts')}
+                ORDER BY {order} LIMIT :limit
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT 'favorite' AS source, rowid AS id, role, workspace, NULL AS conversation_id,
+                       snippet(favorites_fts, 0, '**', '**', '…', 16) AS snippet,
+                       {score.format(table='favorites_fts')} AS score
+                FROM favorites_fts {where.format(table='favorites_fts')}
+                ORDER BY {order} LIMIT :limit
+            )
+            ORDER BY score LIMIT :limit
+        """
+        params = {"query": build_match_query(text), "workspace": workspace, "limit": limit}
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _all_terms_common(self, terms: List[str]) -> bool:
+        """Whether every term appears in a large share of all indexed messages"""
+        with self._lock:
+            total = self.conn.execute("SELECT max(rowid) FROM messages_fts").fetchone()[0] or 0
+            if total < COMMON_TERM_MIN_DOCS:
+                return False
+            for term in terms:
+                row = self.conn.execute(
+                    "SELECT doc FROM messages_vocab WHERE term = ?", (term.lower(),)
+                ).fetchone()
+                if row is None or row["doc"] < total * COMMON_TERM_RATIO:
+                    return False
+        return True
+
+    def _search_like(self, text: str, workspace: Optional[str], limit: int) -> List[Dict]:
+        """Unranked substring search used when FTS5 is not available"""
+        sql = """
+            SELECT 'message' AS source, m.id, m.role, c.workspace, m.conversation_id,
+                   substr(m.content, 1, 200) AS snippet, 0 AS score
+            FROM messages m JOIN conversations c ON c.id = m.conversation_id
+            WHERE m.content LIKE :pattern AND (:workspace IS NULL OR c.workspace = :workspace)
+            UNION ALL
+            SELECT 'favorite', id, role, workspace, NULL, substr(content, 1, 200), 0
+            FROM favorites
+            WHERE content LIKE :pattern AND (:workspace IS NULL OR workspace = :workspace)
+            LIMIT :limit
+        """
+        params = {"pattern": f"%{text.strip()}%", "workspace": workspace, "limit": limit}
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage_rollups(self, granularity: str, start: str, workspace: Optional[str] = None,
+                      group_by: str = "model") -> List[Dict]:
+        """Rollup buckets since `start` (timestamp or bucket key), summed per bucket and `group_by`"""
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if group_by not in ("model", "plugin", "workspace"):
+            raise ValueError(f"Cannot group usage by {group_by}")
+
+        query = (
+            f"SELECT bucket, {group_by} AS key, SUM(events) AS events, "
+            "SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, "
+            "SUM(response_time) AS response_time "
+            "FROM usage_rollups WHERE granularity = ? AND bucket >= ?"
+        )
+        params = [granularity, bucket_key(start, granularity)]
+        if workspace is not None:
+            query += " AND workspace = ?"
+            params.append(workspace)
+        query += f" GROUP BY bucket, {group_by} ORDER BY bucket"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    # ---------- benchmarks ----------
+
+    def save_benchmark_results(self, results: List[Dict]):
+        """Store the results of a benchmark run (written immediately)"""
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO benchmark_results (" + ", ".join(BENCHMARK_COLUMNS) + ") VALUES ("
+                    + ", ".join("?" * len(BENCHMARK_COLUMNS)) + ")",
+                    [tuple(result.get(col) for col in BENCHMARK_COLUMNS) for result in results]
+                )
+
+    def benchmark_results(self, suite_version: str) -> List[Dict]:
+        """All results of a suite version, oldest run first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT " + ", ".join(BENCHMARK_COLUMNS) + " FROM benchmark_results "
+                "WHERE suite_version = ? ORDER BY started, id",
+                (suite_version,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # ---------- deletes ----------
+
+    def clear_workspace(self, workspace: str):
+        """Delete conversations, history and favorites of a workspace"""
+        self.flush()
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM chat_history WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM favorites WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM conversations WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM usage_events WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM usage_rollups WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM history_rollups WHERE workspace = ?", (workspace,))
+                self.conn.execute("DELETE FROM history_histograms WHERE workspace = ?", (workspace,))
+            self.usage_version += 1
+
+    def clear_all(self):
+        """Delete everything"""
+        with self._lock:
+            self._pending = []
+            self._pending_messages = 0
+            with self.conn:
+                for table in ("messages", "chat_history", "favorites", "conversations", "workspaces",
+                              "usage_events", "usage_rollups", "history_rollups", "history_histograms",
+                              "benchmark_results"):
+                    self.conn.execute(f"DELETE FROM {table}")
+            self.usage_version += 1
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
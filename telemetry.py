@@ -0,0 +1,94 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import ollama
+
+import metrics
+import tracing
+
+NANOSECONDS = 1e9
+
+# Duration fields reported by Ollama in nanoseconds
+DURATION_FIELDS = ["load_duration", "prompt_eval_duration", "eval_duration", "total_duration"]
+COUNT_FIELDS = ["prompt_eval_count", "eval_count"]
+
+METRIC_FIELDS = ["response_time", "ttft"] + DURATION_FIELDS + COUNT_FIELDS + ["tokens_per_sec"]
+
+
+def response_metrics(final_chunk, wall_time: float, ttft: Optional[float]) -> Dict:
+    """Build a metrics dict (seconds and token counts) from the last streamed chunk"""
+    metrics = {"response_time": round(wall_time, 3), "ttft": round(ttft, 3) if ttft is not None else None}
+
+    for field in DURATION_FIELDS:
+        value = final_chunk.get(field) if final_chunk else None
+        metrics[field] = value / NANOSECONDS if value is not None else None
+    for field in COUNT_FIELDS:
+        metrics[field] = final_chunk.get(field) if final_chunk else None
+
+    if metrics["eval_count"] and metrics["eval_duration"]:
+        metrics["tokens_per_sec"] = round(metrics["eval_count"] / metrics["eval_duration"], 2)
+    else:
+        metrics["tokens_per_sec"] = None
+    return metrics
+
+
+def _consume(stream, extract) -> Tuple[str, Dict]:
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    final_chunk = None
+
+    for chunk in stream:
+        text = extract(chunk)
+        if text:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(text)
+        if chunk.get("done"):
+            final_chunk = chunk
+
+    return "".join(parts), response_metrics(final_chunk, time.perf_counter() - start, ttft)
+
+
+def _observed(model: str, endpoint: str, start_stream, extract) -> Tuple[str, Dict]:
+    """Consume a stream while updating the process-wide OpenMetrics series"""
+    metrics.REQUESTS.inc(model=model, endpoint=endpoint)
+    metrics.IN_FLIGHT.inc()
+    try:
+        with tracing.span(f"ollama.{endpoint}", model=model) as span:
+            text, result = _consume(start_stream(), extract)
+            span.set(**{k: result[k] for k in ("ttft", "prompt_eval_count", "eval_count", "tokens_per_sec")})
+    except Exception:
+        metrics.ERRORS.inc(model=model, endpoint=endpoint)
+        raise
+    finally:
+        metrics.IN_FLIGHT.dec()
+
+    if result["ttft"] is not None:
+        metrics.TTFT.observe(result["ttft"], model=model)
+    metrics.GENERATION.observe(result["response_time"], model=model)
+    if result["eval_count"]:
+        metrics.TOKENS.inc(result["eval_count"], model=model)
+    return text, result
+
+
+def chat_with_metrics(model: str, messages: List[Dict], options: Dict = None,
+                      client=None, **kwargs) -> Tuple[str, Dict]:
+    """Call the chat endpoint in streaming mode and return (content, metrics)"""
+    client = client or ollama
+    return _observed(
+        model, "chat",
+        lambda: client.chat(model=model, messages=messages, options=options, stream=True, **kwargs),
+        lambda chunk: chunk["message"]["content"]
+    )
+
+
+def generate_with_metrics(model: str, prompt: str, options: Dict = None,
+                          client=None, **kwargs) -> Tuple[str, Dict]:
+    """Call the generate endpoint in streaming mode and return (text, metrics)"""
+    client = client or ollama
+    return _observed(
+        model, "generate",
+        lambda: client.generate(model=model, prompt=prompt, options=options, stream=True, **kwargs),
+        lambda chunk: chunk["response"]
+    )
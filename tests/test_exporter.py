@@ -0,0 +1,42 @@
+import csv
+import io
+import json
+
+import exporter
+from exporter import EXPORT_COLUMNS, export_history, iter_chunks
+
+
+def rows(n):
+    return ({"workspace": "w", "model": "llama", "user": f"q{i}", "assistant": f"a{i}", "response_time": i / 10,
+             "prompt_eval_count": i} for i in range(n))
+
+
+def test_iter_chunks_is_lazy_and_bounded():
+    assert [len(chunk) for chunk in iter_chunks(rows(2500), 1000)] == [1000, 1000, 500]
+    assert list(iter_chunks(iter([]), 10)) == []
+
+    consumed = []
+    source = (consumed.append(row) or row for row in rows(10))
+    next(iter_chunks(source, 3))
+    assert len(consumed) == 3
+
+
+def test_csv_export(monkeypatch):
+    monkeypatch.setattr(exporter, "SPOOL_MAX_SIZE", 1024)  # spills to disk part way through
+    legacy = {"workspace": "w", "model": "old", "response_time": "N/A", "extra": "dropped"}
+    out = export_history(iter_chunks([legacy, *rows(300)], 100), "CSV")
+    data = out.read()
+    out.close()
+
+    parsed = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+    assert len(parsed) == 301
+    assert list(parsed[0]) == EXPORT_COLUMNS
+    assert parsed[0]["response_time"] == ""
+    assert parsed[-1]["user"] == "q299"
+
+
+def test_ndjson_export():
+    out = export_history(iter_chunks(rows(5), 2), "NDJSON")
+    lines = out.read().decode("utf-8").splitlines()
+    out.close()
+    assert [json.loads(line)["prompt_eval_count"] for line in lines] == [0, 1, 2, 3, 4]
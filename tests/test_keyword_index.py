@@ -0,0 +1,38 @@
+import os
+
+from keyword_index import KeywordIndex, fts_query, workspace_filename
+
+
+def test_fts_query_quotes_and_dedupes_terms():
+    assert fts_query('What does "E1042" mean? get_user_id') == '"what" OR "does" OR "e1042" OR "mean" OR "get_user_id"'
+    assert fts_query("Error error ERROR") == '"error"'
+    assert fts_query("?! -- ()") == ""
+
+
+def test_fts_query_limits_terms():
+    assert fts_query(" ".join(f"t{i}" for i in range(100))).count(" OR ") == 31
+
+
+def test_workspace_filenames_are_distinct():
+    assert workspace_filename("My Notes") != workspace_filename("My-Notes")
+    assert workspace_filename("../..").endswith(".db")
+    assert "/" not in workspace_filename("a/b")
+
+
+def test_search_is_scoped_to_a_workspace(tmp_path):
+    index = KeywordIndex(str(tmp_path))
+    index.add("a", [{"id": "1", "text": "call get_user_id before saving", "source": "x.py", "chunk": 0, "page": 0}])
+    index.add("b", [{"id": "2", "text": "get user id from the session", "source": "y.md", "chunk": 3, "page": 1}])
+
+    hits = index.search("a", "get_user_id", 5)
+    assert [hit["id"] for hit in hits] == ["1"]
+    assert index.search("a", "session", 5) == []
+    assert index.search("b", "session", 5)[0]["source"] == "y.md"
+
+    index.clear("a")
+    assert index.count("a") == 0
+    assert index.count("b") == 1
+
+    index.clear_all()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".db")]
+    assert index.count("b") == 0
@@ -0,0 +1,50 @@
+import packing
+from packing import estimate_tokens, merge_adjacent, pack_context
+
+
+def chunk(source, n, text, score):
+    return {"id": f"{source}-{n}", "source": source, "chunk": n, "page": 0, "text": text, "score": score}
+
+
+def test_adjacent_chunks_merge_without_repeating_overlap():
+    chunks = [
+        chunk("a.txt", 2, "the cache is keyed by file hash and version.", 0.5),
+        chunk("a.txt", 1, "Previews are cached. the cache is keyed by file hash", 0.9),
+        chunk("b.txt", 7, "Unrelated passage.", 0.7)
+    ]
+    passages = merge_adjacent(chunks)
+    assert [p["source"] for p in passages] == ["a.txt", "b.txt"]
+    assert passages[0]["chunks"] == [1, 2]
+    assert passages[0]["score"] == 0.9
+    assert passages[0]["text"] == "Previews are cached. the cache is keyed by file hash and version."
+
+
+def test_near_duplicates_are_dropped():
+    text = "The retry limit is five attempts with exponential backoff between them."
+    packed = pack_context([chunk("a.txt", 0, text, 0.9), chunk("b.txt", 0, text + " Really.", 0.8)], 1000)
+    assert packed["duplicates"] == 1
+    assert [p["source"] for p in packed["passages"]] == ["a.txt"]
+
+
+def test_context_stays_within_budget():
+    chunks = [chunk(f"doc{i}.txt", 0, f"Passage {i} " + "word " * 200, 1.0 - i / 10) for i in range(6)]
+    for budget in (60, 200, 500):
+        packed = pack_context(chunks, budget)
+        assert packed["tokens"] <= budget
+        assert packed["tokens"] == estimate_tokens(packed["content"])
+        assert len(packed["passages"]) + packed["dropped"] == 6
+
+
+def test_last_passage_is_truncated_to_fill_the_budget():
+    chunks = [chunk("a.txt", 0, "First sentence here. " * 40, 0.9), chunk("b.txt", 5, "Second one. " * 80, 0.5)]
+    packed = pack_context(chunks, 400)
+    assert packed["truncated"]
+    assert packed["passages"][-1]["text"].endswith(" …")
+    assert "[2] b.txt (chunk 5)" in packed["content"]
+
+
+def test_nothing_fits():
+    packed = pack_context([chunk("a.txt", 0, "word " * 400, 1.0)], estimate_tokens(packing.CONTEXT_HEADER) + 10)
+    assert packed["content"] == ""
+    assert packed["tokens"] == 0
+    assert packed["dropped"] == 1
@@ -0,0 +1,59 @@
+import gc
+import os
+import threading
+
+import pytest
+
+import preview
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(preview, "_cache", preview.OrderedDict())
+    monkeypatch.setattr(preview, "PREVIEW_CACHE_SIZE", 2)
+
+
+def test_pages_and_statistics():
+    text = "".join(f"line {i} of the log\n" for i in range(2000)) + "last line"
+    document = preview.open_preview("app.log", text.encode())
+    assert document.page_count > 1
+    assert "".join(document.page(i) for i in range(document.page_count)) == text
+    assert document.stats["lines"] == 2001
+    assert document.stats["words"] == len(text.split())
+    assert document.page(document.page_count) == ""
+    assert preview.open_preview("copy.log", text.encode()) is document
+
+
+def test_evicted_preview_stays_readable_while_held():
+    held = preview.open_preview("a.txt", b"first file")
+    for i in range(3):
+        preview.open_preview(f"{i}.txt", f"other file {i}".encode())
+    assert "a.txt" not in {p.name for p in preview._cache.values()}
+    assert held.page(0) == "first file"
+
+    path = held.path
+    del held
+    gc.collect()
+    assert not os.path.exists(path)
+    # Opening it again extracts a fresh copy
+    assert preview.open_preview("a.txt", b"first file").page(0) == "first file"
+
+
+def test_concurrent_opens_extract_once(monkeypatch):
+    extractions = []
+    original = preview.DocumentPreview.__init__
+
+    def counting_init(self, *args, **kwargs):
+        extractions.append(args[0])
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(preview.DocumentPreview, "__init__", counting_init)
+    data = b"shared upload\n" * 50000
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(preview.open_preview("s.txt", data))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(extractions) == 1
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,81 @@
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+import rag
+
+
+class HashingModel:
+    """Bag-of-words stand-in for the sentence-transformers model"""
+
+    calls = 0
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        HashingModel.calls += len(texts)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag.Embedder, "model", lambda self: HashingModel())
+    return rag.DocumentIndex(path=str(tmp_path), backend="flat")
+
+
+DOC = "\n\n".join(f"Section {i}. The service returns error E{1000 + i} when get_user_{i} times out."
+                  for i in range(40)).encode()
+
+
+def test_normalize_query():
+    assert rag.normalize_query("  What  is\tE1042? ") == "What is E1042?"
+    assert rag.normalize_query("What is E1042?", lowercase=True) == "what is e1042?"
+
+
+def test_results_are_cached_until_the_workspace_changes(index):
+    index.ingest("w", "errors.txt", DOC)
+    version = index.version("w")
+
+    first = index.retrieve("w", "what does E1007 mean", k=3)
+    assert not first["cached"]
+    assert "E1007" in first["chunks"][0]["text"]
+
+    again = index.retrieve("w", "what  does E1007 mean", k=3)
+    assert again["cached"]
+    assert again["chunks"] == first["chunks"]
+    assert not index.retrieve("w", "what does E1007 mean", k=2)["cached"]
+
+    # Another workspace keeps its own version and cache
+    index.ingest("other", "errors.txt", DOC)
+    assert index.version("w") == version
+    assert index.retrieve("w", "what does E1007 mean", k=3)["cached"]
+
+    index.remove("w", "errors.txt")
+    assert index.version("w") > version
+    after = index.retrieve("w", "what does E1007 mean", k=3)
+    assert not after["cached"]
+    assert after["chunks"] == []
+
+
+def test_query_embeddings_are_reused(index):
+    index.ingest("w", "errors.txt", DOC)
+    calls = HashingModel.calls
+    index.retrieve("w", "timeout of get_user_3", mode="vector")
+    index.retrieve("w", "timeout  of get_user_3", mode="vector", k=2)
+    assert HashingModel.calls == calls + 1
+
+
+def test_clear_all(index):
+    index.ingest("a", "errors.txt", DOC)
+    index.ingest("b", "errors.txt", DOC)
+    index.retrieve("a", "E1007", k=3)
+    index.clear_all()
+    assert index.documents("a") == {} and index.documents("b") == {}
+    assert index.embedder.cache.count() == 0
+    result = index.retrieve("a", "E1007", k=3)
+    assert not result["cached"]
+    assert result["chunks"] == []
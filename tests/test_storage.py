@@ -0,0 +1,76 @@
+import pytest
+
+from storage import ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"))
+    yield store
+    store.close()
+
+
+def record(model, response_time, assistant="ok"):
+    return {"timestamp": "2024-01-31 13:45:00", "model": model, "user": "hi", "assistant": assistant,
+            "response_time": response_time, "ttft": response_time / 4, "eval_count": 20, "eval_duration": 1.0}
+
+
+def test_search_ranks_messages_and_favorites(store):
+    for workspace in ("work", "home"):
+        store.create_workspace(workspace)
+    work = store.start_conversation("work")
+    home = store.start_conversation("home")
+    store.add_message(work, "user", "The deploy failed with error E1042")
+    store.add_message(work, "assistant", "E1042 means the token expired")
+    store.add_message(home, "user", "Recipe for bread")
+    store.add_favorite("home", {"role": "assistant", "content": "Another E1042 note"})
+
+    # Reads only see flushed rows
+    assert store.search("E1042") == []
+    store.flush()
+
+    hits = store.search("E1042")
+    assert {hit["source"] for hit in hits} == {"message", "favorite"}
+    assert len(hits) == 3
+    assert "**E1042**" in hits[0]["snippet"]
+    assert {hit["workspace"] for hit in store.search("E1042", workspace="work")} == {"work"}
+    assert store.search("   ") == []
+    assert store.search("E1042", limit=1)[0]["score"] == hits[0]["score"]
+
+
+def test_replace_message_counts_from_the_end(store):
+    store.create_workspace("w")
+    conversation = store.start_conversation("w")
+    store.add_message(conversation, "user", "question")
+    store.add_message(conversation, "assistant", "first answer")
+    store.replace_message(conversation, 0, "second answer")
+    store.add_message(conversation, "user", "follow-up")
+    store.flush()
+    assert [m["content"] for m in store.recent_messages(conversation)] == ["question", "second answer", "follow-up"]
+
+
+def test_history_stats_come_from_rollups(store):
+    store.create_workspace("w")
+    for i in range(1, 101):
+        store.add_history("w", None, record("llama" if i % 4 else "gemma", i / 10, assistant="x" * i))
+    store.flush()
+
+    stats = store.history_stats("w")
+    assert stats.count == 100
+    assert stats.total_length == sum(range(1, 101))
+    assert stats.models["llama"].count == 75
+    assert stats.models["gemma"].tokens_per_sec == 20.0
+    # Histogram percentiles are bucket upper bounds, at most 15% above the exact value
+    p50 = stats.models["llama"].latency(50)
+    assert 5.0 <= p50 <= 5.0 * 1.15
+
+    store.clear_workspace("w")
+    assert store.history_stats("w").count == 0
+
+
+def test_clear_all_deletes_benchmark_results(store):
+    store.save_benchmark_results([{"run_id": "r1", "suite_version": "1", "started": "2024-01-31 13:45:00",
+                                   "model": "llama", "case_name": "short"}])
+    assert len(store.benchmark_results("1")) == 1
+    store.clear_all()
+    assert store.benchmark_results("1") == []
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import FlatIndex
+
+
+def unit_vectors(rng, rows, dim):
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill(index, vectors, prefix="c"):
+    ids = [f"{prefix}{i}" for i in range(len(vectors))]
+    metadatas = [{"source": "doc.txt", "chunk": n} for n in range(len(ids))]
+    index.add(ids, [f"text {i}" for i in ids], vectors.tolist(), metadatas)
+    return ids
+
+
+@pytest.mark.parametrize("dtype, min_recall", [("int8", 0.95), ("float16", 0.99), ("float32", 1.0)])
+def test_recall_against_exact_search(tmp_path, dtype, min_recall):
+    rng = np.random.default_rng(7)
+    vectors = unit_vectors(rng, 5000, 64)
+    queries = unit_vectors(rng, 50, 64)
+    index = FlatIndex(str(tmp_path / dtype), dtype=dtype)
+    fill(index, vectors)
+
+    k = 10
+    found = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:k].tolist())
+        found += len(exact & {row for row, _ in index.search(query.tolist(), k)})
+    assert found / (k * len(queries)) >= min_recall
+
+
+def test_search_spans_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "SEARCH_BLOCK", 64)
+    rng = np.random.default_rng(3)
+    vectors = unit_vectors(rng, 300, 16)
+    index = FlatIndex(str(tmp_path / "index"), dtype="float32")
+    fill(index, vectors)
+
+    hits = index.search(vectors[250].tolist(), 5)
+    assert hits[0][0] == 250
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_delete_compact_reopen(tmp_path):
+    rng = np.random.default_rng(11)
+    vectors = unit_vectors(rng, 200, 32)
+    path = str(tmp_path / "index")
+    index = FlatIndex(path)
+    ids = fill(index, vectors)
+
+    index.delete(ids=ids[:150:2])
+    index.delete(where={"source": "missing.txt"})
+    live = [i for n, i in enumerate(ids) if not (n < 150 and n % 2 == 0)]
+    assert index.count() == len(live)
+    deleted = index.query([vectors[0].tolist()], n_results=5)
+    assert "c0" not in deleted["ids"][0]
+
+    # Deleted rows are remembered across a reopen
+    index = FlatIndex(path)
+    assert index.rows == 200
+    assert index.query([vectors[0].tolist()], n_results=5)["ids"][0] == deleted["ids"][0]
+
+    index.compact()
+    assert index.rows == len(live)
+    assert index.get()["ids"] == live
+
+    index = FlatIndex(path)
+    assert index.rows == len(live)
+    for n in (1, 151, 199):
+        assert index.query([vectors[n].tolist()], n_results=1)["ids"][0] == [f"c{n}"]
+    assert index.get()["metadatas"][0] == {"source": "doc.txt", "chunk": 1}
+
+
+def test_add_replaces_existing_ids(tmp_path):
+    rng = np.random.default_rng(5)
+    vectors = unit_vectors(rng, 10, 8)
+    index = FlatIndex(str(tmp_path / "index"))
+    fill(index, vectors)
+    fill(index, vectors[:3])
+    assert index.count() == 10
+    assert index.rows == 13
+
+    with pytest.raises(ValueError):
+        index.add(["x"], ["x"], [[1.0, 0.0]], [{"source": "x"}])
+
+
+def test_drop_removes_files(tmp_path):
+    path = tmp_path / "index"
+    index = FlatIndex(str(path))
+    fill(index, unit_vectors(np.random.default_rng(1), 4, 8))
+    index.drop()
+    assert not path.exists()
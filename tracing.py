@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+TRACE_BUFFER = 200  # finished traces kept in memory for the in-app viewer
+# Append every finished trace as JSON lines here when set (TRACE_FILE="" disables)
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_lock = threading.Lock()
+_traces = deque(maxlen=TRACE_BUFFER)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """One timed operation; the root span of a trace collects all spans"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else _new_id()
+        self.root = parent.root if parent else self
+        self.depth = parent.depth + 1 if parent else 0
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.attributes = dict(attributes)
+        self.spans: List["Span"] = [] if parent is None else None
+        self.root.spans.append(self)
+
+    def set(self, **attributes):
+        """Add attributes, e.g. token counts known only after the call"""
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException, status: str = "error"):
+        self.status = status
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "depth": self.depth,
+            "start": self.start,
+            "offset": self.start - self.root.start,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span (or as a new trace)"""
+    parent = _current.get()
+    current = Span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.fail(e)
+        raise
+    except BaseException as e:
+        # st.rerun() / st.stop() and KeyboardInterrupt
+        current.fail(e, status="cancelled")
+        raise
+    finally:
+        current.end()
+        _current.reset(token)
+        if parent is None:
+            _finish(current)
+
+
+def start_trace(name: str, **attributes) -> Span:
+    """Open a root span that stays current until `finish_trace` (e.g. a whole rerun)"""
+    root = Span(name, None, **attributes)
+    _current.set(root)
+    return root
+
+
+def finish_trace(root: Span, status: str = None, keep_empty: bool = False):
+    """Close a root span opened by `start_trace` and record the trace.
+
+    An interrupted root (closed late, e.g. by the next rerun) ends with its last child.
+    """
+    if root.duration is not None:
+        return
+    if status == "interrupted":
+        root.duration = max(
+            (s.start - root.start + (s.duration or 0) for s in root.spans if s is not root),
+            default=0.0
+        )
+    root.end()
+    if status:
+        root.status = status
+    if _current.get() is root:
+        _current.set(None)
+    if keep_empty or len(root.spans) > 1:
+        _finish(root)
+
+
+def _finish(root: Span):
+    trace = {
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "start": root.start,
+        "duration": root.duration,
+        "status": "error" if any(s.status == "error" for s in root.spans) else root.status,
+        "attributes": root.attributes,
+        "spans": [s.to_dict() for s in root.spans]
+    }
+    with _lock:
+        _traces.append(trace)
+    if TRACE_FILE:
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(to_jsonl([trace]))
+        except OSError as e:
+            print(f"Trace export failed: {e}")
+
+
+def recent_traces(**attributes) -> List[Dict]:
+    """Finished traces, newest first, optionally matching root attributes"""
+    with _lock:
+        traces = list(_traces)
+    matching = [t for t in traces if all(t["attributes"].get(k) == v for k, v in attributes.items())]
+    return matching[::-1]
+
+
+def to_jsonl(traces: List[Dict]) -> str:
+    """One JSON object per span, in OpenTelemetry-like flat form"""
+    lines = []
+    for trace in traces:
+        for s in trace["spans"]:
+            lines.append(json.dumps(dict(s, trace_name=trace["name"]), ensure_ascii=False, default=str))
+    return "\n".join(lines) + "\n" if lines else ""
+
@@ -0,0 +1,122 @@
+"""Recall, size and speed of the flat vector index per storage dtype.
+
+Builds vector_index.FlatIndex over synthetic clustered unit vectors as
+float32 (exact reference), float16 and int8, then reports open time, vector
+bytes, query latency and recall@k against float32. Exits 1 when a quantized
+index falls below --min-recall, so it doubles as a self-check:
+
+    python vector_bench.py
+    python vector_bench.py --chunks 1000000 --dtypes float16 int8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from history import percentile
+from vector_index import FlatIndex
+
+ADD_BATCH = 10000
+
+
+def sample_vectors(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Unit vectors around random centroids, closer to real embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, ADD_BATCH):
+        n = min(ADD_BATCH, count - start)
+        batch = centroids[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+        vectors[start:start + n] = batch / np.linalg.norm(batch, axis=1, keepdims=True)
+    return vectors
+
+
+def build(path: str, dtype: str, vectors: np.ndarray) -> float:
+    start = time.perf_counter()
+    index = FlatIndex(path, dtype=dtype)
+    for offset in range(0, len(vectors), ADD_BATCH):
+        batch = vectors[offset:offset + ADD_BATCH]
+        ids = [str(offset + i) for i in range(len(batch))]
+        index.add(ids=ids, documents=[""] * len(batch), embeddings=batch, metadatas=[{}] * len(batch))
+    index.conn.close()
+    return time.perf_counter() - start
+
+
+def run(args) -> List[Dict]:
+    vectors = sample_vectors(args.chunks, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    root = tempfile.mkdtemp(prefix="vector-bench-")
+    reports = []
+    reference = None
+    try:
+        for dtype in ["float32"] + [d for d in args.dtypes if d != "float32"]:
+            path = os.path.join(root, dtype)
+            build_seconds = build(path, dtype, vectors)
+
+            start = time.perf_counter()
+            index = FlatIndex(path)
+            open_seconds = time.perf_counter() - start
+
+            latencies = []
+            results = []
+            for query in queries:
+                start = time.perf_counter()
+                results.append({row for row, _ in index.search(query, args.k)})
+                latencies.append(time.perf_counter() - start)
+            if reference is None:
+                reference = results
+            recall = sum(len(r & ref) for r, ref in zip(results, reference)) / (args.k * len(queries))
+            reports.append({
+                "dtype": dtype,
+                "build_sec": build_seconds,
+                "open_ms": open_seconds * 1000,
+                "vector_mb": index.nbytes() / 1024 / 1024,
+                "query_p50_ms": percentile(sorted(latencies), 50) * 1000,
+                "query_p95_ms": percentile(sorted(latencies), 95) * 1000,
+                "recall": recall
+            })
+            index.conn.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flat vector index per dtype")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--dtypes", nargs="+", default=["float16", "int8"], choices=["float32", "float16", "int8"])
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Fail below this recall@k vs float32")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    reports = run(args)
+    float32_mb = reports[0]["vector_mb"]
+    print(f"{args.chunks} vectors x {args.dim} dims, {args.queries} queries, recall@{args.k} vs float32")
+    print(f"{'dtype':8} {'build s':>8} {'open ms':>8} {'vector MB':>10} {'of f32':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'recall':>7}")
+    failed = False
+    for r in reports:
+        print(f"{r['dtype']:8} {r['build_sec']:>8.1f} {r['open_ms']:>8.1f} {r['vector_mb']:>10.1f} "
+              f"{r['vector_mb'] / float32_mb:>7.0%} {r['query_p50_ms']:>8.1f} {r['query_p95_ms']:>8.1f} "
+              f"{r['recall']:>7.3f}")
+        failed = failed or r["recall"] < args.min_recall
+    if failed:
+        print(f"❌ Recall below {args.min_recall}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Memory-mapped flat vector index with quantized storage.
+
+Built-in fallback for deployments without chromadb. Vectors are appended to
+a file as int8 with a float32 scale per row (or as float16 / float32) and
+searched with a blocked NumPy matrix-vector product over a read-only
+memmap, so opening an index reads nothing but the list of deleted rows.
+Chunk ids, text and metadata live in SQLite next to it. The class mirrors
+the subset of the Chroma collection API that rag.DocumentIndex uses.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# int8 is the smallest and, with a cheap float32 upcast, the fastest to search; NumPy converts
+# float16 in software, which makes it several times slower than float32 despite half the size
+FLAT_DTYPE = os.environ.get("RAG_FLAT_DTYPE", "int8")
+DTYPES = ("float32", "float16", "int8")
+SEARCH_BLOCK = 4096      # rows scored per step; the float32 working copy stays in cache
+COMPACT_MIN_DEAD = 1024  # deleted rows before compaction is considered
+COMPACT_RATIO = 0.5      # compact when this share of rows is deleted
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    row INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead_rows (
+    row INTEGER PRIMARY KEY
+);
+"""
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Stored form of float32 rows, plus per-row scales for int8"""
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+class FlatIndex:
+    """Append-only quantized vector matrix in a memory-mapped file"""
+
+    def __init__(self, path: str, dtype: str = FLAT_DTYPE):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._config_path = os.path.join(path, "index.json")
+        self._vector_path = os.path.join(path, "vectors.bin")
+        self._scale_path = os.path.join(path, "scales.bin")
+        try:
+            with open(self._config_path, encoding="utf-8") as f:
+                config = json.load(f)
+            self.dim, self.dtype = config["dim"], config["dtype"]
+        except FileNotFoundError:
+            # The dimension is fixed by the first add
+            self.dim, self.dtype = None, dtype
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {self.dtype}")
+
+        self.conn = sqlite3.connect(os.path.join(path, "chunks.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._vectors = None
+        self._scales = None
+        self._load()
+
+    # ---------- storage ----------
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _load(self):
+        """Row count and deleted-row mask; vectors are mapped lazily"""
+        stored = self.conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(row) FROM chunks), -1), COALESCE((SELECT MAX(row) FROM dead_rows), -1)) + 1"
+        ).fetchone()[0]
+        rows = os.path.getsize(self._vector_path) // self.row_bytes if self.dim and os.path.exists(self._vector_path) else 0
+        if rows > stored:
+            # Vectors written by an add whose metadata was never committed
+            self._truncate(stored)
+            rows = stored
+        self.rows = rows
+        self._dead = np.zeros(rows, dtype=bool)
+        dead = [row for (row,) in self.conn.execute("SELECT row FROM dead_rows WHERE row < ?", (rows,))]
+        self._dead[dead] = True
+        self._vectors = self._scales = None
+
+    def _truncate(self, rows: int):
+        with open(self._vector_path, "r+b") as f:
+            f.truncate(rows * self.row_bytes)
+        if self.dtype == "int8" and os.path.exists(self._scale_path):
+            with open(self._scale_path, "r+b") as f:
+                f.truncate(rows * 4)
+
+    def _mapped(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        if self._vectors is None and self.rows:
+            self._vectors = np.memmap(self._vector_path, dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._scale_path, dtype=np.float32, mode="r", shape=(self.rows,))
+        return self._vectors, self._scales
+
+    def nbytes(self) -> int:
+        """Bytes of vector data on disk (and mapped when searched)"""
+        return self.rows * (self.row_bytes + (4 if self.dtype == "int8" else 0)) if self.dim else 0
+
+    # ---------- Chroma-like collection API ----------
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._config_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype}, f)
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+            self.delete(ids=[i for i in ids if self._row(i) is not None])
+
+            stored, scales = quantize(vectors, self.dtype)
+            start = self.rows
+            try:
+                self.conn.executemany(
+                    "INSERT INTO chunks (row, chunk_id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + n, chunk_id, document, json.dumps(metadata, ensure_ascii=False))
+                     for n, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+                )
+                # Vectors first, metadata commit second: a crash in between leaves rows that _load() trims
+                with open(self._vector_path, "ab") as f:
+                    f.write(stored.tobytes())
+                if scales is not None:
+                    with open(self._scale_path, "ab") as f:
+                        f.write(scales.tobytes())
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                if os.path.exists(self._vector_path):
+                    self._truncate(start)
+                raise
+            self.rows = start + len(vectors)
+            self._dead = np.concatenate([self._dead, np.zeros(len(vectors), dtype=bool)])
+            self._vectors = self._scales = None
+
+    def _row(self, chunk_id: str) -> Optional[int]:
+        row = self.conn.execute("SELECT row FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, ids: List[str], metadatas: List[Dict]):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                [(json.dumps(metadata, ensure_ascii=False), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            self.conn.commit()
+
+    def delete(self, ids: List[str] = None, where: Dict = None):
+        """Delete by ids or by metadata equality ({"source": name})"""
+        with self._lock:
+            if ids is not None:
+                rows = [self._row(chunk_id) for chunk_id in ids]
+                rows = [row for row in rows if row is not None]
+            else:
+                (key, value), = where.items()
+                rows = [row for (row,) in self.conn.execute(
+                    "SELECT row FROM chunks WHERE json_extract(metadata, ?) = ?", (f"$.{key}", value)
+                )]
+            if not rows:
+                return
+            self.conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self.conn.executemany("INSERT OR IGNORE INTO dead_rows (row) VALUES (?)", [(row,) for row in rows])
+            self.conn.commit()
+            self._dead[rows] = True
+            dead = int(self._dead.sum())
+            if dead >= COMPACT_MIN_DEAD and dead >= self.rows * COMPACT_RATIO:
+                self.compact()
+
+    def get(self, include: List[str] = None) -> Dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT chunk_id, document, metadata FROM chunks ORDER BY row").fetchall()
+        return {
+            "ids": [chunk_id for chunk_id, _, _ in rows],
+            "documents": [document for _, document, _ in rows],
+            "metadatas": [json.loads(metadata) for _, _, metadata in rows]
+        }
+
+    def search(self, query: List[float], k: int) -> List[Tuple[int, float]]:
+        """(row, cosine similarity) of the top-k live rows; vectors are unit length"""
+        q = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            vectors, scales = self._mapped()
+            dead = self._dead
+            if vectors is None or k <= 0:
+                return []
+            candidates = []
+            for start in range(0, self.rows, SEARCH_BLOCK):
+                scores = vectors[start:start + SEARCH_BLOCK].astype(np.float32) @ q
+                if scales is not None:
+                    scores *= scales[start:start + SEARCH_BLOCK]
+                scores[dead[start:start + SEARCH_BLOCK]] = -np.inf
+                if len(scores) > k:
+                    top = np.argpartition(-scores, k)[:k]
+                else:
+                    top = np.arange(len(scores))
+                candidates.extend((start + int(i), float(scores[i])) for i in top if scores[i] > -np.inf)
+        return sorted(candidates, key=lambda item: item[1], reverse=True)[:k]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int, include: List[str] = None) -> Dict:
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            # One lock for search and lookup: a compact() in between would renumber the rows
+            with self._lock:
+                hits = self.search(embedding, n_results)
+                found = {
+                    row: (chunk_id, document, metadata)
+                    for row, chunk_id, document, metadata in self.conn.execute(
+                        f"SELECT row, chunk_id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(hits))})",
+                        [row for row, _ in hits]
+                    )
+                } if hits else {}
+            hits = [(row, score) for row, score in hits if row in found]
+            result["ids"].append([found[row][0] for row, _ in hits])
+            result["documents"].append([found[row][1] for row, _ in hits])
+            result["metadatas"].append([json.loads(found[row][2]) for row, _ in hits])
+            result["distances"].append([1.0 - score for _, score in hits])
+        return result
+
+    # ---------- maintenance ----------
+
+    def compact(self):
+        """Rewrite the vector file without deleted rows and renumber the rest"""
+        with self._lock:
+            vectors, scales = self._mapped()
+            live = np.flatnonzero(~self._dead)
+            with open(self._vector_path + ".tmp", "wb") as f:
+                for start in range(0, len(live), SEARCH_BLOCK):
+                    f.write(np.ascontiguousarray(vectors[live[start:start + SEARCH_BLOCK]]).tobytes())
+            if scales is not None:
+                with open(self._scale_path + ".tmp", "wb") as f:
+                    f.write(np.ascontiguousarray(scales[live]).tobytes())
+            # New row numbers never exceed old ones, so ascending updates cannot collide
+            self.conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new, int(old)) for new, old in enumerate(live) if new != old]
+            )
+            self.conn.execute("DELETE FROM dead_rows")
+            self._vectors = self._scales = None
+            os.replace(self._vector_path + ".tmp", self._vector_path)
+            if scales is not None:
+                os.replace(self._scale_path + ".tmp", self._scale_path)
+            self.conn.commit()
+            self._load()
+
+    def drop(self):
+        """Delete the index from disk"""
+        with self._lock:
+            self._vectors = self._scales = None
+            self.conn.close()
+            shutil.rmtree(self.path, ignore_errors=True)